@@ -0,0 +1,233 @@
+"""
+Content-addressed, deduplicating blob store
+
+Blobs are stored once, keyed by their SHA-256 digest, under
+`<root>/objects/<first 2 hex chars>/<remaining hex chars>`.
+Extracted files are placed into output directories as reflinks
+(copy-on-write clones) or hardlinks to the stored object, falling
+back to a plain copy if neither is supported.
+
+Note: Hardlinked files share their data with the store, objects are
+therefore made read-only. Do not modify extracted files in place.
+"""
+
+import io
+import os
+import sys
+import json
+import stat
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from durango.common.fastcopy import copy_range
+
+log = logging.getLogger('common.blobstore')
+
+OBJECTS_DIRNAME = 'objects'
+TMP_DIRNAME = 'tmp'
+MANIFEST_FILENAME = 'manifest.json'
+
+# Linux ioctl: FICLONE = _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+HASH_CHUNK_SIZE = 0x400000
+
+LINK_REFLINK = 'reflink'
+LINK_HARDLINK = 'hardlink'
+LINK_COPY = 'copy'
+
+
+def _reflink(src_path, dest_path):
+    if not sys.platform.startswith('linux'):
+        raise OSError('Reflinks not supported on this platform')
+    import fcntl
+    with io.open(src_path, 'rb') as src, io.open(dest_path, 'wb') as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dest.close()
+            os.unlink(dest_path)
+            raise
+
+
+class ContentStore(object):
+    def __init__(self, root):
+        """
+        Open (or create) blob store
+
+        Args:
+            root (str): Store directory
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, OBJECTS_DIRNAME)
+        self.tmp_dir = os.path.join(root, TMP_DIRNAME)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    @staticmethod
+    def hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_file(filepath):
+        sha = hashlib.sha256()
+        with io.open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def has(self, digest):
+        return os.path.isfile(self.object_path(digest))
+
+    def _commit_tmpfile(self, tmp_path, digest):
+        """
+        Move a fully written temporary file into place
+        """
+        dest_path = self.object_path(digest)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        # Atomic, concurrent writers of the same blob end up with same content
+        os.replace(tmp_path, dest_path)
+
+    def _write_object(self, digest, write_func):
+        """
+        Create object via write_func(file) unless it exists already
+
+        Returns:
+            bool: True if object was newly created
+        """
+        if self.has(digest):
+            return False
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with io.open(fd, 'wb') as f:
+                write_func(f)
+            self._commit_tmpfile(tmp_path, digest)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return True
+
+    def put_bytes(self, data):
+        """
+        Store buffer
+
+        Args:
+            data (bytes/memoryview): Blob content
+
+        Returns:
+            str: SHA-256 hexdigest of blob
+        """
+        digest = self.hash(data)
+        self._write_object(digest, lambda f: f.write(data))
+        return digest
+
+    def put_file(self, filepath):
+        """
+        Store content of existing file
+
+        Returns:
+            str: SHA-256 hexdigest of blob
+        """
+        digest = self.hash_file(filepath)
+        if not self.has(digest):
+            with io.open(filepath, 'rb') as src:
+                self._write_object(digest, lambda f: shutil.copyfileobj(src, f, HASH_CHUNK_SIZE))
+        return digest
+
+    def put_range(self, src_fd, offset, length, digest):
+        """
+        Store byte range of a file descriptor, data is copied kernel-side
+
+        Args:
+            src_fd (int): Source file descriptor
+            offset (int): Source offset
+            length (int): Length of blob
+            digest (str): SHA-256 hexdigest of the range, computed by caller
+
+        Returns:
+            str: SHA-256 hexdigest of blob
+        """
+        def write_range(f):
+            f.flush()
+            if copy_range(src_fd, f.fileno(), offset, length) != length:
+                raise Exception('Short copy for blob %s' % digest)
+        self._write_object(digest, write_range)
+        return digest
+
+    def link_into(self, digest, dest_path):
+        """
+        Place stored blob at dest_path
+
+        Tries reflink, hardlink, copy - in that order.
+
+        Returns:
+            str: One of LINK_REFLINK, LINK_HARDLINK, LINK_COPY
+        """
+        src_path = self.object_path(digest)
+        if not os.path.isfile(src_path):
+            raise FileNotFoundError('Blob %s not in store' % digest)
+        if os.path.lexists(dest_path):
+            os.unlink(dest_path)
+        try:
+            _reflink(src_path, dest_path)
+            os.chmod(dest_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+            return LINK_REFLINK
+        except OSError:
+            pass
+        try:
+            os.link(src_path, dest_path)
+            return LINK_HARDLINK
+        except OSError:
+            pass
+        shutil.copyfile(src_path, dest_path)
+        return LINK_COPY
+
+    def store_bytes(self, data, dest_path):
+        """
+        Store buffer and place it at dest_path
+
+        Returns:
+            str: SHA-256 hexdigest of blob
+        """
+        digest = self.put_bytes(data)
+        self.link_into(digest, dest_path)
+        return digest
+
+
+class ExtractionManifest(object):
+    def __init__(self, source):
+        """
+        Manifest of a single extraction run
+
+        Args:
+            source (str): Extracted file (e.g. nand dump or xvd)
+        """
+        self.source = source
+        self.files = list()
+
+    def add(self, name, digest, size):
+        self.files.append({'name': name, 'sha256': digest, 'size': size})
+
+    def to_dict(self):
+        return {'source': self.source, 'files': self.files}
+
+    def save(self, dirname, filename=MANIFEST_FILENAME):
+        path = os.path.join(dirname, filename)
+        with io.open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with io.open(path, 'r') as f:
+            data = json.load(f)
+        manifest = cls(data['source'])
+        manifest.files = data['files']
+        return manifest
@@ -0,0 +1,119 @@
+"""
+Kernel-side file copying
+
+Copies byte ranges between file descriptors without passing the data
+through a userspace buffer, using `os.copy_file_range` (Linux, Python 3.8+)
+or `os.sendfile`. Falls back to a chunked pread/write loop.
+"""
+
+import os
+import errno
+import logging
+
+log = logging.getLogger('common.fastcopy')
+
+# Upper bound per syscall, keeps progress granular
+COPY_CHUNK_SIZE = 0x40000000
+FALLBACK_CHUNK_SIZE = 0x100000
+
+# Errors meaning a method is unsupported for the fd combination (cross-fs,
+# filesystem / kernel lacks support), anything else is a real I/O error
+UNSUPPORTED_ERRNOS = set(getattr(errno, name) for name in (
+    'EXDEV', 'EINVAL', 'ENOSYS', 'EOPNOTSUPP', 'ENOTSUP') if hasattr(errno, name))
+# sendfile additionally rejects unseekable destinations
+SENDFILE_UNSUPPORTED_ERRNOS = UNSUPPORTED_ERRNOS | set([errno.ESPIPE])
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count, dst_offset):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, dst_offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count, dst_offset):
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _pread_write(src_fd, dst_fd, offset, count, dst_offset):
+    data = os.pread(src_fd, min(count, FALLBACK_CHUNK_SIZE), offset)
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(dst_fd, data, dst_offset)
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.write(dst_fd, data)
+
+
+def _available_methods():
+    """
+    Returns:
+        list: (method, errnos to fall back to the next method on)
+    """
+    methods = list()
+    if hasattr(os, 'copy_file_range'):
+        methods.append((_copy_file_range, UNSUPPORTED_ERRNOS))
+    if hasattr(os, 'sendfile'):
+        methods.append((_sendfile, SENDFILE_UNSUPPORTED_ERRNOS))
+    if hasattr(os, 'pread'):
+        # Last resort, every error is final
+        methods.append((_pread_write, set()))
+    return methods
+
+
+def copy_range(src_fd, dst_fd, offset, count, dst_offset=0, progress_callback=None):
+    """
+    Copy count bytes from src_fd @ offset to dst_fd @ dst_offset
+
+    Args:
+        src_fd (int): Source file descriptor
+        dst_fd (int): Destination file descriptor
+        offset (int): Source offset
+        count (int): Bytes to copy
+        dst_offset (int): Destination offset
+        progress_callback (callable): Called with (copied_bytes, total_bytes)
+
+    Returns:
+        int: Count of bytes copied, less than count only if source ended early
+
+    Raises:
+        OSError: I/O error, or no copy method supports the fd combination
+    """
+    methods = _available_methods()
+    if not methods:
+        raise OSError(errno.ENOSYS, 'No copy method available')
+    copied = 0
+    while copied < count:
+        method, fallback_errnos = methods[0]
+        size = min(COPY_CHUNK_SIZE, count - copied)
+        try:
+            ret = method(src_fd, dst_fd, offset + copied, size, dst_offset + copied)
+        except OSError as e:
+            if e.errno not in fallback_errnos or len(methods) == 1:
+                raise
+            # Unsupported for this fd combination
+            log.debug('%s failed (%s), trying next copy method' % (method.__name__, e))
+            methods.pop(0)
+            continue
+        if ret == 0:
+            break
+        copied += ret
+        if progress_callback:
+            progress_callback(copied, count)
+    return copied
+
+
+def copy_file(src_path, dst_path, progress_callback=None):
+    """
+    Copy whole file via `copy_range`
+
+    Returns:
+        int: Count of bytes copied
+    """
+    src_fd = os.open(src_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(src_fd).st_size
+        dst_fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                         getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            return copy_range(src_fd, dst_fd, 0, size, progress_callback=progress_callback)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
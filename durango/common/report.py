@@ -0,0 +1,104 @@
+"""
+Streaming report writers
+
+Records are written one at a time as soon as they are available,
+nothing is held in memory:
+    - FORMAT_NDJSON: One JSON document per line
+    - FORMAT_MSGPACK: Concatenated MessagePack maps, needs the optional `msgpack` package
+"""
+
+import io
+import sys
+import json
+import logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+log = logging.getLogger('common.report')
+
+FORMAT_JSON = 'json'
+FORMAT_NDJSON = 'ndjson'
+FORMAT_MSGPACK = 'msgpack'
+# FORMAT_JSON is the classic, non-streaming report
+FORMATS = [FORMAT_JSON, FORMAT_NDJSON, FORMAT_MSGPACK]
+
+
+class ReportWriter(object):
+    binary = False
+
+    def __init__(self, stream, close_stream=False):
+        """
+        Args:
+            stream (file): Output stream, text or binary depending on format
+            close_stream (bool): Close stream along with the writer
+        """
+        self.stream = stream
+        self.close_stream = close_stream
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record):
+        self._write(record)
+        self.stream.flush()
+        self.count += 1
+
+    def _write(self, record):
+        raise NotImplementedError()
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class NdjsonReportWriter(ReportWriter):
+    def _write(self, record):
+        self.stream.write(json.dumps(record) + '\n')
+
+
+class MsgpackReportWriter(ReportWriter):
+    binary = True
+
+    def __init__(self, stream, close_stream=False):
+        if not msgpack:
+            raise Exception('MessagePack output requires the msgpack package')
+        super(MsgpackReportWriter, self).__init__(stream, close_stream)
+        self._packer = msgpack.Packer()
+
+    def _write(self, record):
+        self.stream.write(self._packer.pack(record))
+
+
+REPORT_WRITERS = {
+    FORMAT_NDJSON: NdjsonReportWriter,
+    FORMAT_MSGPACK: MsgpackReportWriter
+}
+
+
+def open_report(filepath, fmt):
+    """
+    Open streaming report writer for filepath, stdout if filepath is None
+
+    Returns:
+        ReportWriter: Use as context manager
+    """
+    writer_cls = REPORT_WRITERS.get(fmt)
+    if not writer_cls:
+        raise ValueError('Unknown streaming report format %s' % fmt)
+    if not filepath:
+        return writer_cls(sys.stdout.buffer if writer_cls.binary else sys.stdout)
+    f = io.open(filepath, 'wb' if writer_cls.binary else 'w')
+    try:
+        return writer_cls(f, close_stream=True)
+    except Exception:
+        f.close()
+        raise
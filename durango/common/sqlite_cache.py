@@ -0,0 +1,115 @@
+"""
+Path keyed SQLite caches
+
+Shared base of the persistent caches in the XDG cache directory
+(XVD header index, savegame snapshot). Entries are keyed by path and
+validated by the (size, mtime_ns, inode) of the cached file.
+
+Invalidation rules:
+    - (size, mtime_ns, inode) differ -> entry is stale, gets replaced by the subclass
+    - path is not part of a scan anymore -> entry is removed by `prune_rows`
+    - `version` differs from the database version -> table is dropped
+"""
+
+import os
+import sqlite3
+import logging
+
+log = logging.getLogger('common.sqlite_cache')
+
+CACHE_DIRNAME = 'durango-tools'
+
+
+def get_cache_dir():
+    cache_dir = os.environ.get('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, CACHE_DIRNAME)
+
+
+class SqliteCache(object):
+    # Set by subclasses
+    filename = None
+    table = None
+    schema = None
+    version = 1
+
+    def __init__(self, filepath=None):
+        """
+        Open (or create) cache database
+
+        Args:
+            filepath (str): Path to database, defaults to `default_path()`
+        """
+        if not filepath:
+            filepath = self.default_path()
+        dirname = os.path.dirname(filepath)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.filepath = filepath
+        self._db = sqlite3.connect(filepath)
+        self._check_version()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def default_path(cls):
+        return os.path.join(get_cache_dir(), cls.filename)
+
+    @staticmethod
+    def stat_key(filepath, stat_result=None):
+        if not stat_result:
+            stat_result = os.stat(filepath)
+        return stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino
+
+    def _check_version(self):
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.version:
+            if version:
+                log.info('%s version %i outdated, rebuilding' % (self.filepath, version))
+            self._db.execute('DROP TABLE IF EXISTS %s' % self.table)
+            self._db.execute('PRAGMA user_version = %i' % self.version)
+        self._db.execute(self.schema)
+        self._db.commit()
+
+    def prune_rows(self, filepaths, root=None, columns=()):
+        """
+        Remove entries that are not part of passed filelist
+
+        Args:
+            filepaths (list): Paths that are still present
+            root (str): Only consider entries below this directory
+            columns (tuple): Additional columns to return for removed entries
+
+        Returns:
+            list: (path, *columns) rows of removed entries
+        """
+        keep = set(os.path.abspath(f) for f in filepaths)
+        select = 'SELECT %s FROM %s' % (', '.join(('path',) + tuple(columns)), self.table)
+        if root:
+            prefix = os.path.join(os.path.abspath(root), '')
+            rows = self._db.execute(select + ' WHERE substr(path, 1, ?) = ?',
+                                    (len(prefix), prefix)).fetchall()
+        else:
+            rows = self._db.execute(select).fetchall()
+        stale = [row for row in rows if row[0] not in keep]
+        self._db.executemany('DELETE FROM %s WHERE path=?' % self.table,
+                             [(row[0],) for row in stale])
+        return stale
+
+    def clear(self):
+        self._db.execute('DELETE FROM %s' % self.table)
+        self._db.commit()
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        if self._db:
+            self._db.commit()
+            self._db.close()
+            self._db = None
@@ -1,6 +1,9 @@
+import struct
 import logging
+from uuid import UUID
+from datetime import datetime, timedelta
 
-from construct import this, Struct, Array
+from construct import this, Struct, Array, Container, ListContainer
 from construct import Int8ul, Int32ul, Int64ul, Bytes
 from durango.common.adapters import PascalStringUtf16, UUIDAdapter, FILETIMEAdapter
 from durango.common.enum import Enum
@@ -71,3 +74,85 @@ ContainerIndex = Struct(
     "id" / PascalStringUtf16(Int32ul, encoding="utf16"),
     "files" / Array(this.file_count, ContainerIdxEntry)
 )
+
+
+class ContainerIndexFast(object):
+    """
+    Hand-written parser for ContainerIndex
+
+    Walks a memoryview of the file with precompiled `struct.Struct` calls,
+    strings are decoded straight from the view - no intermediate streams.
+    Returns the same Containers as parsing `ContainerIndex`.
+    """
+    _header = struct.Struct('<II')
+    _length = struct.Struct('<I')
+    _index_tail = struct.Struct('<QI')
+    # blob_number .. unknown2
+    _entry_tail = struct.Struct('<BI16sQQII')
+    _entry_fields = ('filename', 'filename_alt', 'text', 'blob_number', 'save_type',
+                     'folder_guid', 'filetime', 'unknown', 'filesize', 'unknown2')
+
+    @staticmethod
+    def _decode_filetime(value):
+        return datetime(1601, 1, 1) + timedelta(microseconds=value / 10)
+
+    @classmethod
+    def _read_string(cls, view, offset):
+        length, = cls._length.unpack_from(view, offset)
+        offset += 4
+        end = offset + length * 2
+        if end > len(view):
+            raise struct.error('String at offset 0x%x exceeds buffer' % offset)
+        return str(view[offset:end], 'utf16'), end
+
+    @classmethod
+    def parse(cls, data):
+        """
+        Args:
+            data (bytes): Content of containers.index, any buffer object
+
+        Returns:
+            Container: Same fields as `ContainerIndex.parse`
+        """
+        try:
+            return cls._parse(memoryview(data))
+        except struct.error as e:
+            raise Exception('Could not read enough bytes for ContainerIndex: %s' % e)
+
+    @classmethod
+    def _parse(cls, view):
+        read_string = cls._read_string
+        unpack_tail = cls._entry_tail.unpack_from
+        tail_size = cls._entry_tail.size
+        decode_filetime = cls._decode_filetime
+        fields = cls._entry_fields
+
+        index_type, file_count = cls._header.unpack_from(view, 0)
+        name, offset = read_string(view, cls._header.size)
+        aum_id, offset = read_string(view, offset)
+        filetime, unknown = cls._index_tail.unpack_from(view, offset)
+        product_id, offset = read_string(view, offset + cls._index_tail.size)
+
+        files = ListContainer()
+        for _ in range(file_count):
+            filename, offset = read_string(view, offset)
+            filename_alt, offset = read_string(view, offset)
+            text, offset = read_string(view, offset)
+            (blob_number, save_type, folder_guid, entry_filetime, entry_unknown,
+             filesize, unknown2) = unpack_tail(view, offset)
+            offset += tail_size
+            files.append(Container(zip(fields, (
+                filename, filename_alt, text, blob_number, save_type,
+                UUID(bytes_le=folder_guid), decode_filetime(entry_filetime),
+                entry_unknown, filesize, unknown2))))
+
+        return Container([
+            ('type', index_type),
+            ('file_count', file_count),
+            ('name', name),
+            ('aum_id', aum_id),
+            ('filetime', decode_filetime(filetime)),
+            ('unknown', unknown),
+            ('id', product_id),
+            ('files', files)
+        ])
@@ -1,10 +1,13 @@
 import logging
 
-from construct import Struct, Bytes
+from construct import Struct, Bytes, String, Padding
 from construct import Int16ul, Int16sl, Int32ul, Int32sl, Int64ul, Int64sl
 from durango.common.adapters import UUIDAdapter
 
-log = logging.getLogger('fileformat.xvd')
+log = logging.getLogger('fileformat.xvc')
+
+# Default chunk size for region streaming
+XVC_REGION_CHUNK_SIZE = 0x100000
 
 
 class XvcRegionFlags(object):
@@ -17,8 +20,8 @@ class XvcRegionFlags(object):
 XVC_UPDATE_SEGMENT_SIZE = 0xC
 XvcUpdateSegmentInfo = Struct(
     "unknown1" / Int32ul,                   # 0x00
-    "unknown1" / Int32ul,                   # 0x04
-    "unknown1" / Int32ul,                   # 0x08
+    "unknown2" / Int32ul,                   # 0x04
+    "unknown3" / Int32ul,                   # 0x08
 )
 
 XVC_REGION_HEADER_SIZE = 0x80
@@ -61,3 +64,79 @@ XvcInfo = Struct(
     "unused_space" / Int64ul,           # 0xD48
     "reserved" / Padding(0x58)          # 0xD50
 )
+
+
+class XvcRegion(object):
+    def __init__(self, xvd, header):
+        """
+        Region of XVC data inside a XvdFile
+
+        Reads go through the XvdFile, so a memory-mapped XvdFile
+        hands out zero-copy memoryview slices.
+
+        Args:
+            xvd (XvdFile): File the region belongs to
+            header (Container): Parsed XvcRegionHeader
+        """
+        self._xvd = xvd
+        self.header = header
+
+    @property
+    def id(self):
+        return self.header.id
+
+    @property
+    def flags(self):
+        return self.header.flags
+
+    @property
+    def description(self):
+        return self.header.description.decode('utf-16-le', 'replace').rstrip('\x00')
+
+    @property
+    def offset(self):
+        return self.header.offset
+
+    @property
+    def length(self):
+        return self.header.length
+
+    def has_flag(self, flag):
+        return bool(self.flags & flag)
+
+    def read(self, offset=0, size=None):
+        """
+        Read from region, clamped to region boundaries
+
+        Args:
+            offset (int): Offset relative to region start
+            size (int): Bytes to read, None -> until region end
+
+        Returns:
+            memoryview: If XvdFile is mapped, bytes otherwise
+        """
+        if offset < 0 or offset > self.length:
+            raise ValueError('Offset 0x%x outside of region' % offset)
+        remaining = self.length - offset
+        if size is None or size > remaining:
+            size = remaining
+        return self._xvd.read(self.offset + offset, size)
+
+    def stream(self, chunk_size=XVC_REGION_CHUNK_SIZE, offset=0, size=None):
+        """
+        Read region in chunks
+
+        Yields:
+            memoryview/bytes: Chunk of at most chunk_size bytes
+        """
+        end = self.length if size is None else min(self.length, offset + size)
+        while offset < end:
+            chunk = self.read(offset, min(chunk_size, end - offset))
+            if not len(chunk):
+                raise Exception('Unexpected end of file in region %s' % self.description)
+            yield chunk
+            offset += len(chunk)
+
+    def __repr__(self):
+        return '<XvcRegion id=0x%x desc=%s offset=0x%x length=0x%x flags=0x%x>' % (
+            self.id, self.description, self.offset, self.length, self.flags)
@@ -2,15 +2,25 @@
 
 import sys
 import io
+import os
+import mmap
+import struct
+import argparse
+from array import array
 import logging
+from uuid import UUID
+from datetime import datetime, timedelta
 from binascii import hexlify
 
 from construct import Struct, Bytes, FlagsEnum, Padding, String, Array
-from construct import Int32ul, Int64ul, Int64sl
+from construct import Int8ul, Int32ul, Int64ul, Int64sl
 from construct import Enum as CEnum
+from construct import Container, ListContainer, FlagsContainer
 from durango.common.adapters import UUIDAdapter, FILETIMEAdapter
 from durango.common.enum import Enum
 from durango.common.constants import HASH_SIZE
+from durango.fileformat.xvc import XvcInfo, XvcRegionHeader, XvcRegion
+from durango.fileformat.xvc import XVC_INFO_SIZE, XVC_REGION_HEADER_SIZE
 
 log = logging.getLogger('fileformat.xvd')
 
@@ -129,6 +139,52 @@ XVD_KEY_SIZE = 32
 SANDBOX_ID_SIZE = 16
 
 XVD_HEADER_SIZE = 0x1000
+# Header + signature area, embedded XVD starts right after it
+XVD_HEADER_INCL_SIGNATURE_SIZE = 0x3000
+
+PAGE_SIZE = 0x1000
+HASH_ENTRY_LENGTH = 0x18
+HASH_ENTRIES_IN_PAGE = PAGE_SIZE // HASH_ENTRY_LENGTH  # 0xAA
+PAGES_PER_BLOCK = 0xAA
+XVD_BLOCK_SIZE = PAGES_PER_BLOCK * PAGE_SIZE  # 0xAA000
+BAT_ENTRY_SIZE = 4
+INVALID_SECTOR = 0xFFFFFFFF
+
+# Copy granularity for drive image extraction
+EXTRACT_CHUNK_SIZE = 0x400000
+
+EMBEDDED_XVD_FILENAME = 'embedded.xvd'
+USER_DATA_FILENAME = 'userdata.bin'
+
+
+def align_to_page(value):
+    return (value + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+
+
+def bytes_to_pages(value):
+    return align_to_page(value) // PAGE_SIZE
+
+
+def calculate_hash_tree_levels(hashed_pages):
+    """
+    Calculate the number of hash pages on each level of the hash tree
+
+    Level 0 holds the hashes of the data pages, each level above holds
+    the hashes of the level below, up to a single top hash page.
+
+    Returns:
+        list: Hash page count per level, index 0 -> lowest level
+    """
+    levels = list()
+    page_count = hashed_pages
+    while True:
+        page_count = (page_count + HASH_ENTRIES_IN_PAGE - 1) // HASH_ENTRIES_IN_PAGE
+        levels.append(max(page_count, 1))
+        if page_count <= 1:
+            break
+    return levels
+
+
 XvdFileHeader = Struct(
     "signature" / Bytes(0x200),              # 0x00 - 0x200
     "magic" / Bytes(8),                      # 0x200
@@ -162,7 +218,8 @@ XvdFileHeader = Struct(
     "writeable_expiration_data" / Int32ul,   # 0x464
     "writeable_policy_flags" / Int32ul,      # 0x468
     "local_storage_size" / Int32ul,          # 0x46C
-    Padding(0x1C),                           # 0x470
+    "mutable_data_page_count" / Int8ul,      # 0x470
+    Padding(0x1B),                           # 0x471
     "sequence_number" / Int64sl,             # 0x48C
     "required_systemversion" / Int64ul,      # 0x494
     "odk_keyslot_id" / Int32ul,              # 0x49C
@@ -170,25 +227,374 @@ XvdFileHeader = Struct(
 )
 
 
+class XvdFastHeader(object):
+    """
+    Precompiled parser for XvdFileHeader
+
+    Unpacks the header with a single `struct.Struct` call and decodes
+    UUIDs, FILETIME, flags and ext entries lazily on first attribute access.
+    Attributes match the ones returned by parsing `XvdFileHeader`.
+    """
+    _struct = struct.Struct(
+        '<512s8sIIQQ16s16s32s32s'           # 0x000 signature .. xvc_hash
+        'IIIIIII'                           # 0x280 xvd_type .. block_size
+        'IIQII' 'IIQII' 'IIQII' 'IIQII'     # 0x29C ext_entry[4]
+        '16s32s16s16x32s32s16s16s16sQ'      # 0x2FC xvd_capabilities .. package_version
+        '160sIIIB27xqQI'                    # 0x3C4 pe_catalog_info .. odk_keyslot_id
+    )
+    _ext_entry_index = 17
+    _ext_entry_fields = ('code', 'length', 'offset', 'data_length', 'reserved')
+    # name -> (index into unpacked tuple, decoder)
+    _fields = {
+        'signature': (0, None),
+        'magic': (1, None),
+        'volume_flags': (2, lambda v: XvdFastHeader._decode_flags(v)),
+        'format_version': (3, None),
+        'filetime_created': (4, lambda v: datetime(1601, 1, 1) + timedelta(microseconds=v / 10)),
+        'drive_size': (5, None),
+        'content_id': (6, lambda v: UUID(bytes_le=v)),
+        'user_id': (7, lambda v: UUID(bytes_le=v)),
+        'root_hash': (8, None),
+        'xvc_hash': (9, None),
+        'xvd_type': (10, lambda v: XvdFastHeader._xvd_types.get(v, v)),
+        'content_type': (11, None),
+        'embedded_xvd_length': (12, None),
+        'userdata_length': (13, None),
+        'xvc_length': (14, None),
+        'dynamic_header_length': (15, None),
+        'block_size': (16, None),
+        'xvd_capabilities': (37, None),
+        'pe_catalog_hash': (38, None),
+        'embedded_xvd_pduid': (39, lambda v: UUID(bytes_le=v)),
+        'key_material': (40, None),
+        'user_data_hash': (41, None),
+        'sandbox_id': (42, lambda v: v.rstrip(b'\x00')),
+        'product_id': (43, lambda v: UUID(bytes_le=v)),
+        'build_id': (44, lambda v: UUID(bytes_le=v)),
+        'package_version': (45, None),
+        'pe_catalog_info': (46, None),
+        'writeable_expiration_data': (47, None),
+        'writeable_policy_flags': (48, None),
+        'local_storage_size': (49, None),
+        'mutable_data_page_count': (50, None),
+        'sequence_number': (51, None),
+        'required_systemversion': (52, None),
+        'odk_keyslot_id': (53, None)
+    }
+    _xvd_types = dict((value, key) for key, value in XvdType.items())
+    # Field order of XvdFileHeader
+    _field_order = tuple(subcon.name for subcon in XvdFileHeader.subcons if subcon.name)
+
+    def __init__(self, buf):
+        if len(buf) < self._struct.size:
+            raise Exception('Could not read enough bytes for header')
+        self._values = self._struct.unpack_from(buf)
+        self.reserved = None
+
+    def pack(self):
+        """
+        Serialize all header fields (reserved area omitted)
+
+        Returns:
+            bytes: Buffer of `XvdFastHeader.size()` bytes, parseable by `XvdFastHeader`
+        """
+        return self._struct.pack(*self._values)
+
+    @classmethod
+    def size(cls):
+        return cls._struct.size
+
+    def as_dict(self):
+        """
+        Returns:
+            Container: All fields, equal to the result of parsing `XvdFileHeader`
+        """
+        return Container((name, getattr(self, name)) for name in self._field_order)
+
+    def __eq__(self, other):
+        if isinstance(other, XvdFastHeader):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    @staticmethod
+    def _decode_flags(value):
+        flags = FlagsContainer()
+        for name, flag in XvdVolumeFlags.items():
+            flags[name] = bool(value & flag)
+        return flags
+
+    @property
+    def ext_entry(self):
+        entries = ListContainer()
+        for i in range(4):
+            start = self._ext_entry_index + i * len(self._ext_entry_fields)
+            values = self._values[start:start + len(self._ext_entry_fields)]
+            entries.append(Container(zip(self._ext_entry_fields, values)))
+        return entries
+
+    def __getattr__(self, name):
+        # Only invoked for attributes not decoded yet
+        try:
+            index, decoder = self._fields[name]
+        except KeyError:
+            raise AttributeError(name)
+        value = self._values[index]
+        if decoder:
+            value = decoder(value)
+        setattr(self, name, value)
+        return value
+
+
+class XvdBlockAllocationTable(object):
+    def __init__(self, buf, drive_block_count):
+        """
+        Block allocation table (BAT) of a dynamic XVD
+
+        Entry N maps virtual drive block N (XVD_BLOCK_SIZE bytes) to a
+        block number inside the XVD file. INVALID_SECTOR marks an
+        unallocated block, which reads as zeros.
+
+        Args:
+            buf (bytes): Dynamic header data
+            drive_block_count (int): Number of blocks covered by drive_size
+        """
+        entry_count = min(len(buf) // BAT_ENTRY_SIZE, drive_block_count)
+        self.entries = array('I')
+        self.entries.frombytes(bytes(buf[:entry_count * BAT_ENTRY_SIZE]))
+        if sys.byteorder != 'little':
+            self.entries.byteswap()
+        self.drive_block_count = drive_block_count
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def is_allocated(entry):
+        return entry != INVALID_SECTOR
+
+    @property
+    def allocated_block_count(self):
+        return sum(1 for e in self.entries if self.is_allocated(e))
+
+    def get_file_offset(self, block_num):
+        """
+        Returns:
+            int: File offset of drive block or None if unallocated
+        """
+        if block_num >= len(self.entries):
+            return None
+        entry = self.entries[block_num]
+        if not self.is_allocated(entry):
+            return None
+        return entry * XVD_BLOCK_SIZE
+
+    def iter_extents(self):
+        """
+        Iterate allocated drive areas, merging file-contiguous blocks
+
+        Yields:
+            tuple: (drive_offset, file_offset, length)
+        """
+        start = None
+        for block_num, entry in enumerate(self.entries):
+            if start is not None and self.is_allocated(entry) and \
+                    entry == self.entries[start] + (block_num - start):
+                continue
+            if start is not None:
+                yield (start * XVD_BLOCK_SIZE, self.entries[start] * XVD_BLOCK_SIZE,
+                       (block_num - start) * XVD_BLOCK_SIZE)
+                start = None
+            if self.is_allocated(entry):
+                start = block_num
+        if start is not None:
+            yield (start * XVD_BLOCK_SIZE, self.entries[start] * XVD_BLOCK_SIZE,
+                   (len(self.entries) - start) * XVD_BLOCK_SIZE)
+
+
 class XvdFile(object):
     struct = XvdFileHeader
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, use_mmap=False, fast_header=True, buf=None, window=None):
+        """
+        Parse XVD file header
+
+        Args:
+            filepath (str): Path to XVD file, name only for `buf`/`window`
+            use_mmap (bool): Keep a single, memory-mapped handle open for
+                all subsequent reads. Region accessors return `memoryview`
+                slices of the mapping instead of `bytes` copies.
+                Call `close()` or use the object as context manager.
+            fast_header (bool): Parse header via `XvdFastHeader`,
+                otherwise via the construct struct `XvdFileHeader`
+            buf (buffer): Read XVD from buffer instead of filepath,
+                see `from_buffer`
+            window (tuple): Read XVD from (fd, offset, length) instead of
+                filepath, see `from_window`
+        """
         self.filepath = filepath
-        with io.open(filepath, 'rb') as f:
-            header_buf = f.read(XVD_HEADER_SIZE)
-        if len(header_buf) != XVD_HEADER_SIZE:
-            raise Exception('Could not read enough bytes for header')
-        if header_buf[0x200: 0x200+8] != XVD_MAGIC:
-            raise Exception('Invalid file-magic')
-        self.header = self.struct.parse(header_buf)
+        self._file = None
+        self._mmap = None
+        self._buffer = memoryview(buf) if buf is not None else None
+        self._window = window
+        self._xvc_info = None
+        if use_mmap:
+            self.open()
+        try:
+            header_buf = bytes(self.read(0, XVD_HEADER_SIZE))
+            if len(header_buf) != XVD_HEADER_SIZE:
+                raise Exception('Could not read enough bytes for header')
+            if header_buf[0x200: 0x200+8] != XVD_MAGIC:
+                raise Exception('Invalid file-magic')
+            self.header = self.parse_header(header_buf, fast_header)
+        except Exception:
+            self.close()
+            raise
+
+    @classmethod
+    def from_buffer(cls, buf, name=None, fast_header=True):
+        """
+        Parse XVD held in a buffer (e.g. memoryview of a mapped nand dump)
+
+        Region accessors return `memoryview` slices of the buffer.
+        """
+        return cls(name, fast_header=fast_header, buf=buf)
+
+    @classmethod
+    def from_window(cls, fd, offset, length, name=None, fast_header=True):
+        """
+        Parse XVD stored at offset of an open file descriptor
+
+        Reads are done via `os.pread`, the descriptor is not closed.
+        """
+        return cls(name, fast_header=fast_header, window=(fd, offset, length))
+
+    @classmethod
+    def parse_header(cls, header_buf, fast=True):
+        if fast:
+            return XvdFastHeader(header_buf)
+        return cls.struct.parse(header_buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_mapped(self):
+        return self._mmap is not None or self._buffer is not None
+
+    @property
+    def is_window(self):
+        return self._window is not None
+
+    def open(self):
+        """
+        Open file and map it into memory (read-only)
+        """
+        if self.is_mapped or self.is_window:
+            return
+        self._file = io.open(self.filepath, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            self._file = None
+            raise
+
+    def close(self):
+        """
+        Unmap file and close the handle
+
+        Note: All memoryviews handed out need to be released beforehand.
+        """
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def read(self, offset, size):
+        """
+        Read from file, short read at end of file
+
+        Returns:
+            memoryview: If file is mapped, bytes otherwise
+        """
+        return self._read_from_file(offset, size)
 
     def _read_from_file(self, offset, size):
+        if self._buffer is not None:
+            return self._buffer[offset:offset + size]
+        if self._window is not None:
+            fd, base, length = self._window
+            size = max(0, min(size, length - offset))
+            return os.pread(fd, size, base + offset)
+        if self._mmap is not None:
+            return memoryview(self._mmap)[offset:offset + size]
         with io.open(self.filepath, 'rb') as f:
             f.seek(offset, io.SEEK_SET)
             data = f.read(size)
         return data
 
+    @property
+    def embedded_xvd_offset(self):
+        return XVD_HEADER_INCL_SIGNATURE_SIZE
+
+    @property
+    def mdu_offset(self):
+        return align_to_page(self.embedded_xvd_offset + self.header.embedded_xvd_length)
+
+    @property
+    def hash_tree_offset(self):
+        return self.mdu_offset + self.header.mutable_data_page_count * PAGE_SIZE
+
+    @property
+    def hashed_page_count(self):
+        header = self.header
+        return header.drive_size // PAGE_SIZE + \
+            bytes_to_pages(header.userdata_length) + \
+            bytes_to_pages(header.xvc_length) + \
+            bytes_to_pages(header.dynamic_header_length)
+
+    @property
+    def hash_tree_levels(self):
+        return calculate_hash_tree_levels(self.hashed_page_count)
+
+    @property
+    def hash_tree_page_count(self):
+        if not self.is_dataintegrity_enabled:
+            return 0
+        page_count = sum(self.hash_tree_levels)
+        if self.header.volume_flags.ResiliencyEnabled:
+            page_count *= 2
+        return page_count
+
+    @property
+    def userdata_offset(self):
+        return self.hash_tree_offset + self.hash_tree_page_count * PAGE_SIZE
+
+    @property
+    def xvc_info_offset(self):
+        return self.userdata_offset + align_to_page(self.header.userdata_length)
+
+    @property
+    def dynamic_header_offset(self):
+        return self.xvc_info_offset + align_to_page(self.header.xvc_length)
+
+    @property
+    def drive_data_offset(self):
+        return self.dynamic_header_offset + align_to_page(self.header.dynamic_header_length)
+
     @property
     def is_xvc_file(self):
         if self.header.content_type in XvcContentTypes:
@@ -203,15 +609,175 @@ class XvdFile(object):
     def is_dataintegrity_enabled(self):
         return False if self.header.volume_flags.DataIntegrityDisabled else True
 
+    def get_header_view(self):
+        return self._read_from_file(0, XVD_HEADER_SIZE)
+
     def extract_embedded_xvd(self):
         if self.header.embedded_xvd_length == 0:
             return None
-        return self._read_from_file(3 * 0x1000, self.header.embedded_xvd_length)
+        return self._read_from_file(self.embedded_xvd_offset, self.header.embedded_xvd_length)
 
     def extract_user_data(self):
         if self.header.userdata_length == 0:
             return None
-        return self._read_from_file(self.header.userdata_offset, self.header.userdata_length)
+        return self._read_from_file(self.userdata_offset, self.header.userdata_length)
+
+    def extract_xvc_data(self):
+        if self.header.xvc_length == 0:
+            return None
+        return self._read_from_file(self.xvc_info_offset, self.header.xvc_length)
+
+    def extract_to_directory(self, dest_dir, store=None):
+        """
+        Extract embedded XVD and user data
+
+        Args:
+            dest_dir (str): Output directory
+            store (ContentStore): Deduplicate files through blob store,
+                writes a manifest into dest_dir
+
+        Returns:
+            list: Names of extracted files
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        manifest = None
+        if store:
+            # Only needed for deduplicated extraction, keep header parsing lean
+            from durango.common.blobstore import ExtractionManifest
+            manifest = ExtractionManifest(self.filepath)
+        extracted = list()
+        for filename, data in ((EMBEDDED_XVD_FILENAME, self.extract_embedded_xvd()),
+                               (USER_DATA_FILENAME, self.extract_user_data())):
+            if data is None:
+                continue
+            dest_path = os.path.join(dest_dir, filename)
+            if store:
+                digest = store.store_bytes(data, dest_path)
+                manifest.add(filename, digest, len(data))
+            else:
+                with io.open(dest_path, 'wb') as f:
+                    f.write(data)
+            extracted.append(filename)
+        if manifest:
+            manifest.save(dest_dir)
+        return extracted
+
+    @property
+    def xvc_info(self):
+        """
+        Returns:
+            Container: Parsed XvcInfo or None if file holds no XVC data
+        """
+        if self._xvc_info is None and self.is_xvc_file and \
+                self.header.xvc_length >= XVC_INFO_SIZE:
+            buf = self._read_from_file(self.xvc_info_offset, XVC_INFO_SIZE)
+            self._xvc_info = XvcInfo.parse(bytes(buf))
+        return self._xvc_info
+
+    def iter_regions(self):
+        """
+        Iterate XVC regions, region headers directly follow XvcInfo
+
+        Yields:
+            XvcRegion: Region with random-access read/stream interface
+        """
+        xvc_info = self.xvc_info
+        if not xvc_info:
+            return
+        table_size = xvc_info.region_count * XVC_REGION_HEADER_SIZE
+        if XVC_INFO_SIZE + table_size > self.header.xvc_length:
+            raise Exception('XVC region table exceeds XVC data length')
+        buf = bytes(self._read_from_file(self.xvc_info_offset + XVC_INFO_SIZE, table_size))
+        for i in range(xvc_info.region_count):
+            offset = i * XVC_REGION_HEADER_SIZE
+            header = XvcRegionHeader.parse(buf[offset:offset + XVC_REGION_HEADER_SIZE])
+            yield XvcRegion(self, header)
+
+    def get_region(self, description=None, flag=None):
+        """
+        Find first region by description (e.g. 'FS-MD') or XvcRegionFlags flag
+        """
+        for region in self.iter_regions():
+            if description is not None and region.description == description:
+                return region
+            if flag is not None and region.has_flag(flag):
+                return region
+        return None
+
+    @property
+    def is_dynamic(self):
+        return self.header.xvd_type == 'Dynamic'
+
+    @property
+    def drive_block_count(self):
+        return (self.header.drive_size + XVD_BLOCK_SIZE - 1) // XVD_BLOCK_SIZE
+
+    def get_block_allocation_table(self):
+        """
+        Returns:
+            XvdBlockAllocationTable: BAT of dynamic XVD, None for fixed XVDs
+        """
+        if not self.is_dynamic or not self.header.dynamic_header_length:
+            return None
+        buf = self._read_from_file(self.dynamic_header_offset,
+                                   self.header.dynamic_header_length)
+        return XvdBlockAllocationTable(buf, self.drive_block_count)
+
+    def get_drive_extents(self):
+        """
+        Areas of the virtual drive that are backed by file data
+
+        Returns:
+            list: Tuples of (drive_offset, file_offset, length)
+        """
+        drive_size = self.header.drive_size
+        bat = self.get_block_allocation_table()
+        if not bat:
+            return [(0, self.drive_data_offset, drive_size)]
+        extents = list()
+        for drive_offset, file_offset, length in bat.iter_extents():
+            length = min(length, drive_size - drive_offset)
+            extents.append((drive_offset, file_offset, length))
+        return extents
+
+    def extract_drive_image(self, dest_path, progress_callback=None):
+        """
+        Write raw drive image as sparse file
+
+        Unallocated blocks of dynamic XVDs and all-zero chunks are skipped
+        via `seek`, leaving holes instead of writing zeros.
+
+        Args:
+            dest_path (str): Output filepath
+            progress_callback (callable): Called with (written_bytes, total_bytes)
+
+        Returns:
+            int: Count of bytes actually written
+        """
+        drive_size = self.header.drive_size
+        extents = self.get_drive_extents()
+        total = sum(length for _, _, length in extents)
+        zero_chunk = bytes(EXTRACT_CHUNK_SIZE)
+        written = 0
+        done = 0
+        with io.open(dest_path, 'wb') as dest:
+            for drive_offset, file_offset, length in extents:
+                pos = 0
+                while pos < length:
+                    size = min(EXTRACT_CHUNK_SIZE, length - pos)
+                    chunk = self._read_from_file(file_offset + pos, size)
+                    if len(chunk) != size:
+                        raise Exception('Unexpected end of file @ 0x%x' % (file_offset + pos))
+                    if chunk != zero_chunk[:size]:
+                        dest.seek(drive_offset + pos, io.SEEK_SET)
+                        dest.write(chunk)
+                        written += size
+                    pos += size
+                    done += size
+                    if progress_callback:
+                        progress_callback(done, total)
+            dest.truncate(drive_size)
+        return written
 
     def print_info(self):
         header = self.header
@@ -240,21 +806,60 @@ class XvdFile(object):
         print("Required System version: %i" % header.required_systemversion)
         print("Sequence number: %i" % header.sequence_number)
         print("Ext XVD Entries: %s" % header.ext_entry)
+        if self.xvc_info:
+            print(" -- XvcInfo")
+            print("Content Id: %s" % self.xvc_info.content_id)
+            print("Region count: %i" % self.xvc_info.region_count)
+            for region in self.iter_regions():
+                print(region)
 
 def main():
-    if len(sys.argv) < 2:
-        log.error("No filepath argument given!")
-        sys.exit(-1)
+    parser = argparse.ArgumentParser(description='Parse XVD file header')
+    parser.add_argument('filepath', type=str, help='input XVD file')
+    parser.add_argument('--verify', action='store_true',
+                        help='verify data-integrity hash tree')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='hashing threads for --verify')
+    parser.add_argument('--extract-drive', metavar='OUTPUT',
+                        help='extract raw drive image as sparse file')
+    parser.add_argument('--extract', metavar='DIR',
+                        help='extract embedded XVD and user data')
+    parser.add_argument('--store', help='deduplicate extracted files via blob store directory')
+    args = parser.parse_args()
 
-    filepath = sys.argv[1]
+    filepath = args.filepath
 
     try:
-        xvd_obj = XvdFile(filepath)
+        xvd_obj = XvdFile(filepath, use_mmap=True)
     except Exception as e:
         log.error("Parsing file %s failed! Msg: %s" % (filepath, e))
         sys.exit(-2)
 
-    xvd_obj.print_info()
+    with xvd_obj:
+        xvd_obj.print_info()
+        if args.verify:
+            # Avoid circular import
+            from durango.fileformat.xvd_hashtree import XvdHashTreeVerifier
+            try:
+                result = XvdHashTreeVerifier(xvd_obj, args.jobs).verify()
+            except Exception as e:
+                log.error("Verifying file %s failed! Msg: %s" % (filepath, e))
+                sys.exit(-3)
+            print(" -- Hash tree verification")
+            print(result)
+            if not result.is_valid:
+                sys.exit(-4)
+        if args.extract:
+            store = None
+            if args.store:
+                from durango.common.blobstore import ContentStore
+                store = ContentStore(args.store)
+            extracted = xvd_obj.extract_to_directory(args.extract, store)
+            log.info("Extracted: %s" % extracted)
+        if args.extract_drive:
+            log.info("Extracting drive image to %s" % args.extract_drive)
+            written = xvd_obj.extract_drive_image(args.extract_drive)
+            log.info("Wrote 0x%x of 0x%x bytes" % (written, xvd_obj.header.drive_size))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,198 @@
+"""
+XVD data-integrity hash tree verification
+
+Layout (fixed XVDs with data integrity enabled):
+    - The hash tree starts at `XvdFile.hash_tree_offset`, top level first,
+      followed by the lower levels down to level 0.
+    - Level 0 holds one hash entry (HASH_ENTRY_LENGTH bytes) per data page,
+      HASH_ENTRIES_IN_PAGE entries per hash page.
+    - Each level above holds one entry per hash page of the level below.
+    - SHA-256 of the single top hash page equals `header.root_hash`.
+    - Hashed data pages start at `XvdFile.userdata_offset`
+      (user data, XVC info, dynamic header, drive data).
+
+Data is streamed in large, hash-page aligned chunks and hashed in a
+thread pool (hashlib releases the GIL for page sized buffers).
+"""
+
+import os
+import logging
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from durango.fileformat.xvd import PAGE_SIZE, HASH_ENTRY_LENGTH, HASH_ENTRIES_IN_PAGE
+
+log = logging.getLogger('fileformat.xvd_hashtree')
+
+# Encrypted XVDs store a 4 byte data unit tag at the end of each hash entry
+HASH_ENTRY_LENGTH_ENCRYPTED = 0x14
+
+# Level-0 hash pages (each covering HASH_ENTRIES_IN_PAGE data pages) per read
+HASH_PAGES_PER_CHUNK = 16
+
+DEFAULT_JOBS = os.cpu_count() or 1
+
+
+class XvdHashTreeResult(object):
+    def __init__(self, level_count):
+        """
+        Result of a hash tree verification
+
+        `first_mismatch[0]` holds the index of the first data page that does
+        not match its level-0 entry, `first_mismatch[n]` the index of the
+        first level n-1 hash page that does not match its level n entry.
+        """
+        self.root_hash_valid = False
+        self.first_mismatch = [None] * (level_count + 1)
+
+    @property
+    def is_valid(self):
+        return self.root_hash_valid and \
+            all(m is None for m in self.first_mismatch)
+
+    def set_mismatch(self, level, index):
+        current = self.first_mismatch[level]
+        if current is None or index < current:
+            self.first_mismatch[level] = index
+
+    def __str__(self):
+        text = 'Root hash: %s\n' % ('valid' if self.root_hash_valid else 'INVALID')
+        for level, index in enumerate(self.first_mismatch):
+            name = 'Data pages' if level == 0 else 'Hash level %i' % (level - 1)
+            if index is None:
+                text += '%s: valid\n' % name
+            else:
+                text += '%s: first mismatch @ page 0x%x\n' % (name, index)
+        return text
+
+
+class XvdHashTreeVerifier(object):
+    def __init__(self, xvd, jobs=DEFAULT_JOBS, progress_callback=None):
+        """
+        Verifier for the data-integrity hash tree of a XvdFile
+
+        Args:
+            xvd (XvdFile): Parsed XVD file
+            jobs (int): Number of hashing threads
+            progress_callback (callable): Called with (done_pages, total_pages)
+        """
+        if not xvd.is_dataintegrity_enabled:
+            raise Exception('Data integrity is disabled for this XVD')
+        if xvd.header.xvd_type != 'Fixed':
+            raise Exception('Hash tree verification supports fixed XVDs only')
+        self.xvd = xvd
+        self.jobs = max(1, jobs)
+        self.progress_callback = progress_callback
+        self.levels = xvd.hash_tree_levels
+        self.data_page_count = xvd.hashed_page_count
+        self.entry_length = HASH_ENTRY_LENGTH_ENCRYPTED if xvd.is_encrypted \
+            else HASH_ENTRY_LENGTH
+        self._fd = None
+
+    def get_level_offset(self, level):
+        # Top level is stored first
+        pages_before = sum(self.levels[level + 1:])
+        return self.xvd.hash_tree_offset + pages_before * PAGE_SIZE
+
+    def _read(self, offset, size):
+        if self.xvd.is_mapped or self.xvd.is_window:
+            return self.xvd.read(offset, size)
+        return os.pread(self._fd, size, offset)
+
+    def _check_entries(self, hash_pages, pages, start_index):
+        """
+        Compare page digests against the hash entries in hash_pages
+
+        Returns:
+            int: Index of first mismatching page or None
+        """
+        first_mismatch = None
+        for i, page in enumerate(pages):
+            digest = hashlib.sha256(page).digest()
+            index = start_index + i
+            entry_offset = (index % HASH_ENTRIES_IN_PAGE) * HASH_ENTRY_LENGTH
+            entry_offset += (index // HASH_ENTRIES_IN_PAGE -
+                             start_index // HASH_ENTRIES_IN_PAGE) * PAGE_SIZE
+            expected = hash_pages[entry_offset:entry_offset + self.entry_length]
+            if first_mismatch is None and (len(page) != PAGE_SIZE or
+                                           digest[:self.entry_length] != expected):
+                first_mismatch = index
+        return first_mismatch
+
+    @staticmethod
+    def _split_pages(buf, count):
+        view = memoryview(buf)
+        return [view[i * PAGE_SIZE:(i + 1) * PAGE_SIZE] for i in range(count)]
+
+    def _verify_data_chunk(self, chunk_index):
+        """
+        Verify a chunk of data pages against level 0
+
+        Returns:
+            tuple: (level-0 hash page digests, first mismatching data page)
+        """
+        first_hash_page = chunk_index * HASH_PAGES_PER_CHUNK
+        hash_page_count = min(HASH_PAGES_PER_CHUNK, self.levels[0] - first_hash_page)
+        hash_pages = self._read(self.get_level_offset(0) + first_hash_page * PAGE_SIZE,
+                                hash_page_count * PAGE_SIZE)
+
+        first_data_page = first_hash_page * HASH_ENTRIES_IN_PAGE
+        data_page_count = min(hash_page_count * HASH_ENTRIES_IN_PAGE,
+                              self.data_page_count - first_data_page)
+        data = self._read(self.xvd.userdata_offset + first_data_page * PAGE_SIZE,
+                          data_page_count * PAGE_SIZE)
+        # Short read (truncated file) results in short pages -> mismatch
+        pages = self._split_pages(data, data_page_count)
+        mismatch = self._check_entries(hash_pages, pages, first_data_page)
+
+        hash_page_digests = [hashlib.sha256(p).digest()
+                             for p in self._split_pages(hash_pages, hash_page_count)]
+        if self.progress_callback:
+            self.progress_callback(first_data_page + data_page_count, self.data_page_count)
+        return hash_page_digests, mismatch
+
+    def _verify_levels(self, result, level0_digests):
+        digests = level0_digests
+        for level in range(1, len(self.levels)):
+            hash_pages = self._read(self.get_level_offset(level),
+                                    self.levels[level] * PAGE_SIZE)
+            first_mismatch = None
+            for index, digest in enumerate(digests):
+                entry_offset = (index // HASH_ENTRIES_IN_PAGE) * PAGE_SIZE + \
+                    (index % HASH_ENTRIES_IN_PAGE) * HASH_ENTRY_LENGTH
+                expected = hash_pages[entry_offset:entry_offset + self.entry_length]
+                if digest[:self.entry_length] != expected:
+                    first_mismatch = index
+                    break
+            if first_mismatch is not None:
+                result.set_mismatch(level, first_mismatch)
+            digests = [hashlib.sha256(p).digest()
+                       for p in self._split_pages(hash_pages, self.levels[level])]
+        return digests
+
+    def verify(self):
+        """
+        Verify data pages and all hash tree levels
+
+        Returns:
+            XvdHashTreeResult: Verification result
+        """
+        result = XvdHashTreeResult(len(self.levels))
+        if not (self.xvd.is_mapped or self.xvd.is_window):
+            self._fd = os.open(self.xvd.filepath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            chunk_count = (self.levels[0] + HASH_PAGES_PER_CHUNK - 1) // HASH_PAGES_PER_CHUNK
+            level0_digests = list()
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                for digests, mismatch in pool.map(self._verify_data_chunk, range(chunk_count)):
+                    level0_digests.extend(digests)
+                    if mismatch is not None:
+                        result.set_mismatch(0, mismatch)
+
+            top_digests = self._verify_levels(result, level0_digests)
+            result.root_hash_valid = top_digests[0] == bytes(self.xvd.header.root_hash)
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        return result
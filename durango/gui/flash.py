@@ -30,6 +30,8 @@ class FlashExplorer(OptionFrame):
         filepath = filedialog.askopenfilename()
         if not filepath:
             return
+        if self.nand:
+            self.nand.close()
         self.nand = DurangoNand(filepath)
         self.set_status('Parsing file...')
         try:
@@ -1,19 +1,38 @@
 import os
+import queue
 import logging
+import threading
 from tkinter import filedialog
 
 from durango.gui.option_frame import OptionFrame
 from durango.fileformat.savegame_container import SavegameType
 from durango.hdd.savegame_enum import SavegameEnumerator
+from durango.hdd.savegame_watcher import SavegameWatcher
+from durango.hdd.savegame_export import export_to_directory
 
 log = logging.getLogger('gui.savegames')
 
+# Milliseconds between checks for folders parsed by the watcher
+WATCH_QUEUE_INTERVAL = 500
+# Milliseconds between export progress updates
+EXPORT_QUEUE_INTERVAL = 200
+
 
 class SavegameExplorer(OptionFrame):
     name = 'frame_savegames'
     empty_tree_msg = 'Please open the savegame directory'
     savegame_handler = SavegameEnumerator()
     tree_dict = dict()
+    # folderpath : top-level treeview iid
+    folder_iids = dict()
+    dirpath = None
+    watcher = None
+    # Folders parsed in the watcher thread, consumed in the Tk main loop
+    watch_queue = queue.Queue()
+    # treeview iid : [savegame entry, ...] exported for that item
+    export_dict = dict()
+    # Progress / result of the export thread, consumed in the Tk main loop
+    export_queue = queue.Queue()
 
     @property
     def _tree_fields(self):
@@ -24,6 +43,7 @@ class SavegameExplorer(OptionFrame):
     @property
     def _button_fields(self):
         return [('open', 'Open directory', self.on_click_open),
+                ('watch', 'Watch directory', self.on_click_watch),
                 ('extract', 'Extract file', self.on_click_extract),
                 ('replace', 'Replace file', self.on_click_replace),
                 ('inject', 'Inject file', self.on_click_inject),
@@ -33,31 +53,116 @@ class SavegameExplorer(OptionFrame):
         dirpath = filedialog.askdirectory(title='Choose savegame topdirectory', mustexist=True)
         if not dirpath:
             return
+        self.stop_watcher()
+        self.dirpath = dirpath
+        self.folder_iids.clear()
+        self.export_dict.clear()
+        self.savegame_handler.folder_records.clear()
         # Filter for valid subdirs
         folderlist = self.savegame_handler.get_folderlist(dirpath)
         self.set_progressbar(max_val=len(folderlist))
         self.reset_layout()
-        for index, folderpath in enumerate(folderlist):
-            self.set_progressbar(current=index)
+        parsed_folders = self.savegame_handler.iter_savegamefolders(folderlist)
+        for count, (folderpath, ret) in enumerate(parsed_folders):
+            self.set_progressbar(current=count)
             self.set_status(folderpath)
-            ret = self.savegame_handler.parse_rootfolder(folderpath)
             if not ret:
                 continue
-            xuid, guid, index = ret
-            parsed_saves = list()
-            for savegame in index.files:
-                blob = self.savegame_handler.parse_savegame(folderpath, savegame)
-                if not blob:
-                    continue
-                parsed_saves.append((savegame, blob))
+            xuid, guid, index, parsed_saves = ret
             self._populate_treeview(folderpath, xuid, guid, index, parsed_saves)
 
         # Reset progressbar
         self.set_progressbar()
         self.set_status('Finished')
 
+    def on_click_watch(self):
+        if self.watcher:
+            self.stop_watcher()
+            self.set_status('Stopped watching')
+            return
+        if not self.dirpath:
+            self.set_status('Open a directory first')
+            return
+        self.watcher = SavegameWatcher(self.dirpath, self._on_folders_changed)
+        self.watcher.start()
+        self.after(WATCH_QUEUE_INTERVAL, self._process_watch_queue)
+        self.set_status('Watching (%s)' % self.watcher.backend)
+
+    def stop_watcher(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _on_folders_changed(self, folderpaths):
+        # Runs in watcher thread, parse here to keep the Tk main loop responsive
+        parsed = list(self.savegame_handler.iter_savegamefolders(folderpaths))
+        self.watch_queue.put(parsed)
+
+    def _process_watch_queue(self):
+        while True:
+            try:
+                parsed = self.watch_queue.get_nowait()
+            except queue.Empty:
+                break
+            for folderpath, ret in parsed:
+                self._update_folder(folderpath, ret)
+                self.set_status('Updated %s' % os.path.basename(folderpath))
+        if self.watcher:
+            self.after(WATCH_QUEUE_INTERVAL, self._process_watch_queue)
+
+    def _update_folder(self, folderpath, ret):
+        position = 'end'
+        top_iid = self.folder_iids.pop(folderpath, None)
+        if top_iid and self.treeview.exists(top_iid):
+            position = self.treeview.index(top_iid)
+            for iid in (top_iid,) + self.treeview.get_children(top_iid):
+                self.tree_dict.pop(iid, None)
+                self.export_dict.pop(iid, None)
+            self.treeview.delete(top_iid)
+        self.savegame_handler.folder_records.pop(folderpath, None)
+        if not ret:
+            return
+        xuid, guid, index, parsed_saves = ret
+        self._populate_treeview(folderpath, xuid, guid, index, parsed_saves, position)
+
     def on_click_extract(self):
-        pass
+        savegames = self.export_dict.get(self.treeview.focus())
+        if not savegames:
+            self.set_status('Select a savegame folder or savegame first')
+            return
+        dest_dir = filedialog.askdirectory(title='Choose export directory')
+        if not dest_dir:
+            return
+        filesets = self.savegame_handler.get_export_filesets(savegames)
+
+        def export():
+            try:
+                size = export_to_directory(
+                    filesets, dest_dir,
+                    progress_callback=lambda done, total: self.export_queue.put((done, total)))
+                self.export_queue.put('Exported %i bytes to %s' % (size, dest_dir))
+            except Exception as e:
+                log.error('Export failed: %s' % e)
+                self.export_queue.put('Export failed: %s' % e)
+
+        self.set_status('Exporting %i savegames' % len(savegames))
+        threading.Thread(target=export, name='SavegameExport', daemon=True).start()
+        self.after(EXPORT_QUEUE_INTERVAL, self._process_export_queue)
+
+    def _process_export_queue(self):
+        while True:
+            try:
+                item = self.export_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, str):
+                # Export finished
+                self.set_progressbar()
+                self.set_status(item)
+                return
+            done, total = item
+            self.set_progressbar(current=done, max_val=total)
+        self.after(EXPORT_QUEUE_INTERVAL, self._process_export_queue)
 
     def on_click_replace(self):
         pass
@@ -68,13 +173,19 @@ class SavegameExplorer(OptionFrame):
     def on_click_delete(self):
         pass
 
-    def _populate_treeview(self, folderpath, xuid, guid, index, saves_blob_list):
-        top_iid = self.treeview.insert('', 'end', text=index.name)
+    def _populate_treeview(self, folderpath, xuid, guid, index, saves_blob_list, position='end'):
+        record = self.savegame_handler.create_folder_record(
+            folderpath, (xuid, guid, index, saves_blob_list))
+        self.savegame_handler.folder_records[folderpath] = record
+        top_iid = self.treeview.insert('', position, text=index.name)
+        self.folder_iids[folderpath] = top_iid
         self.tree_dict.update({top_iid: self.generate_details_for_index(folderpath, index, guid)})
-        for savegame, blob in saves_blob_list:
+        self.export_dict.update({top_iid: record['savegames']})
+        for (savegame, blob), entry in zip(saves_blob_list, record['savegames']):
             savetype_str = SavegameType.get_string_for_value(savegame.save_type)
             iid = self.treeview.insert(top_iid, 'end', text=savegame.filename, values=(savetype_str, xuid))
             self.tree_dict.update({iid: self.generate_details_for_savegame(savegame, blob)})
+            self.export_dict.update({iid: [entry]})
 
     def on_treeview_item_select(self, event):
         item = self.treeview.focus()
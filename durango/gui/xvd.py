@@ -3,8 +3,10 @@ import logging
 from tkinter import filedialog
 
 from durango.gui.option_frame import OptionFrame
-from durango.fileformat.xvd import XvdFile, XvdContentType
+from durango.fileformat.xvd import XvdContentType
 from durango.hdd.external_storage_enum import XvdHandler
+from durango.hdd.xvd_scanner import XvdScanner
+from durango.hdd.xvd_index import XvdHeaderIndex
 
 log = logging.getLogger('gui.xvd')
 
@@ -13,6 +15,7 @@ class XvdExplorer(OptionFrame):
     name = 'frame_xvd'
     empty_tree_msg = 'Please open some xvd files'
     xvd_handler = XvdHandler()
+    xvd_scanner = None
     tree_dict = dict()
 
     @property
@@ -31,19 +34,16 @@ class XvdExplorer(OptionFrame):
         if not filepaths or not len(filepaths):
             return
         filtered_list = self.xvd_handler.get_filtered_foldercontent(filepaths=filepaths)
+        if not self.xvd_scanner:
+            self.xvd_scanner = XvdScanner(jobs=4, index=XvdHeaderIndex())
         self.set_progressbar(max_val=len(filtered_list))
         self.reset_layout()
         # Free old treeview dict
         self.tree_dict.clear()
-        for index, filepath in enumerate(filtered_list):
+        for index, (filepath, header) in enumerate(self.xvd_scanner.scan(filtered_list)):
             self.set_progressbar(current=index)
             self.set_status(filepath)
-            try:
-                xvd = XvdFile(filepath)
-            except Exception as e:
-                log.debug('%s not valid xvd, Error: %s' % (filepath, e))
-                continue
-            self._populate_treeview(xvd, filepath)
+            self._populate_treeview(header, filepath)
         # Reset progressbar
         self.set_progressbar()
         self.set_status('Idle')
@@ -59,11 +59,11 @@ class XvdExplorer(OptionFrame):
             return
         self.set_details(text)
 
-    def _populate_treeview(self, xvd, filepath):
-        type_str = XvdContentType.get_string_for_value(xvd.header.content_type)
+    def _populate_treeview(self, xvd_header, filepath):
+        type_str = XvdContentType.get_string_for_value(xvd_header.content_type)
         basename = os.path.basename(filepath)
         iid = self.treeview.insert('', 'end', text=basename, values=(type_str, filepath))
-        self.tree_dict.update({iid: self.generate_details_for_xvd(xvd.header)})
+        self.tree_dict.update({iid: self.generate_details_for_xvd(xvd_header)})
 
     def generate_details_for_xvd(self, xvd_header):
         content_type_str = XvdContentType.get_string_for_value(xvd_header.content_type)
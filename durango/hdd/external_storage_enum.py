@@ -7,7 +7,10 @@ import json
 import argparse
 import logging
 
-from durango.fileformat.xvd import XvdFile, XvdContentType
+from durango.common.report import open_report, FORMATS, FORMAT_JSON
+from durango.fileformat.xvd import XvdContentType
+from durango.hdd.xvd_scanner import XvdScanner, EXECUTOR_THREAD, EXECUTOR_TYPES
+from durango.hdd.xvd_index import XvdHeaderIndex
 
 from xbox_webapi.authentication.auth import AuthenticationManager
 from xbox_webapi.common.exceptions import AuthenticationException
@@ -23,6 +26,8 @@ TOKEN_DIR = "tokenstore.json"
 
 ALL_MEDIAGROUPS = [MediaGroup.GAME_TYPE, MediaGroup.APP_TYPE]
 DESIRED_FIELDS_SCRAPE = ['Images', 'VuiDisplayName']
+# Product ids per EDS details request
+EDS_CHUNK_SIZE = 10
 
 XVD_TYPE_APP = [
     XvdContentType.Application,
@@ -94,35 +99,68 @@ class EDSScraper(object):
             return
         return items
 
+    def scrape_chunk(self, chunk, media_group):
+        '''
+        Scrape details for up to EDS_CHUNK_SIZE entries of the same media group,
+        entries are updated in place
+        '''
+        # Assemble a list of just product_id strings
+        product_id_list = [e.get('product_id') for e in chunk]
+        # Scrape data from EDS
+        details = self.scrape_details(product_id_list, media_group)
+        if not details:
+            log.error('Failed scraping %s' % product_id_list)
+            return
+
+        # Find matching node for id in returned list of items
+        for entry in chunk:
+            matched_item = next((item for item in details if item['ID'] == entry['product_id']), None)
+            if not matched_item:
+                log.warning('No data for id: %s available it seems' % entry['product_id'])
+                continue
+            entry['name'] = matched_item.get('Name')
+            entry['display_name'] = matched_item.get('VuiDisplayName')
+            entry['media_item_type'] = matched_item.get('MediaItemType')
+            entry['image_boxart'] = matched_item.get('Images', [{}])[0].get('Url')
+
     def scrape(self, content_list):
         '''
-        Takes a list of tuples: (MediaGroup.Member, ContentEntry)
+        Takes a dict: MediaGroup.Member -> list of ContentEntry
         '''
         for media_group in ALL_MEDIAGROUPS:
             entry_list = content_list.get(media_group)
             log.info('Scraping %i %s containers' % (len(entry_list), media_group))
             # Split content entires list in chunks of 10
-            for chunk in self._chunks(entry_list, 10):
-                # Assemble a list of just product_id strings
-                product_id_list = [e.get('product_id') for e in chunk]
-                # Scrape data from EDS
-                details = self.scrape_details(product_id_list, media_group)
-                if not details:
-                    log.error('Failed scraping %s' % product_id_list)
-                    continue
-
-                # Find matching node for id in returned list of items
-                for entry in chunk:
-                    matched_item = next((item for item in details if item['ID'] == entry['product_id']), None)
-                    if not matched_item:
-                        log.warning('No data for id: %s available it seems' % entry['product_id'])
-                        continue
-                    entry['name'] = matched_item.get('Name')
-                    entry['display_name'] = matched_item.get('VuiDisplayName')
-                    entry['media_item_type'] = matched_item.get('MediaItemType')
-                    entry['image_boxart'] = matched_item.get('Images', [{}])[0].get('Url')
+            for chunk in self._chunks(entry_list, EDS_CHUNK_SIZE):
+                self.scrape_chunk(chunk, media_group)
         return content_list
 
+    def scrape_stream(self, entries):
+        '''
+        Scrape entries as they arrive, at most EDS_CHUNK_SIZE entries
+        per media group are buffered
+
+        Args:
+            entries (iterable): (MediaGroup.Member, ContentEntry) tuples
+
+        Yields:
+            dict: ContentEntry, extended by 'media_group'
+        '''
+        pending = dict((group, list()) for group in ALL_MEDIAGROUPS)
+        for media_group, entry in entries:
+            entry['media_group'] = media_group
+            pending[media_group].append(entry)
+            if len(pending[media_group]) >= EDS_CHUNK_SIZE:
+                self.scrape_chunk(pending[media_group], media_group)
+                for scraped in pending[media_group]:
+                    yield scraped
+                pending[media_group] = list()
+        for media_group, chunk in pending.items():
+            if chunk:
+                self.scrape_chunk(chunk, media_group)
+                for scraped in chunk:
+                    yield scraped
+
 
 class XvdHandler(object):
     def __init__(self):
@@ -160,39 +198,61 @@ class XvdHandler(object):
     def show_parse_progress(total, current):
         percent = total / 100
         if total % (percent*10):
-            print("\r%i percent completed (%i/%i)" % ((current / percent), current, total), end="\r")
+            # stderr, stdout may carry the (streamed) report
+            print("\r%i percent completed (%i/%i)" % ((current / percent), current, total),
+                  end="\r", file=sys.stderr)
 
     @staticmethod
-    def parse(self, filelist):
-        files = dict()
-        for group in ALL_MEDIAGROUPS:
-            files.update({group: list()})
+    def create_entry(filepath, header):
+        return {
+            'filepath': filepath,
+            'product_id': str(header.product_id),
+            'content_type': header.content_type,
+            'type': XvdContentType.get_string_for_value(header.content_type)
+        }
+
+    @staticmethod
+    def iter_entries(filelist, jobs=1, executor=EXECUTOR_THREAD, index=None):
+        """
+        Yields:
+            tuple: (MediaGroup.Member, ContentEntry) as soon as a header is parsed
+        """
         total_count = len(filelist)
-        for idx, filepath in enumerate(filelist):
+        scanner = XvdScanner(jobs, executor, index)
+        for idx, (filepath, header) in enumerate(scanner.scan(filelist)):
             XvdHandler.show_parse_progress(total_count, idx)
-            try:
-                xvd = XvdFile(filepath)
-            except Exception as e:
-                log.error('Invalid file: %s, Error: %s' % (filepath, e))
-                continue
-            header = xvd.header
             media_group = XvdHandler.get_media_group_for_type(header.content_type)
-            entry = {
-                'filepath': filepath,
-                'product_id': str(header.product_id),
-                'content_type': header.content_type,
-                'type': XvdContentType.get_string_for_value(header.content_type)
-            }
+            if media_group not in ALL_MEDIAGROUPS:
+                continue
+            yield media_group, XvdHandler.create_entry(filepath, header)
+
+    @staticmethod
+    def parse(filelist, jobs=1, executor=EXECUTOR_THREAD, index=None):
+        files = dict()
+        for group in ALL_MEDIAGROUPS:
+            files.update({group: list()})
+        for media_group, entry in XvdHandler.iter_entries(filelist, jobs, executor, index):
             files[media_group].append(entry)
         return files
 
-
 def main():
     parser = argparse.ArgumentParser(description='Enumerate external hdd content')
     parser.add_argument('path', type=str, help='input path to external drive')
     parser.add_argument('--email', help='Microsoft account email')
     parser.add_argument('--password', help='Microsoft account password')
     parser.add_argument('--output', help='Json report output (otherwise its stdout)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of parallel header parsing workers')
+    parser.add_argument('--executor', choices=EXECUTOR_TYPES, default=EXECUTOR_THREAD,
+                        help='Worker type: thread (I/O bound) or process (CPU bound)')
+    parser.add_argument('--index', default=XvdHeaderIndex.default_path(),
+                        help='Header index database (default: %(default)s)')
+    parser.add_argument('--no-index', action='store_true',
+                        help='Do not use the header index')
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help='Discard cached headers and reparse all files')
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT_JSON,
+                        help='Report format, ndjson/msgpack stream one record per XVD')
     args = parser.parse_args()
 
     if not os.path.exists(args.path):
@@ -211,7 +271,27 @@ def main():
 
     log.info("Parsing folder: %s" % args.path)
     files = XvdHandler.get_filtered_foldercontent(args.path)
-    content_list = XvdHandler.parse(files)
+    index = None
+    if not args.no_index:
+        index = XvdHeaderIndex(args.index)
+        if args.rebuild_index:
+            log.info('Rebuilding header index %s' % args.index)
+            index.clear()
+    if args.format != FORMAT_JSON:
+        entries = XvdHandler.iter_entries(files, args.jobs, args.executor, index)
+        with open_report(args.output, args.format) as writer:
+            for entry in scraper.scrape_stream(entries):
+                writer.write(entry)
+        log.info('Reported %i containers' % writer.count)
+    else:
+        content_list = XvdHandler.parse(files, args.jobs, args.executor, index)
+    if index:
+        removed = index.prune(files, root=args.path)
+        log.debug('Removed %i stale index entries' % removed)
+        index.close()
+    if args.format != FORMAT_JSON:
+        log.info('Done! Have a nice day')
+        return
 
     for group in ALL_MEDIAGROUPS:
         log.info('Found %i %s containers...' % (
@@ -4,35 +4,51 @@ import sys
 import io
 import os
 import json
+import time
 import argparse
 import logging
 import uuid
+import itertools
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 from durango.fileformat.savegame_container import \
-    ContainerIndex, ContainerBlob, CONTAINERS_INDEX
+    ContainerIndexFast, ContainerBlob, CONTAINERS_INDEX
+from durango.common.report import open_report, FORMATS, FORMAT_JSON
+from durango.hdd.savegame_snapshot import SavegameSnapshot
+from durango.hdd.savegame_export import ExportFileset, export_to_directory, export_to_tar
 
 logging.basicConfig(format='[%(levelname)s] - %(name)s - %(message)s', level=logging.DEBUG)
 log = logging.getLogger('savegame_enum')
 
+# Folders parsed concurrently, work is dominated by small file reads
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) * 4)
+# Only the blob header is needed to locate the savegame file
+CONTAINER_BLOB_SIZE = ContainerBlob.sizeof()
+
 
 class SavegameEnumerator(object):
     def __init__(self):
+        # folderpath : folder record
+        self.folder_records = dict()
+        self._reset_content()
+
+    def _reset_content(self):
+        # guid : title node
         self.savegame_content = dict()
+        # Secondary indexes, maintained by _save_to_dict
+        # product id (lowercase) : guid
+        self._guid_by_product_id = dict()
+        # aum id : guid
+        self._guid_by_aum_id = dict()
+        # xuid : [savegame, ...]
+        self._savegames_by_xuid = dict()
+        # (guid, xuid) : [savegame, ...]
+        self._savegames_by_title_xuid = dict()
 
-    def _save_to_dict(self, parsed_index, savegame, parsed_blob, guid, xuid, savegame_path):
-        # Initially create guid dict
-        guid = guid.lower()
-        if not self.savegame_content.get(guid):
-            self.savegame_content.update({guid: dict()})
-            self.savegame_content[guid].update({
-                'name': parsed_index.name,
-                'aum_id': parsed_index.aum_id,
-                'type': parsed_index.type,
-                'id': parsed_index.id
-            })
-        if not self.savegame_content[guid].get('savegames'):
-            self.savegame_content[guid].update({'savegames':list()})
-        self.savegame_content[guid]['savegames'].append({
+    @staticmethod
+    def create_savegame_entry(savegame, parsed_blob, xuid, savegame_path):
+        return {
             'filetime': str(savegame.filetime),
             'filename': savegame.filename,
             'filename_alt': savegame.filename_alt,
@@ -44,7 +60,54 @@ class SavegameEnumerator(object):
             'blob_number': savegame.blob_number,
             'save_type': savegame.save_type,
             'filepath': savegame_path
-        })
+        }
+
+    @staticmethod
+    def create_folder_record(folderpath, parsed_folder):
+        """
+        JSON serializable record of a parsed folder
+
+        Args:
+            parsed_folder (tuple): Result of `parse_folder`
+        """
+        xuid, guid, index, parsed_saves = parsed_folder
+        savegames = list()
+        for savegame, blob in parsed_saves:
+            savegame_path = SavegameEnumerator.generate_savegame_path(
+                folderpath, savegame.folder_guid, blob.file_guid)
+            savegames.append(SavegameEnumerator.create_savegame_entry(
+                savegame, blob, xuid, savegame_path))
+        return {
+            'guid': guid.lower(),
+            'name': index.name,
+            'aum_id': index.aum_id,
+            'type': index.type,
+            'id': index.id,
+            'savegames': savegames
+        }
+
+    def _save_to_dict(self, record):
+        if not record['savegames']:
+            return
+        # Initially create guid dict
+        guid = record['guid']
+        if not self.savegame_content.get(guid):
+            self.savegame_content.update({guid: dict()})
+            self.savegame_content[guid].update({
+                'name': record['name'],
+                'aum_id': record['aum_id'],
+                'type': record['type'],
+                'id': record['id']
+            })
+            self._guid_by_product_id.setdefault(record['id'].lower(), guid)
+            self._guid_by_aum_id.setdefault(record['aum_id'], guid)
+        if not self.savegame_content[guid].get('savegames'):
+            self.savegame_content[guid].update({'savegames':list()})
+        self.savegame_content[guid]['savegames'].extend(record['savegames'])
+        for savegame in record['savegames']:
+            xuid = savegame['xuid']
+            self._savegames_by_xuid.setdefault(xuid, list()).append(savegame)
+            self._savegames_by_title_xuid.setdefault((guid, xuid), list()).append(savegame)
 
     @staticmethod
     def generate_guid_filename(guid):
@@ -90,7 +153,7 @@ class SavegameEnumerator(object):
     def parse_savegameblob(filepath):
         try:
             with io.open(filepath, 'rb') as f:
-                data = f.read()
+                data = f.read(CONTAINER_BLOB_SIZE)
         except FileNotFoundError as e:
             log.error("parse_savegameblob: %s" % e)
             return
@@ -104,7 +167,7 @@ class SavegameEnumerator(object):
         except FileNotFoundError as e:
             log.error("parse_containerindex: %s" %  e)
             return
-        return ContainerIndex.parse(data)
+        return ContainerIndexFast.parse(data)
 
     @staticmethod
     def parse_rootfolder(folderpath):
@@ -134,54 +197,401 @@ class SavegameEnumerator(object):
         log.debug("Enumerated savegame: %s %s" % (savegame.filename, savegame.text))
         return parsed_blob
 
-    def parse_savegamefolders(self, folderlist):
-        for folderpath in folderlist:
-            ret = self.parse_rootfolder(folderpath)
+    @staticmethod
+    def parse_folder(folderpath):
+        """
+        Parse containers.index and all container blobs of a savegame folder
+
+        Returns:
+            tuple: (xuid, guid, index, [(savegame, blob), ...]) or None
+        """
+        ret = SavegameEnumerator.parse_rootfolder(folderpath)
+        if not ret:
+            return
+        xuid, guid, index = ret
+        parsed_saves = list()
+        for savegame in index.files:
+            blob = SavegameEnumerator.parse_savegame(folderpath, savegame)
+            if not blob:
+                continue
+            parsed_saves.append((savegame, blob))
+        return xuid, guid, index, parsed_saves
+
+    @staticmethod
+    def iter_savegamefolders(folderlist, jobs=DEFAULT_JOBS):
+        """
+        Parse folders in a thread pool, overlapping index and blob reads
+
+        A folder that fails to parse yields None, like a folder without savegames
+        container index, instead of aborting the whole run.
+
+        Yields:
+            tuple: (folderpath, result of `parse_folder`), in folderlist order
+        """
+        jobs = max(1, jobs)
+        pending = collections.deque()
+        folders = iter(folderlist)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            # Bounded number of folders in flight, keeps memory flat for huge trees
+            for folderpath in itertools.islice(folders, jobs * 4):
+                pending.append((folderpath, pool.submit(SavegameEnumerator.parse_folder, folderpath)))
+            while pending:
+                folderpath, future = pending.popleft()
+                for next_folderpath in itertools.islice(folders, 1):
+                    pending.append((next_folderpath,
+                                    pool.submit(SavegameEnumerator.parse_folder, next_folderpath)))
+                try:
+                    ret = future.result()
+                except Exception as e:
+                    log.error('Failed to parse folder %s: %s' % (folderpath, e))
+                    ret = None
+                yield folderpath, ret
+
+    def iter_savegame_records(self, folderlist, jobs=DEFAULT_JOBS, keep=False):
+        """
+        Parse folders and yield a flat record per savegame as soon as its folder is parsed
+
+        Args:
+            keep (bool): Also add parsed folders to `savegame_content`,
+                         otherwise nothing is held in memory
+
+        Yields:
+            dict: Savegame entry, see `create_savegame_record`
+        """
+        for folderpath, ret in self.iter_savegamefolders(folderlist, jobs):
             if not ret:
                 continue
-            xuid, guid, index = ret
-            for savegame in index.files:
-                blob = self.parse_savegame(folderpath, savegame)
-                if not blob:
-                    continue
-                savegame_path = self.generate_savegame_path(folderpath, savegame.folder_guid, blob.file_guid)
-                self._save_to_dict(index, savegame, blob, guid, xuid, savegame_path)
+            record = self.create_folder_record(folderpath, ret)
+            if keep:
+                self.folder_records[folderpath] = record
+                self._save_to_dict(record)
+            for savegame in record['savegames']:
+                yield self.create_savegame_record(record, savegame)
+
+    def parse_savegamefolders(self, folderlist, jobs=DEFAULT_JOBS):
+        for folderpath, ret in self.iter_savegamefolders(folderlist, jobs):
+            if not ret:
+                continue
+            record = self.create_folder_record(folderpath, ret)
+            self.folder_records[folderpath] = record
+            self._save_to_dict(record)
         return self.savegame_content
 
+    def update_folders(self, folderpaths, jobs=DEFAULT_JOBS):
+        """
+        Re-parse changed folders, drop vanished ones
+
+        Args:
+            folderpaths (list): Changed folders, e.g. reported by `SavegameWatcher`
+
+        Returns:
+            dict: Delta against the previous content, see `compare_records`
+        """
+        old_records = [self.folder_records.pop(f) for f in folderpaths
+                       if f in self.folder_records]
+        existing = [f for f in folderpaths
+                    if os.path.isfile(self.generate_containerindex_path(f))]
+        new_records = list()
+        for folderpath, ret in self.iter_savegamefolders(existing, jobs):
+            if not ret:
+                continue
+            record = self.create_folder_record(folderpath, ret)
+            self.folder_records[folderpath] = record
+            new_records.append(record)
+
+        self._reset_content()
+        for folderpath in sorted(self.folder_records):
+            self._save_to_dict(self.folder_records[folderpath])
+        return self.compare_records(old_records, new_records)
+
+    @staticmethod
+    def _get_savegame_key(record, savegame):
+        return record['guid'], savegame['xuid'], savegame['folder_guid']
+
+    @staticmethod
+    def create_savegame_record(record, savegame):
+        """
+        Savegame entry, extended by the title fields of its folder record
+        """
+        return dict(savegame, guid=record['guid'], name=record['name'],
+                    aum_id=record['aum_id'], id=record['id'])
+
+    @staticmethod
+    def iter_delta_records(delta):
+        """
+        Yields:
+            dict: Savegame record of delta, extended by 'change' (added, removed, modified)
+        """
+        for change in ('added', 'removed', 'modified'):
+            for entry in delta[change]:
+                yield dict(entry, change=change)
+
+    @staticmethod
+    def compare_records(old_records, new_records):
+        """
+        Compare folder records of two scans
+
+        Returns:
+            dict: 'added', 'removed', 'modified' lists of savegame records,
+                  see `create_savegame_record`
+        """
+        def flatten(records):
+            savegames = dict()
+            for record in records:
+                for savegame in record['savegames']:
+                    entry = SavegameEnumerator.create_savegame_record(record, savegame)
+                    savegames[SavegameEnumerator._get_savegame_key(record, savegame)] = entry
+            return savegames
+
+        old = flatten(old_records)
+        new = flatten(new_records)
+        return {
+            'added': [new[k] for k in new if k not in old],
+            'removed': [old[k] for k in old if k not in new],
+            'modified': [new[k] for k in new if k in old and new[k] != old[k]]
+        }
+
+    def iter_scan_incremental(self, folderlist, snapshot, root=None, jobs=DEFAULT_JOBS,
+                              keep=False):
+        """
+        Like `scan_incremental`, but yields every folder as soon as it is served
+        from the snapshot or parsed. Nothing but the list of changed folders is
+        held in memory unless keep is set.
+
+        Unchanged folders are yielded first, followed by the reparsed ones and
+        finally the vanished ones.
+
+        Args:
+            keep (bool): Add folder records to `folder_records`
+
+        Yields:
+            tuple: (folderpath, record, delta) - record is None for vanished folders,
+                   the previous record for folders that failed to parse.
+                   delta is the folder's delta, see `scan_incremental`
+        """
+        def folder_delta(old_records, new_records, errors=()):
+            delta = self.compare_records(old_records, new_records)
+            delta['errors'] = list(errors)
+            return delta
+
+        present = set()
+        changed = list()
+        for folderpath in folderlist:
+            try:
+                index_stat = os.stat(self.generate_containerindex_path(folderpath))
+            except OSError as e:
+                # Vanished mid-scan, gets pruned below
+                log.warning('Skipping folder %s: %s' % (folderpath, e))
+                continue
+            record = snapshot.lookup(folderpath, index_stat)
+            if record is None:
+                changed.append((folderpath, index_stat))
+                continue
+            present.add(folderpath)
+            if keep:
+                self.folder_records[folderpath] = record
+            yield folderpath, record, folder_delta([], [])
+        log.debug('%i of %i folders changed' % (len(changed), len(folderlist)))
+
+        changed_paths = [folderpath for folderpath, _ in changed]
+        parsed = self.iter_savegamefolders(changed_paths, jobs)
+        for (folderpath, index_stat), (_, ret) in zip(changed, parsed):
+            previous = snapshot.get(folderpath)
+            previous = previous[1] if previous else None
+            if not ret:
+                if not os.path.isfile(self.generate_containerindex_path(folderpath)):
+                    # Index vanished -> removed, snapshot row gets pruned
+                    yield folderpath, None, folder_delta([previous] if previous else [], [])
+                    continue
+                # Parse error, keep previous state
+                if previous is not None:
+                    present.add(folderpath)
+                    if keep:
+                        self.folder_records[folderpath] = previous
+                yield folderpath, previous, folder_delta([], [], [folderpath])
+                continue
+            record = self.create_folder_record(folderpath, ret)
+            snapshot.store(folderpath, record, index_stat)
+            present.add(folderpath)
+            if keep:
+                self.folder_records[folderpath] = record
+            yield folderpath, record, folder_delta([previous] if previous else [], [record])
+
+        stale = snapshot.prune(present, root)
+        snapshot.commit()
+        changed_paths = set(changed_paths)
+        for folderpath in sorted(stale):
+            if folderpath in changed_paths:
+                # Already reported as vanished
+                continue
+            yield folderpath, None, folder_delta([stale[folderpath]], [])
+
+    def scan_incremental(self, folderlist, snapshot, root=None, jobs=DEFAULT_JOBS):
+        """
+        Parse folders whose containers.index changed since the last snapshot,
+        reuse the snapshot records for all others
+
+        A folder whose containers.index vanished is reported as removed. A folder
+        that still has one but fails to parse is reported in 'errors', its
+        previous record (if any) is kept in content and snapshot.
+
+        Args:
+            folderlist (list): Savegame folders
+            snapshot (SavegameSnapshot): Snapshot of the previous scan, gets updated
+            root (str): Scanned directory, folders below it that vanished are removed
+
+        Returns:
+            dict: Delta against the previous scan, see `compare_records`,
+                  extended by 'errors' (list of folderpaths that failed to parse)
+        """
+        delta = {'added': [], 'removed': [], 'modified': [], 'errors': []}
+        for _, _, folder_delta in self.iter_scan_incremental(folderlist, snapshot, root,
+                                                             jobs, keep=True):
+            for change, entries in folder_delta.items():
+                delta[change].extend(entries)
+
+        # Content in folderlist order
+        for folderpath in folderlist:
+            if folderpath in self.folder_records:
+                self._save_to_dict(self.folder_records[folderpath])
+        return delta
+
     @staticmethod
     def get_folderlist(path):
-        filelist = os.listdir(path)
-        if CONTAINERS_INDEX in filelist:
+        path = os.path.abspath(path)
+        if os.path.isfile(os.path.join(path, CONTAINERS_INDEX)):
             # It's explicit savegame path already
-            return list(path)
-        else:
-            # Enumerate all savegame folder in passed dir by checking for CONTAINERS_INDEX
-            filelist = [os.path.abspath(os.path.join(path, f)) for f in filelist]
-            print(filelist)
-            filelist = [f for f in filelist if os.path.exists(os.path.join(f, CONTAINERS_INDEX))]
-            return filelist
+            return [path]
+        # Enumerate all savegame folder in passed dir by checking for CONTAINERS_INDEX
+        folderlist = list()
+        for entry in os.scandir(path):
+            if entry.is_dir() and os.path.isfile(os.path.join(entry.path, CONTAINERS_INDEX)):
+                folderlist.append(entry.path)
+        return sorted(folderlist)
 
-    def get_title_node(self, guid=None, product_id=None, aum_id=None):
-        if not guid and not aum_id:
-            log.error('Need either guid, product_id or aum_id to locate title')
-            return
+    def get_title_guid(self, guid=None, product_id=None, aum_id=None):
         if guid:
-            guid = guid.lower()
-            node = self.savegame_content.get(guid)
+            return guid.lower()
         elif product_id:
-            product_id = product_id.lower()
-            node = next((item for item in self.savegame_content.values() if item['id'] == product_id), None)
+            return self._guid_by_product_id.get(product_id.lower())
         elif aum_id:
-            node = next((item for item in self.savegame_content.values() if item['aum_id'] == aum_id), None)
-        return node
+            return self._guid_by_aum_id.get(aum_id)
+
+    def get_title_node(self, guid=None, product_id=None, aum_id=None):
+        if not guid and not product_id and not aum_id:
+            log.error('Need either guid, product_id or aum_id to locate title')
+            return
+        return self.savegame_content.get(self.get_title_guid(guid, product_id, aum_id))
+
+    def get_savegames(self, guid=None, product_id=None, aum_id=None, xuid=None):
+        """
+        Savegames of a title and/or user, served from the secondary indexes
+
+        Args:
+            guid/product_id/aum_id (str): Title, any of them
+            xuid (int): User, 0 for machine savegames
+
+        Returns:
+            list: Savegame entries, empty if nothing matches
+        """
+        if not guid and not product_id and not aum_id:
+            if xuid is None:
+                log.error('Need either a title or xuid to locate savegames')
+                return []
+            return list(self._savegames_by_xuid.get(int(xuid), []))
+        title_guid = self.get_title_guid(guid, product_id, aum_id)
+        if xuid is not None:
+            return list(self._savegames_by_title_xuid.get((title_guid, int(xuid)), []))
+        node = self.savegame_content.get(title_guid)
+        return list(node['savegames']) if node else []
+
+    def get_export_filesets(self, savegames):
+        """
+        Group savegames by folder, along with the files needed to restore them
+
+        Every fileset contains the folder's containers.index, the container.N blob
+        and the savegame file of each passed savegame.
+
+        Returns:
+            list: ExportFileset, in folder order
+        """
+        filesets = collections.OrderedDict()
+        for savegame in savegames:
+            # {folderpath}/{FOLDER_GUID}/{FILE_GUID}
+            folderpath = os.path.dirname(os.path.dirname(savegame['filepath']))
+            fileset = filesets.get(folderpath)
+            if not fileset:
+                fileset = filesets[folderpath] = ExportFileset(folderpath)
+                fileset.add_file(CONTAINERS_INDEX)
+            blob_path = self.generate_savegameblob_path(
+                folderpath, savegame['folder_guid'], savegame['blob_number'])
+            fileset.add_file(os.path.relpath(blob_path, folderpath))
+            fileset.add_file(os.path.relpath(savegame['filepath'], folderpath))
+            record = self.folder_records.get(folderpath)
+            fileset.savegames.append(
+                self.create_savegame_record(record, savegame) if record else savegame)
+        return list(filesets.values())
+
+    def export_savegames(self, dest, guid=None, product_id=None, aum_id=None, xuid=None,
+                         tar=False, jobs=DEFAULT_JOBS, progress_callback=None):
+        """
+        Export savegames of a title and/or user, everything if no filter is passed
+
+        Args:
+            dest (str/file): Archive directory, tar filepath or binary tar stream
+            guid/product_id/aum_id (str): Title, any of them
+            xuid (int): User, 0 for machine savegames
+            tar (bool): Write tar archive instead of directory
+            jobs (int): Folders copied concurrently, directory export only
+            progress_callback (callable): Called with (copied_bytes, total_bytes)
+
+        Returns:
+            int: Count of copied bytes
+        """
+        if guid or product_id or aum_id or xuid is not None:
+            savegames = self.get_savegames(guid, product_id, aum_id, xuid)
+        else:
+            savegames = [savegame for folderpath in sorted(self.folder_records)
+                         for savegame in self.folder_records[folderpath]['savegames']]
+        filesets = self.get_export_filesets(savegames)
+        log.info('Exporting %i savegames of %i folders' % (len(savegames), len(filesets)))
+        if not tar:
+            return export_to_directory(filesets, dest, jobs, progress_callback)
+        if not isinstance(dest, str):
+            return export_to_tar(filesets, dest, progress_callback)
+        with io.open(dest, 'wb') as f:
+            return export_to_tar(filesets, f, progress_callback)
 
 
 def main():
     parser = argparse.ArgumentParser(description='Enumerate savegame directory')
     parser.add_argument('path', type=str, help='input directory')
     parser.add_argument('--output', help='Json report output (otherwise its stdout)')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS,
+                        help='folders parsed concurrently')
+    parser.add_argument('--snapshot', nargs='?', const=SavegameSnapshot.default_path(),
+                        metavar='PATH',
+                        help='Only reparse folders changed since the last scan, using/updating '
+                             'a snapshot database (default path: %s)' % SavegameSnapshot.default_path())
+    parser.add_argument('--delta', action='store_true',
+                        help='Report added/removed/modified savegames since the last scan')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep watching the directory, report a delta per change')
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT_JSON,
+                        help='Report format, ndjson/msgpack stream one record per savegame')
+    parser.add_argument('--export', metavar='DEST',
+                        help='Export savegames (incl. containers.index) to directory, '
+                             'or tar archive with --tar (- for stdout)')
+    parser.add_argument('--tar', action='store_true', help='Export as tar archive')
+    parser.add_argument('--title', help='Export only this title (guid, product id or aum id)')
+    parser.add_argument('--xuid', type=int, help='Export only savegames of this user')
     args = parser.parse_args()
 
+    if args.delta and not args.snapshot:
+        parser.error('--delta requires --snapshot')
+    if args.export == '-' and (not args.tar or not args.output):
+        parser.error('Export to stdout requires --tar and --output')
+
     if not os.path.exists(args.path):
         log.error("Directory %s does not exist!" % args.path)
         sys.exit(-1)
@@ -189,12 +599,88 @@ def main():
     log.info("Parsing folder: %s" % args.path)
     enumerator = SavegameEnumerator()
     folderlist = enumerator.get_folderlist(args.path)
-    parsed = enumerator.parse_savegamefolders(folderlist)
-    if args.output:
-        with io.open(args.output, 'w') as f:
-            json.dump(parsed, f, indent=2)
-    else:
-        print(json.dumps(parsed, indent=2))
+    streaming = args.format != FORMAT_JSON
+    writer = open_report(args.output, args.format) if streaming else None
+    try:
+        if not args.snapshot:
+            if streaming:
+                for entry in enumerator.iter_savegame_records(
+                        folderlist, args.jobs, args.watch or bool(args.export)):
+                    writer.write(entry)
+            else:
+                parsed = enumerator.parse_savegamefolders(folderlist, args.jobs)
+        else:
+            keep = args.watch or bool(args.export)
+            with SavegameSnapshot(args.snapshot) as snapshot:
+                if streaming:
+                    # Records are written as soon as their folder is served / parsed
+                    counts = collections.Counter()
+                    for _, record, folder_delta in enumerator.iter_scan_incremental(
+                            folderlist, snapshot, args.path, args.jobs, keep):
+                        counts.update(dict((change, len(entries))
+                                           for change, entries in folder_delta.items()))
+                        if args.delta:
+                            for entry in enumerator.iter_delta_records(folder_delta):
+                                writer.write(entry)
+                        elif record:
+                            for savegame in record['savegames']:
+                                writer.write(enumerator.create_savegame_record(record, savegame))
+                    for folderpath in folderlist:
+                        if folderpath in enumerator.folder_records:
+                            enumerator._save_to_dict(enumerator.folder_records[folderpath])
+                else:
+                    delta = enumerator.scan_incremental(folderlist, snapshot, args.path, args.jobs)
+                    counts = dict((change, len(entries)) for change, entries in delta.items())
+                    parsed = delta if args.delta else enumerator.savegame_content
+            log.info('Delta: %i added, %i removed, %i modified, %i failed folders' % (
+                counts['added'], counts['removed'], counts['modified'], counts['errors']))
+
+        if not streaming:
+            if args.output:
+                with io.open(args.output, 'w') as f:
+                    json.dump(parsed, f, indent=2)
+            else:
+                print(json.dumps(parsed, indent=2))
+
+        if args.export:
+            title_guid = None
+            if args.title:
+                title_guid = args.title.lower()
+                if title_guid not in enumerator.savegame_content:
+                    title_guid = enumerator.get_title_guid(product_id=args.title) or \
+                        enumerator.get_title_guid(aum_id=args.title)
+                if not title_guid:
+                    log.error('Title %s not found' % args.title)
+                    sys.exit(-1)
+            dest = sys.stdout.buffer if args.export == '-' else args.export
+            exported = enumerator.export_savegames(dest, guid=title_guid, xuid=args.xuid,
+                                                   tar=args.tar, jobs=args.jobs)
+            log.info('Exported 0x%x bytes to %s' % (exported, args.export))
+
+        if args.watch:
+            # Avoid circular import
+            from durango.hdd.savegame_watcher import SavegameWatcher
+
+            def on_change(folderpaths):
+                delta = enumerator.update_folders(folderpaths, args.jobs)
+                if streaming:
+                    for entry in enumerator.iter_delta_records(delta):
+                        writer.write(entry)
+                else:
+                    print(json.dumps(delta))
+                    sys.stdout.flush()
+
+            watcher = SavegameWatcher(args.path, on_change)
+            log.info('Watching %s (%s), press CTRL+C to stop' % (args.path, watcher.backend))
+            watcher.start()
+            try:
+                while watcher.is_running:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                watcher.stop()
+    finally:
+        if writer:
+            writer.close()
     log.info('Done! Have a nice day')
 
 
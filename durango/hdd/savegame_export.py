@@ -0,0 +1,230 @@
+"""
+Savegame export
+
+Copies savegame folders (containers.index, container.N blobs and the
+referenced savegame files) into an archive directory or a tar stream,
+keeping the on-disk layout so the export can be restored as is.
+
+File data is copied kernel-side via `copy_range` (copy_file_range / sendfile)
+wherever the destination is a regular file. Directory exports run in
+parallel across folders, tar streams are written sequentially.
+
+A manifest (EXPORT_MANIFEST) with the savegame records of every exported
+folder is written alongside the data.
+"""
+
+import io
+import os
+import json
+import stat
+import time
+import shutil
+import tarfile
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from durango.common.fastcopy import copy_file, copy_range
+
+log = logging.getLogger('hdd.savegame_export')
+
+EXPORT_MANIFEST = 'export.json'
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) * 4)
+
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+TAR_RECORD_SIZE = tarfile.RECORDSIZE
+STREAM_CHUNK_SIZE = 0x100000
+
+
+class ExportFileset(object):
+    def __init__(self, folderpath):
+        """
+        Files of a single savegame folder
+
+        Args:
+            folderpath (str): Savegame folder (u_xuid_guid / m_guid)
+        """
+        self.folderpath = folderpath
+        # Paths relative to folderpath
+        self.files = list()
+        self.savegames = list()
+
+    @property
+    def name(self):
+        return os.path.basename(self.folderpath)
+
+    def add_file(self, relpath):
+        if relpath not in self.files:
+            self.files.append(relpath)
+
+    def iter_files(self):
+        """
+        Yields:
+            tuple: (absolute path, path relative to parent of folder, size)
+        """
+        for relpath in self.files:
+            path = os.path.join(self.folderpath, relpath)
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    for filename in sorted(filenames):
+                        filepath = os.path.join(dirpath, filename)
+                        yield filepath, os.path.join(self.name, os.path.relpath(
+                            filepath, self.folderpath)), os.stat(filepath).st_size
+            elif os.path.isfile(path):
+                yield path, os.path.join(self.name, relpath), os.stat(path).st_size
+            else:
+                log.warning('Missing savegame file %s' % path)
+
+
+class _Progress(object):
+    def __init__(self, total, callback):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self._lock = threading.Lock()
+
+    def update(self, size):
+        with self._lock:
+            self.done += size
+            done = self.done
+        if self.callback:
+            self.callback(done, self.total)
+
+
+def _create_manifest(filesets):
+    return {
+        'created': int(time.time()),
+        'folders': dict((fs.name, fs.savegames) for fs in filesets)
+    }
+
+
+def _get_file_list(filesets):
+    return [f for fs in filesets for f in fs.iter_files()]
+
+
+def export_to_directory(filesets, dest_dir, jobs=DEFAULT_JOBS, progress_callback=None):
+    """
+    Copy filesets below dest_dir, folders are exported in parallel
+
+    Args:
+        filesets (list): ExportFileset
+        dest_dir (str): Archive directory
+        progress_callback (callable): Called with (copied_bytes, total_bytes)
+
+    Returns:
+        int: Count of copied bytes
+    """
+    file_lists = [list(fs.iter_files()) for fs in filesets]
+    progress = _Progress(sum(size for files in file_lists for _, _, size in files),
+                         progress_callback)
+
+    def export_fileset(files):
+        for src_path, arcname, size in files:
+            dest_path = os.path.join(dest_dir, arcname)
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            copied = copy_file(src_path, dest_path)
+            if copied != size:
+                raise Exception('Short copy for %s: 0x%x of 0x%x bytes' % (
+                    src_path, copied, size))
+            shutil.copystat(src_path, dest_path)
+            progress.update(size)
+
+    os.makedirs(dest_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        # Raise first error
+        list(pool.map(export_fileset, file_lists))
+
+    with io.open(os.path.join(dest_dir, EXPORT_MANIFEST), 'w') as f:
+        json.dump(_create_manifest(filesets), f, indent=2)
+    return progress.done
+
+
+class TarStreamWriter(object):
+    def __init__(self, fileobj):
+        """
+        Minimal, sequential tar writer
+
+        Member data is copied kernel-side if fileobj is a seekable, regular file,
+        otherwise (pipes, sockets, BytesIO) it is streamed in chunks.
+        """
+        self.fileobj = fileobj
+        self.written = 0
+        self._fd = None
+        try:
+            fd = fileobj.fileno()
+            if stat.S_ISREG(os.fstat(fd).st_mode) and fileobj.seekable():
+                self._fd = fd
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.written += len(data)
+
+    def _pad(self, size, blocksize=TAR_BLOCK_SIZE):
+        remainder = size % blocksize
+        if remainder:
+            self._write(b'\x00' * (blocksize - remainder))
+
+    def add_file(self, src_path, arcname, size):
+        stat_result = os.stat(src_path)
+        info = tarfile.TarInfo(arcname)
+        info.size = size
+        info.mtime = int(stat_result.st_mtime)
+        info.mode = 0o644
+        self._write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+
+        with io.open(src_path, 'rb') as src:
+            if self._fd is not None:
+                self.fileobj.flush()
+                offset = self.fileobj.tell()
+                copied = copy_range(src.fileno(), self._fd, 0, size, offset)
+                self.fileobj.seek(offset + copied)
+                self.written += copied
+            else:
+                copied = 0
+                for chunk in iter(lambda: src.read(min(STREAM_CHUNK_SIZE, size - copied)), b''):
+                    self._write(chunk)
+                    copied += len(chunk)
+        if copied != size:
+            raise Exception('Short copy for %s: 0x%x of 0x%x bytes' % (src_path, copied, size))
+        self._pad(size)
+
+    def add_bytes(self, data, arcname):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self._write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        self._write(data)
+        self._pad(len(data))
+
+    def close(self):
+        # End of archive: two empty blocks, padded to full record
+        self._write(b'\x00' * TAR_BLOCK_SIZE * 2)
+        self._pad(self.written, TAR_RECORD_SIZE)
+        self.fileobj.flush()
+
+
+def export_to_tar(filesets, fileobj, progress_callback=None):
+    """
+    Write filesets as tar stream
+
+    Args:
+        filesets (list): ExportFileset
+        fileobj (file): Binary output stream
+        progress_callback (callable): Called with (copied_bytes, total_bytes)
+
+    Returns:
+        int: Count of copied file bytes
+    """
+    files = _get_file_list(filesets)
+    progress = _Progress(sum(size for _, _, size in files), progress_callback)
+    writer = TarStreamWriter(fileobj)
+    for src_path, arcname, size in files:
+        writer.add_file(src_path, arcname, size)
+        progress.update(size)
+    manifest = json.dumps(_create_manifest(filesets), indent=2).encode('utf-8')
+    writer.add_bytes(manifest, EXPORT_MANIFEST)
+    writer.close()
+    return progress.done
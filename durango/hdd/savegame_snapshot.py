@@ -0,0 +1,101 @@
+"""
+Persistent savegame folder snapshot
+
+Stores the parsed content of every savegame folder in a SQLite database,
+keyed by the (size, mtime_ns, inode) of its containers.index. A re-scan
+only re-parses folders whose containers.index changed, comparing old and
+new records yields the added/removed/modified savegames.
+
+Invalidation rules:
+    - size, mtime_ns or inode of containers.index differ -> folder gets reparsed
+    - folder is not part of a scan anymore -> entry is removed by `prune`
+    - SNAPSHOT_VERSION differs from the database version -> snapshot is dropped
+"""
+
+import os
+import json
+import logging
+
+from durango.common.sqlite_cache import SqliteCache
+
+log = logging.getLogger('hdd.savegame_snapshot')
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILENAME = 'savegame_snapshot.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS savegame_folder (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    record TEXT NOT NULL
+)
+'''
+
+
+class SavegameSnapshot(SqliteCache):
+    filename = SNAPSHOT_FILENAME
+    table = 'savegame_folder'
+    schema = SCHEMA
+    version = SNAPSHOT_VERSION
+
+    def get(self, folderpath):
+        """
+        Get stored record of folder, regardless of it being stale
+
+        Returns:
+            tuple: (stat key, record) or None if folder is not part of snapshot
+        """
+        row = self._db.execute(
+            'SELECT size, mtime_ns, inode, record FROM savegame_folder WHERE path=?',
+            (os.path.abspath(folderpath),)
+        ).fetchone()
+        if not row:
+            return None
+        return tuple(row[:3]), json.loads(row[3])
+
+    def lookup(self, folderpath, stat_result):
+        """
+        Get record of folder if its containers.index is unchanged
+
+        Args:
+            folderpath (str): Savegame folder
+            stat_result (os.stat_result): Stat of containers.index
+
+        Returns:
+            dict: Folder record or None if not part of snapshot / stale
+        """
+        entry = self.get(folderpath)
+        if not entry or entry[0] != self.stat_key(folderpath, stat_result):
+            return None
+        return entry[1]
+
+    def store(self, folderpath, record, stat_result):
+        """
+        Add or replace folder record
+
+        Args:
+            folderpath (str): Savegame folder
+            record (dict): JSON serializable folder record
+            stat_result (os.stat_result): Stat of containers.index at time of parsing
+        """
+        size, mtime_ns, inode = self.stat_key(folderpath, stat_result)
+        self._db.execute(
+            'INSERT OR REPLACE INTO savegame_folder VALUES (?, ?, ?, ?, ?)',
+            (os.path.abspath(folderpath), size, mtime_ns, inode, json.dumps(record))
+        )
+
+    def prune(self, folderpaths, root=None):
+        """
+        Remove entries that are not part of passed folderlist
+
+        Args:
+            folderpaths (list): Folders that are still present
+            root (str): Only consider entries below this directory
+
+        Returns:
+            dict: folderpath -> record of removed entries
+        """
+        return dict((path, json.loads(record)) for path, record in
+                    self.prune_rows(folderpaths, root, columns=('record',)))
@@ -0,0 +1,188 @@
+"""
+Savegame directory watcher
+
+Reports savegame folders whose containers.index or container blobs
+changed, so parsed content can be updated per folder instead of
+re-walking the whole directory.
+
+Backends:
+    - inotify (Linux), needs the optional `inotify_simple` package
+    - polling, compares the stat of every containers.index each interval.
+      Blob changes without an index update are not detected.
+
+The callback is invoked from the watcher thread with a sorted list of
+changed folder paths. Folders that vanished are reported as well.
+"""
+
+import os
+import logging
+import threading
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+from durango.fileformat.savegame_container import CONTAINERS_INDEX
+from durango.hdd.savegame_enum import SavegameEnumerator
+
+log = logging.getLogger('hdd.savegame_watcher')
+
+BACKEND_INOTIFY = 'inotify'
+BACKEND_POLL = 'poll'
+
+# Seconds between polls / stop checks
+POLL_INTERVAL = 2.0
+# Milliseconds to collect further inotify events after the first one
+DEBOUNCE_DELAY = 200
+
+CONTAINER_BLOB_PREFIX = 'container.'
+
+
+def get_default_backend():
+    return BACKEND_INOTIFY if inotify_simple else BACKEND_POLL
+
+
+class SavegameWatcher(object):
+    def __init__(self, root, callback, interval=POLL_INTERVAL, backend=None):
+        """
+        Watch savegame directory
+
+        Args:
+            root (str): Savegame directory or a single savegame folder
+            callback (callable): Called with list of changed folderpaths
+            interval (float): Poll interval in seconds
+            backend (str): BACKEND_INOTIFY or BACKEND_POLL, default: inotify if available
+        """
+        self.root = os.path.abspath(root)
+        self.callback = callback
+        self.interval = interval
+        self.backend = backend or get_default_backend()
+        if self.backend == BACKEND_INOTIFY and not inotify_simple:
+            raise Exception('inotify backend requires the inotify_simple package')
+        # Root is a savegame folder itself
+        self.is_single_folder = os.path.isfile(os.path.join(self.root, CONTAINERS_INDEX))
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        target = self._run_inotify if self.backend == BACKEND_INOTIFY else self._run_poll
+        self._thread = threading.Thread(target=target, name='SavegameWatcher', daemon=True)
+        self._thread.start()
+        log.debug('Watching %s (%s)' % (self.root, self.backend))
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def get_folder(self, path):
+        """
+        Map path below root to its savegame folder
+
+        Returns:
+            str: Folderpath or None if path is root itself
+        """
+        if self.is_single_folder:
+            return self.root
+        relpath = os.path.relpath(path, self.root)
+        if relpath in (os.curdir, os.pardir) or relpath.startswith(os.pardir + os.sep):
+            return None
+        return os.path.join(self.root, relpath.split(os.sep)[0])
+
+    @staticmethod
+    def is_relevant_file(filename):
+        return filename == CONTAINERS_INDEX or filename.startswith(CONTAINER_BLOB_PREFIX)
+
+    def _notify(self, folderpaths):
+        if not folderpaths:
+            return
+        folderpaths = sorted(folderpaths)
+        log.debug('Changed folders: %s' % folderpaths)
+        try:
+            self.callback(folderpaths)
+        except Exception as e:
+            log.error('Watcher callback failed: %s' % e)
+
+    def _get_index_stats(self):
+        stats = dict()
+        for folderpath in SavegameEnumerator.get_folderlist(self.root):
+            try:
+                stat_result = os.stat(SavegameEnumerator.generate_containerindex_path(folderpath))
+            except FileNotFoundError:
+                continue
+            stats[folderpath] = (stat_result.st_size, stat_result.st_mtime_ns,
+                                 stat_result.st_ino)
+        return stats
+
+    def _run_poll(self):
+        previous = self._get_index_stats()
+        while not self._stop_event.wait(self.interval):
+            try:
+                current = self._get_index_stats()
+            except OSError as e:
+                log.error('Polling %s failed: %s' % (self.root, e))
+                continue
+            changed = set(f for f in set(previous) | set(current)
+                          if previous.get(f) != current.get(f))
+            previous = current
+            self._notify(changed)
+
+    def _run_inotify(self):
+        flags = inotify_simple.flags
+        mask = flags.CREATE | flags.DELETE | flags.CLOSE_WRITE | \
+            flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE_SELF
+        inotify = inotify_simple.INotify()
+        watches = dict()
+
+        def add_watch(dirpath, recursive=False):
+            try:
+                watches[inotify.add_watch(dirpath, mask)] = dirpath
+                if recursive:
+                    for entry in os.scandir(dirpath):
+                        if entry.is_dir():
+                            add_watch(entry.path, recursive)
+            except OSError as e:
+                log.debug('Cannot watch %s: %s' % (dirpath, e))
+
+        # Root, savegame folders and their {GUID} subfolders
+        add_watch(self.root, recursive=True)
+        try:
+            while not self._stop_event.is_set():
+                events = inotify.read(timeout=int(self.interval * 1000),
+                                      read_delay=DEBOUNCE_DELAY)
+                changed = set()
+                for event in events:
+                    dirpath = watches.get(event.wd)
+                    if event.mask & flags.IGNORED:
+                        watches.pop(event.wd, None)
+                        continue
+                    if dirpath is None:
+                        continue
+                    path = os.path.join(dirpath, event.name)
+                    if event.mask & flags.ISDIR:
+                        if event.mask & (flags.CREATE | flags.MOVED_TO):
+                            add_watch(path, recursive=True)
+                    elif not self.is_relevant_file(event.name):
+                        continue
+                    folderpath = self.get_folder(path)
+                    if folderpath:
+                        changed.add(folderpath)
+                self._notify(changed)
+        finally:
+            inotify.close()
@@ -0,0 +1,99 @@
+"""
+Persistent XVD header index
+
+Caches parsed XVD headers in a SQLite database, keyed by
+(path, size, mtime_ns, inode). Unchanged packages are served
+from the index without touching the file itself.
+
+Invalidation rules:
+    - size, mtime_ns or inode of a file differ -> entry is stale, file gets reparsed
+    - file is not part of a scan anymore -> entry is removed by `prune`
+    - INDEX_VERSION differs from the database version -> index is dropped
+"""
+
+import os
+import logging
+
+from durango.common.sqlite_cache import SqliteCache
+from durango.fileformat.xvd import XvdFastHeader, XVD_MAGIC
+
+log = logging.getLogger('hdd.xvd_index')
+
+INDEX_VERSION = 1
+INDEX_FILENAME = 'xvd_index.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS xvd_header (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    content_type INTEGER NOT NULL,
+    content_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    build_id TEXT NOT NULL,
+    package_version INTEGER NOT NULL,
+    header BLOB NOT NULL
+)
+'''
+
+
+class XvdHeaderIndex(SqliteCache):
+    filename = INDEX_FILENAME
+    table = 'xvd_header'
+    schema = SCHEMA
+    version = INDEX_VERSION
+
+    def lookup(self, filepath, stat_result=None):
+        """
+        Get cached header for file
+
+        Args:
+            filepath (str): Path to XVD file
+            stat_result (os.stat_result): Stat of file, queried if not passed
+
+        Returns:
+            XvdFastHeader: Cached header or None if not indexed / stale
+        """
+        size, mtime_ns, inode = self.stat_key(filepath, stat_result)
+        row = self._db.execute(
+            'SELECT header FROM xvd_header WHERE path=? AND size=? AND mtime_ns=? AND inode=?',
+            (os.path.abspath(filepath), size, mtime_ns, inode)
+        ).fetchone()
+        if not row:
+            return None
+        header = XvdFastHeader(row[0])
+        if header.magic != XVD_MAGIC:
+            log.warning('Corrupt index entry for %s' % filepath)
+            return None
+        return header
+
+    def store(self, filepath, header, stat_result=None):
+        """
+        Add or replace index entry for file
+
+        Args:
+            filepath (str): Path to XVD file
+            header (XvdFastHeader): Parsed header
+            stat_result (os.stat_result): Stat of file at time of parsing
+        """
+        size, mtime_ns, inode = self.stat_key(filepath, stat_result)
+        self._db.execute(
+            'INSERT OR REPLACE INTO xvd_header VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(filepath), size, mtime_ns, inode, header.content_type,
+             str(header.content_id), str(header.product_id), str(header.build_id),
+             header.package_version, header.pack())
+        )
+
+    def prune(self, filepaths, root=None):
+        """
+        Remove entries that are not part of passed filelist
+
+        Args:
+            filepaths (list): Paths that are still present
+            root (str): Only consider entries below this directory
+
+        Returns:
+            int: Count of removed entries
+        """
+        return len(self.prune_rows(filepaths, root))
@@ -0,0 +1,145 @@
+"""
+Parallel XVD header scanner
+
+Fans header reads out over a thread pool (I/O bound, e.g. USB drives)
+or a process pool (CPU bound parsing) and streams results back in
+completion order. Optionally serves unchanged files from a
+`XvdHeaderIndex`.
+"""
+
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from durango.fileformat.xvd import XvdFile
+
+log = logging.getLogger('hdd.xvd_scanner')
+
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+EXECUTOR_TYPES = [EXECUTOR_THREAD, EXECUTOR_PROCESS]
+
+# Files handed to a process worker at once, keeps IPC overhead low
+PROCESS_CHUNK_SIZE = 16
+# Newly parsed headers stored to the index between commits
+INDEX_COMMIT_INTERVAL = 64
+
+
+def parse_xvd_header(filepath):
+    """
+    Parse the header of a single XVD file
+
+    Returns:
+        tuple: (filepath, header, error), header is None on failure
+    """
+    try:
+        xvd = XvdFile(filepath)
+    except Exception as e:
+        return filepath, None, str(e)
+    return filepath, xvd.header, None
+
+
+def _parse_xvd_header_chunk(filepaths):
+    return [parse_xvd_header(f) for f in filepaths]
+
+
+class XvdScanner(object):
+    def __init__(self, jobs=1, executor=EXECUTOR_THREAD, index=None):
+        """
+        Scanner for XVD headers
+
+        Args:
+            jobs (int): Number of workers, 1 -> parse serially
+            executor (str): One of EXECUTOR_TYPES
+            index (XvdHeaderIndex): Header index to serve unchanged files from
+        """
+        if executor not in EXECUTOR_TYPES:
+            raise ValueError('Invalid executor type: %s' % executor)
+        self.jobs = max(1, jobs)
+        self.executor = executor
+        self.index = index
+
+    @staticmethod
+    def _chunks(seq, size):
+        return (seq[pos:pos + size] for pos in range(0, len(seq), size))
+
+    def _scan_serial(self, filelist):
+        for filepath in filelist:
+            yield parse_xvd_header(filepath)
+
+    def _scan_threaded(self, filelist):
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [pool.submit(parse_xvd_header, f) for f in filelist]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _scan_processes(self, filelist):
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [pool.submit(_parse_xvd_header_chunk, chunk)
+                       for chunk in self._chunks(filelist, PROCESS_CHUNK_SIZE)]
+            for future in as_completed(futures):
+                for result in future.result():
+                    yield result
+
+    def _lookup_index(self, filelist, stats):
+        """
+        Split filelist into indexed headers and files that need parsing
+        """
+        cached = list()
+        pending = list()
+        for filepath in filelist:
+            try:
+                stat_result = os.stat(filepath)
+            except OSError as e:
+                log.error('Cannot stat file: %s, Error: %s' % (filepath, e))
+                continue
+            header = self.index.lookup(filepath, stat_result)
+            if header:
+                cached.append((filepath, header))
+                continue
+            stats[filepath] = stat_result
+            pending.append(filepath)
+        return cached, pending
+
+    def scan(self, filelist):
+        """
+        Parse headers of all passed files
+
+        Invalid files are logged and skipped. If an index is set,
+        unchanged files are yielded first, straight from the index.
+
+        Args:
+            filelist (list): Filepaths to parse
+
+        Yields:
+            tuple: (filepath, header) in order of completion
+        """
+        filelist = list(filelist)
+        stats = dict()
+        if self.index:
+            cached, filelist = self._lookup_index(filelist, stats)
+            log.debug('Index: %i cached, %i to parse' % (len(cached), len(filelist)))
+            for result in cached:
+                yield result
+
+        if self.jobs == 1 or len(filelist) < 2:
+            results = self._scan_serial(filelist)
+        elif self.executor == EXECUTOR_PROCESS:
+            results = self._scan_processes(filelist)
+        else:
+            results = self._scan_threaded(filelist)
+
+        stored = 0
+        for filepath, header, error in results:
+            if error:
+                log.error('Invalid file: %s, Error: %s' % (filepath, error))
+                continue
+            if self.index:
+                self.index.store(filepath, header, stats[filepath])
+                stored += 1
+                if stored % INDEX_COMMIT_INTERVAL == 0:
+                    self.index.commit()
+            yield filepath, header
+
+        if self.index:
+            self.index.commit()
@@ -12,14 +12,23 @@ Credits:
 import io
 import os
 import sys
+import mmap
+import json
 import logging
 import hashlib
 import argparse
+from binascii import hexlify
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 from construct import Int8ul, Int16ul
 from construct import Int32ul, Int64ul
 from construct import Bytes, Array, Padding, Struct
 from durango.common.adapters import UUIDAdapter
+from durango.common.blobstore import ContentStore, ExtractionManifest
+from durango.common.fastcopy import copy_range
+from durango.fileformat.xvd import XvdFile, XvdContentType
+from durango.nand.blockmap import BlockMap
+from durango.nand.update_config import DurangoUpdateCfg
 
 logging.basicConfig(format='[%(levelname)s] - %(name)s - %(message)s', level=logging.DEBUG)
 log = logging.getLogger('nand_one')
@@ -31,6 +40,9 @@ FLASH_SIZE_LOG = 0x13BC00000
 FLASH_SIZE_RAW = 0x13C000000
 LOG_BLOCK_SZ = 0x1000
 
+DUMP_TYPE_LOGICAL = "LOGICAL"
+DUMP_TYPE_RAW = "RAW"
+
 HEADER_SIZE = 1024
 # Reverse magic
 HEADER_MAGIC = b'XBFS'[::-1]
@@ -41,10 +53,14 @@ HEADER_OFFSETS = [0x10000, 0x810000, 0x820000]
 
 GUID_SIZE = 16
 
+# Threads hashing XBFS files during validation
+DEFAULT_HASH_JOBS = os.cpu_count() or 1
+
 UPDATE_CONFIG_FILE = "update.cfg"
 
 XVD_MAGIC = 'msft-xvd'
 XVD_MAGIC_START = 0x200
+XVD_FILE_EXTENSION = '.xvd'
 
 FLASH_FILES_COUNT = 25
 FlashFiles = [
@@ -98,23 +114,79 @@ FlashHeader = Struct(
 )
 
 class DurangoNand(object):
-    def __init__(self, filename):
+    def __init__(self, filename, logical_view=False):
+        """
+        Args:
+            filename (str): Nanddump filepath
+            logical_view (bool): Access RAW dumps through their logical layout,
+                                 without converting them on disk
+        """
         # offset : sequence_version
         self.header_offsets = dict()
+        # sequence_version : computed header hash
+        self.header_hashes = dict()
         self.xbfs_tables = list()
         self.is_valid = True
         self.dump_type = None
         self.filename = filename
+        self._file = None
+        self._mmap = None
+        self._view = None
+        self._block_map = None
         self.filesize = os.stat(self.filename).st_size
         # Run minimal verification
         if self.filesize == FLASH_SIZE_LOG:
-            self.dump_type = "RAW"
+            self.dump_type = DUMP_TYPE_LOGICAL
         elif self.filesize == FLASH_SIZE_RAW:
-            self.dump_type = "LOGICAL"
+            self.dump_type = DUMP_TYPE_RAW
         else:
             raise Exception("ERROR: Invalid filesize! Expected: 0x%08x or 0x%08x, Got: 0x%08x" % (
                 FLASH_SIZE_LOG, FLASH_SIZE_RAW, self.filesize))
-        self.blocks = self.size_to_log_block(self.filesize)
+        self.logical_view = logical_view
+        # Accessible size, the logical layout is a prefix of the raw one
+        self.data_size = FLASH_SIZE_LOG if logical_view else self.filesize
+        self.blocks = self.size_to_log_block(self.data_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_mapped(self):
+        return self._mmap is not None
+
+    def open(self):
+        """
+        Map dump into memory (read-only), mapping is reused for all reads
+        """
+        if self.is_mapped:
+            return
+        self._file = io.open(self.filename, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            self._file = None
+            raise
+        view = memoryview(self._mmap)
+        self._view = view[:self.data_size]
+        view.release()
+
+    def close(self):
+        """
+        Unmap dump, all memoryviews handed out need to be released beforehand
+        """
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file:
+            self._file.close()
+            self._file = None
 
     @property
     def tables(self):
@@ -148,19 +220,20 @@ class DurangoNand(object):
     def size_to_log_block(value):
         return int(value / LOG_BLOCK_SZ)
 
+    @property
+    def block_map(self):
+        """
+        Block occupancy of all parsed XBFS tables, computed once per parse
+        """
+        if self._block_map is None:
+            self._block_map = BlockMap.from_tables(self.blocks, self.xbfs_tables, FlashFiles)
+        return self._block_map
+
     def get_used_blockcount(self):
-        used_blocks = list()
-        files = [table.files for table in self.xbfs_tables]
-        for container in files:
-            for f in container:
-                block_range = range(f.offset, f.offset + f.size)
-                used_blocks.extend(block_range)
-        #remove duplicates
-        used_blocks = list(set(used_blocks))
-        return len(used_blocks)
+        return self.block_map.used_blockcount
 
     def get_free_blockcount(self):
-        return self.blocks - self.get_used_blockcount()
+        return self.block_map.free_blockcount
 
     def get_header_rawoffset(self, seq_version):
         return self.header_offsets[seq_version]
@@ -211,29 +284,169 @@ class DurangoNand(object):
             return
         return entry
 
-    def read_file_from_xbfs(self, filename, table):
+    def get_file_range(self, filename, table):
+        """
+        Returns:
+            tuple: (offset, size) in bytes or None if file is not present
+        """
         entry = self.get_xbfs_fileentry_by_name(filename, table)
         if not entry:
             return
         offset = self.log_block_to_size(entry.offset)
         size = self.log_block_to_size(entry.size)
-        with io.open(self.filename, "rb") as f:
-            f.seek(offset)
-            return f.read(size)
+        if offset + size > self.data_size:
+            log.error("File %s exceeds dump size (0x%x+0x%x)" % (filename, offset, size))
+            return
+        return offset, size
+
+    def get_file_view(self, filename, table):
+        """
+        Zero-copy access to a XBFS file
+
+        Returns:
+            memoryview: Slice of the mapped dump or None if file is not present
+        """
+        file_range = self.get_file_range(filename, table)
+        if not file_range:
+            return
+        offset, size = file_range
+        self.open()
+        return self._view[offset:offset + size]
+
+    def read_file_from_xbfs(self, filename, table):
+        return self.get_file_view(filename, table)
+
+    def is_header_hash_valid(self, table):
+        return self.header_hashes.get(table.sequence_version) == table.hash
+
+    def _hash_range(self, file_range):
+        offset, size = file_range
+        view = self._view[offset:offset + size]
+        try:
+            return hexlify(self.hash(view)).decode('utf-8')
+        finally:
+            view.release()
+
+    def validate(self, jobs=DEFAULT_HASH_JOBS):
+        """
+        Check header hashes and SHA-256 all files of all XBFS tables
+
+        Identical file ranges shared between tables are hashed once,
+        hashing runs in a thread pool on the mapped dump.
+
+        Returns:
+            dict: JSON serializable validation report
+        """
+        self.open()
+        # (offset, size) -> [(sequence_version, filename)]
+        ranges = dict()
+        for table in self.xbfs_tables:
+            for filename, offset, size in self.get_filelist(table):
+                file_range = (self.log_block_to_size(offset), self.log_block_to_size(size))
+                if file_range[0] + file_range[1] > self.data_size:
+                    log.error("File %s (seq %i) exceeds dump size" % (
+                        filename, table.sequence_version))
+                    continue
+                ranges.setdefault(file_range, list()).append((table.sequence_version, filename))
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            digests = dict(zip(ranges, pool.map(self._hash_range, ranges)))
+
+        files = dict()
+        for file_range, owners in ranges.items():
+            for sequence_version, filename in owners:
+                files.setdefault(filename, dict())[sequence_version] = digests[file_range]
+
+        sequences = self.get_xbfs_sequence_list()
+        differing = list()
+        missing = dict()
+        for filename in FlashFiles:
+            hashes = files.get(filename)
+            if not hashes:
+                continue
+            if len(set(hashes.values())) > 1:
+                differing.append(filename)
+            absent = [seq for seq in sequences if seq not in hashes]
+            if absent:
+                missing[filename] = absent
+
+        return {
+            'headers': [{'sequence_version': table.sequence_version,
+                         'header_offset': self.get_header_rawoffset(table.sequence_version),
+                         'hash_valid': self.is_header_hash_valid(table)}
+                        for table in self.xbfs_tables],
+            'files': dict((name, dict((str(seq), digest) for seq, digest in hashes.items()))
+                          for name, hashes in files.items()),
+            'differing_files': differing,
+            'missing_files': dict((name, seqs) for name, seqs in missing.items())
+        }
+
+    def generate_validation_details(self, report):
+        text = 'Validation\n\n'
+        for header in report['headers']:
+            text += 'XBFS seq %03i @ 0x%X: header hash %s\n' % (
+                header['sequence_version'], header['header_offset'],
+                'valid' if header['hash_valid'] else 'INVALID')
+        text += 'Files differing between sequences: %s\n' % (
+            ', '.join(report['differing_files']) or 'none')
+        for filename in report['differing_files']:
+            for seq, digest in sorted(report['files'][filename].items(), key=lambda i: int(i[0])):
+                text += '  %s seq %s: %s\n' % (filename, seq, digest)
+        for filename, seqs in report['missing_files'].items():
+            text += 'File %s missing in sequences: %s\n' % (filename, seqs)
+        return text
 
     def generate_overview_details(self):
         used_blocks = self.get_used_blockcount()
         free_blocks = self.get_free_blockcount()
+        free_extents = self.block_map.free_extents
+        largest_free = max([end - start for start, end in free_extents] or [0])
         used_space = self.log_block_to_size(used_blocks)
         free_space = self.log_block_to_size(free_blocks)
         text = 'General info\n\n'
-        text += 'Dump Type: %s\n' % self.dump_type
+        text += 'Dump Type: %s%s\n' % (self.dump_type,
+                                       ' (logical view)' if self.logical_view else '')
         text += 'Blockcount: 0x%X\n' % self.total_blocks
         text += 'Total size: 0x%X (%i MB)\n' % (self.filesize, self.filesize / 1024 / 1024)
         text += 'Blocks used: 0x%X (%i MB)\n' % (used_blocks,  used_space / 1024 / 1024)
         text += 'Blocks free: 0x%X (%i MB)\n' % (free_blocks,  free_space / 1024 / 1024)
+        text += 'Free extents: %i (largest: 0x%X blocks)\n' % (len(free_extents), largest_free)
+        text += 'Overlapping extents: %i\n' % len(self.block_map.get_overlaps())
         return text
 
+    def generate_summary(self):
+        """
+        Machine readable summary of the dump
+
+        Returns:
+            dict: JSON serializable summary
+        """
+        used_blocks = self.get_used_blockcount()
+        tables = list()
+        for table in self.xbfs_tables:
+            tables.append({
+                'header_offset': self.get_header_rawoffset(table.sequence_version),
+                'format_version': table.format_version,
+                'sequence_version': table.sequence_version,
+                'layout_version': table.layout_version,
+                'guid': str(table.guid),
+                'files': [{'name': name,
+                           'offset': self.log_block_to_size(offset),
+                           'size': self.log_block_to_size(size)}
+                          for name, offset, size in self.get_filelist(table)]
+            })
+        return {
+            'filename': self.filename,
+            'dump_type': self.dump_type,
+            'filesize': self.filesize,
+            'total_blocks': self.total_blocks,
+            'used_blocks': used_blocks,
+            'free_blocks': self.total_blocks - used_blocks,
+            'sequence_versions': self.get_xbfs_sequence_list(),
+            'latest_sequence_version': self.get_latest_sequence_version(),
+            'tables': tables
+        }
+
     def generate_xbfs_details(self, table):
         header_offset = self.get_header_rawoffset(table.sequence_version)
         text = 'Xbox Boot Filesystem\n\n'
@@ -264,44 +477,301 @@ class DurangoNand(object):
             )
         return text
 
-    def extract_files_from_table(self, table, dest_dir):
+    def get_update_config(self, table):
+        """
+        Returns:
+            dict: Decoded update.cfg of table or None if file is not present
+        """
+        view = self.get_file_view(UPDATE_CONFIG_FILE, table)
+        if view is None:
+            return
+        try:
+            return DurangoUpdateCfg(view).parse()
+        finally:
+            view.release()
+
+    def get_update_history(self):
+        """
+        update.cfg of every XBFS table, ordered by sequence version
+
+        Returns:
+            list: JSON serializable dict per table, holds 'error' key if decoding failed
+        """
+        history = list()
+        for table in sorted(self.xbfs_tables, key=lambda t: t.sequence_version):
+            entry = {'sequence_version': table.sequence_version}
+            try:
+                record = self.get_update_config(table)
+            except Exception as e:
+                entry['error'] = str(e)
+            else:
+                if record is None:
+                    continue
+                entry.update(record)
+            history.append(entry)
+        return history
+
+    def get_xvd_filelist(self, table):
+        return [f for f in self.get_filelist(table) if f[0].endswith(XVD_FILE_EXTENSION)]
+
+    def get_xvd_file(self, filename, table):
+        """
+        Parse XVD embedded in a XBFS file in place, without extracting it
+
+        Only the pages actually read are faulted in from the mapped dump.
+
+        Returns:
+            XvdFile: Backed by a memoryview of the dump, close() it before
+                     closing the dump. None if file is not present
+        """
+        view = self.get_file_view(filename, table)
+        if view is None:
+            return
+        try:
+            return XvdFile.from_buffer(view, name=filename)
+        finally:
+            view.release()
+
+    def generate_xvd_summary(self, table):
+        """
+        Header info of all embedded XVDs of a XBFS table
+
+        Returns:
+            list: JSON serializable dict per XVD, holds 'error' key if parsing failed
+        """
+        xvds = list()
+        for filename, offset, size in self.get_xvd_filelist(table):
+            entry = {'name': filename,
+                     'offset': self.log_block_to_size(offset),
+                     'size': self.log_block_to_size(size)}
+            try:
+                xvd = self.get_xvd_file(filename, table)
+            except Exception as e:
+                entry['error'] = str(e)
+                xvds.append(entry)
+                continue
+            if xvd is None:
+                continue
+            with xvd:
+                header = xvd.header
+                entry.update({
+                    'content_type': XvdContentType.get_string_for_value(header.content_type),
+                    'xvd_type': str(header.xvd_type),
+                    'content_id': str(header.content_id),
+                    'drive_size': header.drive_size,
+                    'format_version': header.format_version,
+                    'sequence_number': header.sequence_number,
+                    'package_version': header.package_version,
+                    'encrypted': xvd.is_encrypted,
+                    'data_integrity': xvd.is_dataintegrity_enabled
+                })
+            xvds.append(entry)
+        return xvds
+
+    def generate_xvd_details(self, table):
+        text = 'Embedded XVDs\n\n'
+        for entry in self.generate_xvd_summary(table):
+            if 'error' in entry:
+                text += '%s: %s\n' % (entry['name'], entry['error'])
+                continue
+            text += '%s: %s, %s, content id: %s, drive size: 0x%x, seq: %i%s\n' % (
+                entry['name'], entry['content_type'], entry['xvd_type'], entry['content_id'],
+                entry['drive_size'], entry['sequence_number'],
+                ', encrypted' if entry['encrypted'] else '')
+        return text
+
+    def extract_file(self, filename, table, dest_path, store=None):
+        """
+        Extract single XBFS file, copied kernel-side from the dump fd
+
+        Args:
+            filename (str): Name of file in FlashFiles
+            table (Container): XBFS table
+            dest_path (str): Output filepath
+            store (ContentStore): Deduplicate file through blob store
+
+        Returns:
+            tuple: (sha256 hexdigest or None, size) or None if file is not present
+        """
+        file_range = self.get_file_range(filename, table)
+        if not file_range:
+            return
+        offset, size = file_range
+        self.open()
+        src_fd = self._file.fileno()
+        if store:
+            view = self._view[offset:offset + size]
+            digest = store.hash(view)
+            view.release()
+            store.put_range(src_fd, offset, size, digest)
+            store.link_into(digest, dest_path)
+            return digest, size
+
+        with io.open(dest_path, 'wb') as dest:
+            copied = copy_range(src_fd, dest.fileno(), offset, size)
+        if copied != size:
+            raise Exception("Short copy for %s: 0x%x of 0x%x bytes" % (filename, copied, size))
+        return None, size
+
+    def extract_files_from_table(self, table, dest_dir, store=None):
+        """
+        Extract all files of a XBFS table
+
+        Args:
+            table (Container): XBFS table
+            dest_dir (str): Output directory
+            store (ContentStore): Deduplicate files through blob store,
+                writes a manifest into dest_dir
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        manifest = ExtractionManifest(self.filename) if store else None
         for filename in FlashFiles:
-            data = self.read_file_from_xbfs(filename, table)
-            if not data:
+            if not self.get_file_range(filename, table):
                 continue
             log.info("Extracting file %s.." % filename)
-            self.save_file(data, dest_dir, filename)
+            digest, size = self.extract_file(filename, table,
+                                             os.path.join(dest_dir, filename), store)
+            if manifest:
+                manifest.add(filename, digest, size)
+        if manifest:
+            manifest.save(dest_dir)
 
     def parse(self):
-        with io.open(self.filename, "rb") as f:
-            # Search for fixed-offset filesystem header
-            for offset in HEADER_OFFSETS:
-                f.seek(offset)
-                data = f.read(HEADER_SIZE)
-                header = FlashHeader.parse(data)
-                if header.magic != HEADER_MAGIC:
-                    continue
-                hash = self.hash(data[:-HEADER_HASH_SIZE])
-                self.xbfs_tables.append(header)
-                self.header_offsets[header.sequence_version] = offset
+        self.open()
+        self.xbfs_tables = list()
+        self.header_offsets = dict()
+        self.header_hashes = dict()
+        self._block_map = None
+        # Search for fixed-offset filesystem header
+        for offset in HEADER_OFFSETS:
+            data = self._mmap[offset:offset + HEADER_SIZE]
+            header = FlashHeader.parse(data)
+            if header.magic != HEADER_MAGIC:
+                continue
+            hash = self.hash(data[:-HEADER_HASH_SIZE])
+            self.xbfs_tables.append(header)
+            self.header_offsets[header.sequence_version] = offset
+            self.header_hashes[header.sequence_version] = hash
 
         if not len(self.get_xbfs_sequence_list()):
             raise Exception("No valid XBFS table found!")
 
+def get_extract_dirname(filename, table):
+    return "%s_%s" % (filename, table.guid)
+
+
+def process_dump(filename, extract=False, store_dir=None, validate=False, update_history=False):
+    """
+    Parse, summarize and optionally extract a single dump
+
+    Module-level so it can be run in a process pool.
+
+    Returns:
+        dict: Summary, holds 'error' key if processing failed
+    """
+    try:
+        with DurangoNand(filename) as nand:
+            nand.parse()
+            summary = nand.generate_summary()
+            if validate:
+                summary['validation'] = nand.validate()
+            if update_history:
+                summary['update_history'] = nand.get_update_history()
+            if extract:
+                table = nand.get_latest_xbfs_table()
+                dirname = get_extract_dirname(filename, table)
+                store = ContentStore(store_dir) if store_dir else None
+                nand.extract_files_from_table(table, dirname, store)
+                summary['extract_dir'] = dirname
+    except Exception as e:
+        return {'filename': filename, 'error': str(e)}
+    return summary
+
+
+def get_dump_filelist(dirpath):
+    """
+    Files in directory that have the size of a nand dump
+    """
+    filelist = list()
+    for entry in sorted(os.scandir(dirpath), key=lambda e: e.name):
+        if entry.is_file() and entry.stat().st_size in [FLASH_SIZE_LOG, FLASH_SIZE_RAW]:
+            filelist.append(entry.path)
+    return filelist
+
+
+def process_batch(filelist, output, jobs=1, extract=False, store_dir=None, validate=False,
+                  update_history=False):
+    """
+    Process many dumps concurrently, write one NDJSON record per dump
+
+    Args:
+        filelist (list): Dump filepaths
+        output (file): Text stream for NDJSON records
+        jobs (int): Number of worker processes
+
+    Returns:
+        int: Count of failed dumps
+    """
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(process_dump, f, extract, store_dir, validate, update_history)
+                   for f in filelist]
+        for future in as_completed(futures):
+            record = future.result()
+            if 'error' in record:
+                log.error("Processing %s failed: %s" % (record['filename'], record['error']))
+                failed += 1
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description='Parse raw Durango Nanddump')
-    parser.add_argument('filename', type=str, help='input filename')
+    parser.add_argument('filename', type=str, nargs='?', help='input filename')
     parser.add_argument('--extract', action='store_true', help='extract files from nand')
+    parser.add_argument('--store', help='deduplicate extracted files via blob store directory')
+    parser.add_argument('--batch', metavar='DIR', help='process all dumps in directory')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='worker processes for --batch')
+    parser.add_argument('--output', help='NDJSON report output for --batch (otherwise its stdout)')
+    parser.add_argument('--validate', action='store_true',
+                        help='check header hashes and compare files across XBFS tables')
+    parser.add_argument('--update-history', action='store_true',
+                        help='decode update.cfg of all XBFS tables')
+    parser.add_argument('--xvd-info', action='store_true',
+                        help='print header info of all embedded XVDs')
+    parser.add_argument('--logical-view', action='store_true',
+                        help='access RAW dumps through their logical layout')
     log.info("%s %s started" % (APP_NAME, BUILD_VER))
 
     args = parser.parse_args()
 
+    if args.batch:
+        if not os.path.isdir(args.batch):
+            log.error("ERROR: directory %s does not exist!" % args.batch)
+            sys.exit(-1)
+        filelist = get_dump_filelist(args.batch)
+        log.info("Processing %i dumps with %i jobs" % (len(filelist), args.jobs))
+        if args.output:
+            with io.open(args.output, 'w') as f:
+                failed = process_batch(filelist, f, args.jobs, args.extract,
+                                       args.store, args.validate, args.update_history)
+        else:
+            failed = process_batch(filelist, sys.stdout, args.jobs, args.extract,
+                                   args.store, args.validate, args.update_history)
+        log.info("Done, %i of %i dumps failed" % (failed, len(filelist)))
+        return
+
+    if not args.filename:
+        parser.error('filename or --batch required')
+
     if not os.path.isfile(args.filename):
         log.error("ERROR: file %s does not exist!" % args.filename)
         sys.exit(-1)
 
     log.info("Nanddump file: %s" % args.filename)
-    nand = DurangoNand(args.filename)
+    nand = DurangoNand(args.filename, args.logical_view)
     log.info("Dump type: %s" % nand.dump_type)
     nand.parse()
 
@@ -311,10 +781,17 @@ def main():
     log.info(nand.generate_overview_details())
     log.info(nand.generate_xbfs_details(table))
     log.info(nand.generate_filelist_details(table))
+    if args.validate:
+        log.info(nand.generate_validation_details(nand.validate()))
+    if args.xvd_info:
+        log.info(nand.generate_xvd_details(table))
+    if args.update_history:
+        log.info("Update history\n\n%s" % json.dumps(nand.get_update_history(), indent=2))
     if args.extract:
         log.info("Extracting files...")
-        dirname = "%s_%s" % (args.filename, table.guid)
-        nand.extract_files_from_table(table, dirname)
+        dirname = get_extract_dirname(args.filename, table)
+        store = ContentStore(args.store) if args.store else None
+        nand.extract_files_from_table(table, dirname, store)
 
 if __name__ == '__main__':
     main()
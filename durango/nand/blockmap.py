@@ -0,0 +1,207 @@
+"""
+Interval based block accounting for XBFS tables
+
+Files are tracked as block ranges instead of single block numbers,
+used/free space is computed by merging the ranges.
+"""
+
+import bisect
+import logging
+
+log = logging.getLogger('nand.blockmap')
+
+
+class BlockExtent(object):
+    __slots__ = ['start', 'end', 'owners']
+
+    def __init__(self, start, end, owners=()):
+        """
+        Range of blocks [start, end)
+
+        Args:
+            owners (tuple): (sequence_version, filename) tuples occupying the range
+        """
+        self.start = start
+        self.end = end
+        self.owners = owners
+
+    @property
+    def count(self):
+        return self.end - self.start
+
+    @property
+    def filenames(self):
+        return sorted(set(name for _, name in self.owners))
+
+    def __eq__(self, other):
+        return (self.start, self.end, self.owners) == (other.start, other.end, other.owners)
+
+    def __repr__(self):
+        return '<BlockExtent 0x%x-0x%x owners=%s>' % (self.start, self.end, list(self.owners))
+
+
+class BlockMap(object):
+    def __init__(self, total_blocks):
+        """
+        Block occupancy map
+
+        Args:
+            total_blocks (int): Blockcount of the dump
+        """
+        self.total_blocks = total_blocks
+        self.files = list()
+        self._segments = None
+        self._segment_starts = None
+        self._used = None
+
+    def add(self, start, count, sequence_version, filename):
+        """
+        Register a file occupying `count` blocks beginning at `start`
+        """
+        if not count:
+            return
+        self.files.append(BlockExtent(start, start + count, ((sequence_version, filename),)))
+        self._segments = None
+        self._used = None
+
+    @classmethod
+    def from_tables(cls, total_blocks, tables, filenames):
+        block_map = cls(total_blocks)
+        for table in tables:
+            for index, filename in enumerate(filenames):
+                entry = table.files[index]
+                block_map.add(entry.offset, entry.size, table.sequence_version, filename)
+        return block_map
+
+    @staticmethod
+    def merge(extents):
+        """
+        Merge overlapping/adjacent ranges
+
+        Args:
+            extents (iterable): (start, end) tuples
+
+        Returns:
+            list: Sorted, non-overlapping (start, end) tuples
+        """
+        merged = list()
+        for start, end in sorted(extents):
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+                continue
+            merged.append([start, end])
+        return [tuple(e) for e in merged]
+
+    @property
+    def segments(self):
+        """
+        Elementary, non-overlapping extents along with all of their owners
+
+        Returns:
+            list: BlockExtent sorted by start
+        """
+        if self._segments is None:
+            self._build_segments()
+        return self._segments
+
+    def _build_segments(self):
+        # Sweep over range boundaries, track currently active owners
+        events = list()
+        for f in self.files:
+            events.append((f.start, 1, f.owners[0]))
+            events.append((f.end, 0, f.owners[0]))
+        events.sort(key=lambda e: (e[0], e[1]))
+
+        segments = list()
+        active = dict()
+        previous = None
+        for position, is_start, owner in events:
+            if previous is not None and position > previous and active:
+                segments.append(BlockExtent(previous, position, tuple(sorted(active))))
+            if is_start:
+                active[owner] = active.get(owner, 0) + 1
+            else:
+                active[owner] -= 1
+                if not active[owner]:
+                    del active[owner]
+            previous = position
+        self._segments = segments
+        self._segment_starts = [s.start for s in segments]
+
+    @property
+    def used_extents(self):
+        if self._used is None:
+            self._used = self.merge((f.start, min(f.end, self.total_blocks))
+                                    for f in self.files if f.start < self.total_blocks)
+        return self._used
+
+    @property
+    def used_blockcount(self):
+        return sum(end - start for start, end in self.used_extents)
+
+    @property
+    def free_extents(self):
+        free = list()
+        position = 0
+        for start, end in self.used_extents:
+            if start > position:
+                free.append((position, start))
+            position = end
+        if position < self.total_blocks:
+            free.append((position, self.total_blocks))
+        return free
+
+    @property
+    def free_blockcount(self):
+        return self.total_blocks - self.used_blockcount
+
+    def get_table_extents(self, sequence_version):
+        return self.merge((f.start, f.end) for f in self.files
+                          if f.owners[0][0] == sequence_version)
+
+    def get_table_blockcount(self, sequence_version):
+        return sum(end - start for start, end in self.get_table_extents(sequence_version))
+
+    def get_file_extents(self, filename, sequence_version=None):
+        """
+        Returns:
+            list: BlockExtent for every table holding the file
+        """
+        return [f for f in self.files
+                if f.owners[0][1] == filename and
+                (sequence_version is None or f.owners[0][0] == sequence_version)]
+
+    def get_overlaps(self):
+        """
+        Ranges shared by different files (same file in several tables is not an overlap)
+
+        Returns:
+            list: BlockExtent with all owners of the range
+        """
+        return [s for s in self.segments if len(s.filenames) > 1]
+
+    def get_owners_in_range(self, start, end):
+        """
+        Returns:
+            set: (sequence_version, filename) tuples occupying any block in [start, end)
+        """
+        segments = self.segments
+        owners = set()
+        idx = max(bisect.bisect_right(self._segment_starts, start) - 1, 0)
+        while idx < len(segments) and segments[idx].start < end:
+            if segments[idx].end > start:
+                owners.update(segments[idx].owners)
+            idx += 1
+        return owners
+
+    def get_owners(self, block):
+        """
+        Returns:
+            tuple: (sequence_version, filename) tuples occupying block
+        """
+        segments = self.segments
+        idx = bisect.bisect_right(self._segment_starts, block) - 1
+        if idx >= 0 and segments[idx].start <= block < segments[idx].end:
+            return segments[idx].owners
+        return ()
@@ -0,0 +1,125 @@
+"""
+Conversion between RAW and LOGICAL nand dump layouts
+
+A RAW dump (FLASH_SIZE_RAW) holds the logical image (FLASH_SIZE_LOG)
+followed by a reserved area that is not addressed by XBFS. The mapping
+is described by LOGICAL_EXTENTS, currently a single identity extent: the
+logical image is the prefix of the raw one. Converting RAW -> LOGICAL
+therefore truncates the dump (the reserved area is lost), LOGICAL -> RAW
+zero-pads it. Data is copied kernel-side in large sequential ranges, so
+memory usage is bounded regardless of dump size.
+
+To work on a RAW dump without converting it, use
+`DurangoNand(filename, logical_view=True)`.
+"""
+
+import io
+import os
+import sys
+import logging
+import argparse
+
+from durango.common.fastcopy import copy_range
+from durango.nand.NANDOne import FLASH_SIZE_LOG, FLASH_SIZE_RAW
+from durango.nand.NANDOne import DUMP_TYPE_LOGICAL, DUMP_TYPE_RAW
+
+log = logging.getLogger('nand.convert')
+
+# (raw offset, logical offset, length)
+# Identity prefix mapping, no remapping of blocks is known so far
+LOGICAL_EXTENTS = [
+    (0, 0, FLASH_SIZE_LOG)
+]
+
+DUMP_SIZES = {
+    DUMP_TYPE_LOGICAL: FLASH_SIZE_LOG,
+    DUMP_TYPE_RAW: FLASH_SIZE_RAW
+}
+
+
+def get_dump_type(filepath):
+    size = os.stat(filepath).st_size
+    for dump_type, dump_size in DUMP_SIZES.items():
+        if size == dump_size:
+            return dump_type
+    raise Exception("Invalid filesize 0x%x for %s" % (size, filepath))
+
+
+def convert_dump(src_path, dest_path, dump_type, progress_callback=None):
+    """
+    Write src_path, remapped to the layout of dump_type, to dest_path
+
+    Converting to RAW leaves the reserved area zeroed (sparse),
+    converting to LOGICAL drops it.
+
+    Args:
+        src_path (str): Source dump
+        dest_path (str): Destination dump, overwritten. Must not be src_path
+        dump_type (str): DUMP_TYPE_LOGICAL or DUMP_TYPE_RAW
+        progress_callback (callable): Called with (copied_bytes, total_bytes)
+
+    Returns:
+        int: Count of bytes copied
+    """
+    src_type = get_dump_type(src_path)
+    if os.path.exists(dest_path) and os.path.samefile(src_path, dest_path):
+        raise ValueError("Destination %s is the source dump" % dest_path)
+    if dump_type not in DUMP_SIZES:
+        raise ValueError("Unknown dump type %s" % dump_type)
+    to_raw = dump_type == DUMP_TYPE_RAW
+    total = sum(length for _, _, length in LOGICAL_EXTENTS)
+    log.debug("Converting %s (%s) -> %s (%s)" % (src_path, src_type, dest_path, dump_type))
+
+    src_fd = os.open(src_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        with io.open(dest_path, 'wb') as dest:
+            dest.truncate(DUMP_SIZES[dump_type])
+            dest.flush()
+            copied = 0
+            for raw_offset, logical_offset, length in LOGICAL_EXTENTS:
+                if src_type == DUMP_TYPE_RAW:
+                    src_offset = raw_offset
+                else:
+                    src_offset = logical_offset
+                dst_offset = raw_offset if to_raw else logical_offset
+
+                def extent_progress(done, _, base=copied):
+                    if progress_callback:
+                        progress_callback(base + done, total)
+
+                ret = copy_range(src_fd, dest.fileno(), src_offset, length,
+                                 dst_offset, extent_progress)
+                if ret != length:
+                    raise Exception("Short copy @ 0x%x: 0x%x of 0x%x bytes" % (
+                        src_offset, ret, length))
+                copied += ret
+    except Exception:
+        if os.path.exists(dest_path):
+            os.unlink(dest_path)
+        raise
+    finally:
+        os.close(src_fd)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert Durango Nanddump layout')
+    parser.add_argument('filename', help='input dump')
+    parser.add_argument('dump_type', choices=['logical', 'raw'], help='target layout')
+    parser.add_argument('--output', required=True,
+                        help='output dump, must differ from the input dump')
+    args = parser.parse_args()
+
+    dump_type = args.dump_type.upper()
+
+    def progress(done, total):
+        sys.stdout.write('\r%3i%%' % (done * 100 / total))
+        sys.stdout.flush()
+
+    convert_dump(args.filename, args.output, dump_type, progress)
+    sys.stdout.write('\n')
+    log.info("Written %s dump to %s" % (dump_type, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""
+Differential comparison of Durango NAND dumps
+
+Dumps are compared in chunks of LOG_BLOCK_SZ blocks. Each chunk is hashed
+once per dump, chunks with identical digests across all dumps are skipped.
+Differing chunks are compared block by block, differing blocks are merged
+into extents and attributed to the XBFS files occupying them.
+"""
+
+import io
+import os
+import json
+import struct
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from durango.nand.NANDOne import DurangoNand, LOG_BLOCK_SZ
+
+logging.basicConfig(format='[%(levelname)s] - %(name)s - %(message)s', level=logging.DEBUG)
+log = logging.getLogger('nand_diff')
+
+# Blocks per hashed chunk (1 MiB)
+DIFF_CHUNK_BLOCKS = 0x100
+DEFAULT_JOBS = os.cpu_count() or 1
+
+PATCH_MAGIC = b'NDIF'
+PATCH_VERSION = 1
+PatchHeader = struct.Struct('<4sII')   # magic, version, extent count
+PatchExtent = struct.Struct('<QQ')     # offset, length (followed by data)
+
+
+class NandDiffExtent(object):
+    def __init__(self, start, end, dumps, files=()):
+        """
+        Range of differing blocks [start, end)
+
+        Args:
+            dumps (tuple): Indices of dumps that differ from the reference (index 0)
+            files (list): Names of XBFS files occupying the range in any dump
+        """
+        self.start = start
+        self.end = end
+        self.dumps = dumps
+        self.files = files
+
+    @property
+    def offset(self):
+        return self.start * LOG_BLOCK_SZ
+
+    @property
+    def length(self):
+        return (self.end - self.start) * LOG_BLOCK_SZ
+
+    def to_dict(self):
+        return {
+            'offset': self.offset,
+            'length': self.length,
+            'dumps': list(self.dumps),
+            'files': list(self.files)
+        }
+
+    def __repr__(self):
+        return '<NandDiffExtent 0x%x+0x%x dumps=%s files=%s>' % (
+            self.offset, self.length, list(self.dumps), list(self.files))
+
+
+class NandDiff(object):
+    def __init__(self, nands, chunk_blocks=DIFF_CHUNK_BLOCKS, jobs=DEFAULT_JOBS,
+                 block_count=None):
+        """
+        Compare parsed dumps against the first one
+
+        Args:
+            nands (list): Parsed DurangoNand objects, first one is the reference
+            chunk_blocks (int): Blocks per hashed chunk
+            jobs (int): Hashing threads
+            block_count (int): Compare only the first block_count blocks
+        """
+        if len(nands) < 2:
+            raise ValueError('Need at least two dumps to compare')
+        self.nands = nands
+        self.chunk_blocks = chunk_blocks
+        self.jobs = max(1, jobs)
+        self.total_blocks = min(n.total_blocks for n in nands)
+        if block_count is not None:
+            self.total_blocks = min(self.total_blocks, block_count)
+        for nand in nands:
+            nand.open()
+
+    def _get_block_range(self, nand, start, end):
+        return nand._view[start * LOG_BLOCK_SZ:end * LOG_BLOCK_SZ]
+
+    def _compare_chunk(self, chunk_index):
+        """
+        Returns:
+            list: (block, differing dump indices) for all differing blocks in chunk
+        """
+        start = chunk_index * self.chunk_blocks
+        end = min(start + self.chunk_blocks, self.total_blocks)
+        views = [self._get_block_range(n, start, end) for n in self.nands]
+        digests = [hashlib.sha1(v).digest() for v in views]
+        if len(set(digests)) == 1:
+            return []
+
+        differing = list()
+        reference = views[0]
+        for block in range(end - start):
+            pos = block * LOG_BLOCK_SZ
+            ref_block = reference[pos:pos + LOG_BLOCK_SZ]
+            dumps = tuple(idx for idx, view in enumerate(views[1:], 1)
+                          if view[pos:pos + LOG_BLOCK_SZ] != ref_block)
+            if dumps:
+                differing.append((start + block, dumps))
+        return differing
+
+    def _get_files(self, start, end):
+        files = set()
+        for nand in self.nands:
+            files.update(name for _, name in nand.block_map.get_owners_in_range(start, end))
+        return sorted(files)
+
+    def compare(self):
+        """
+        Returns:
+            list: NandDiffExtent, sorted by offset
+        """
+        chunk_count = (self.total_blocks + self.chunk_blocks - 1) // self.chunk_blocks
+        extents = list()
+        current = None
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for differing in pool.map(self._compare_chunk, range(chunk_count)):
+                for block, dumps in differing:
+                    if current and current.end == block and current.dumps == dumps:
+                        current.end += 1
+                        continue
+                    current = NandDiffExtent(block, block + 1, dumps)
+                    extents.append(current)
+        for extent in extents:
+            extent.files = self._get_files(extent.start, extent.end)
+        return extents
+
+    def write_patch(self, extents, output, target=1):
+        """
+        Write binary patch turning the reference dump into dump `target`
+
+        Format: PatchHeader, then per extent PatchExtent followed by data
+        """
+        extents = [e for e in extents if target in e.dumps]
+        output.write(PatchHeader.pack(PATCH_MAGIC, PATCH_VERSION, len(extents)))
+        for extent in extents:
+            output.write(PatchExtent.pack(extent.offset, extent.length))
+            output.write(self._get_block_range(self.nands[target], extent.start, extent.end))
+
+    @staticmethod
+    def apply_patch(patch, dump_path):
+        """
+        Apply binary patch in place
+        """
+        magic, version, count = PatchHeader.unpack(patch.read(PatchHeader.size))
+        if magic != PATCH_MAGIC or version != PATCH_VERSION:
+            raise Exception('Invalid patch file')
+        with io.open(dump_path, 'r+b') as dump:
+            for _ in range(count):
+                offset, length = PatchExtent.unpack(patch.read(PatchExtent.size))
+                data = patch.read(length)
+                if len(data) != length:
+                    raise Exception('Truncated patch file')
+                dump.seek(offset)
+                dump.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Durango Nanddumps')
+    parser.add_argument('filenames', nargs='+', help='dumps, first one is the reference')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS, help='hashing threads')
+    parser.add_argument('--chunk-blocks', type=int, default=DIFF_CHUNK_BLOCKS,
+                        help='blocks per hashed chunk')
+    parser.add_argument('--output', help='Json diff output (otherwise its stdout)')
+    parser.add_argument('--patch', help='write binary patch (reference -> second dump)')
+    args = parser.parse_args()
+
+    if len(args.filenames) < 2:
+        parser.error('need at least two dumps')
+
+    nands = list()
+    for filename in args.filenames:
+        nand = DurangoNand(filename)
+        try:
+            nand.parse()
+        except Exception as e:
+            log.warning('%s: %s, no file attribution' % (filename, e))
+        nands.append(nand)
+
+    differ = NandDiff(nands, args.chunk_blocks, args.jobs)
+    extents = differ.compare()
+    log.info('Found %i differing extents' % len(extents))
+
+    report = {
+        'dumps': args.filenames,
+        'extents': [e.to_dict() for e in extents]
+    }
+    if args.output:
+        with io.open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.patch:
+        with io.open(args.patch, 'wb') as f:
+            differ.write_patch(extents, f)
+        log.info('Patch written to %s' % args.patch)
+
+    for nand in nands:
+        nand.close()
+
+
+if __name__ == '__main__':
+    main()
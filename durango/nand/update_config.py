@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
+from binascii import hexlify
+
 from construct import Int8ul, Int16ul, Int16ub
 from construct import Int32ul, Int32ub, Int64ul, Int64ub
 from construct import String, Bytes, Array, Padding, Struct
-from hexdump import hexdump
 
 UPDATE_CFG_MAGIC = b'UCFG'
 UPDATE_CFG_MAGIC = Int32ub.parse(UPDATE_CFG_MAGIC)
@@ -47,36 +48,60 @@ UpdateCfgHeader = Struct(
 )
 
 
+# Built once, reused for every decoded update.cfg
+UpdateCfgFiles = Array(UPDATE_CFG_MAX_FILES, UpdateCfgFileEntry)
+
+UpdateCfgBuildInfo = {
+    BUILD_INFO_ID_SHORT: UpdateCfgBuildShort,
+    BUILD_INFO_ID_LONG: UpdateCfgBuildLong
+}
+
+
+def _cstring(value):
+    return value.split('\x00', 1)[0]
+
+
 class DurangoUpdateCfg(object):
     def __init__(self, data):
         self._data = data
 
     def parse(self):
-        if UpdateCfgHeader.sizeof() != UPDATE_CFG_HEADER_SIZE:
-            print("ERROR: UpdateCfgHeader struct does not match UPDATE_CFG_HEADER_SIZE!")
-            print("Got %i instead of expected %i bytes" % (UpdateCfgHeader.sizeof(), UPDATE_CFG_HEADER_SIZE))
-            return
-
-        data = self._data
+        """
+        Decode update.cfg
+
+        Returns:
+            dict: JSON serializable record with 'header', 'build' and 'files'
+        """
+        data = bytes(self._data[:UPDATE_CFG_MAX_DATA_SIZE])
+        if len(data) < UPDATE_CFG_HEADER_SIZE:
+            raise Exception("update.cfg too short: 0x%x bytes" % len(data))
         header = UpdateCfgHeader.parse(data)
         if header.magic != UPDATE_CFG_MAGIC:
-            print("ERROR: Invalid Magic for update.cfg!")
-            return
+            raise Exception("Invalid Magic for update.cfg!")
+
+        cfg_build_struct = UpdateCfgBuildInfo.get(header.identifier)
+        if not cfg_build_struct:
+            raise Exception("Unknown build info identifier %i" % header.identifier)
 
         # Cut data to header-defined size
-        data = data[:header.total_length]
-
-        if header.identifier == BUILD_INFO_ID_SHORT:
-            cfg_build_struct = UpdateCfgBuildShort
-        elif header.identifier == BUILD_INFO_ID_LONG:
-            cfg_build_struct = UpdateCfgBuildLong
-        else:
-            print("ERROR: Unknown identifier...")
-            return
-
-        data = data[UPDATE_CFG_HEADER_SIZE:]
-        build_str = cfg_build_struct.parse(data)
-        data = data[cfg_build_struct.sizeof():]
-        files = Array(UPDATE_CFG_MAX_FILES, UpdateCfgFileEntry).parse(data)
-        print(build_str)
-        print(files)
+        data = data[UPDATE_CFG_HEADER_SIZE:header.total_length]
+        build = cfg_build_struct.parse(data)
+        files = UpdateCfgFiles.parse(data[cfg_build_struct.sizeof():])
+
+        return {
+            'header': {
+                'unknown_1': header.unknown_1,
+                'unknown_2': header.unknown_2,
+                'unknown_3': header.unknown_3,
+                'unknown_4': header.unknown_4,
+                'hash': hexlify(header.hash).decode('utf-8'),
+                'total_length': header.total_length,
+                'unknown_5': header.unknown_5,
+                'identifier': header.identifier
+            },
+            'build': dict((key, _cstring(value)) for key, value in build.items()),
+            'files': [{'unknown_1': entry.unknown_1,
+                       'unknown_2': entry.unknown_2,
+                       'filename': _cstring(entry.filename)}
+                      for entry in files if _cstring(entry.filename)]
+        }
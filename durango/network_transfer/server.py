@@ -1,24 +1,205 @@
 import os
 import io
 import sys
+import errno
+import select
+import socket
 import argparse
 import logging
+import threading
+import contextlib
+import collections
 from urllib import parse
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 from durango.network_transfer.mdns import NetworkTransferMDNS
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+# Connections served concurrently
+DEFAULT_WORKERS = 8
+# Connections waiting for a free worker, further ones are rejected with 503
+DEFAULT_BACKLOG = 4
+SERVICE_UNAVAILABLE_RESPONSE = (b'HTTP/1.1 503 Service Unavailable\r\n'
+                                b'Server: Microsoft-HTTPAPI/2.0\r\n'
+                                b'Retry-After: 1\r\n'
+                                b'Content-Length: 0\r\n'
+                                b'Connection: close\r\n\r\n')
+# Seconds an idle keep-alive connection may hold a worker
+KEEPALIVE_TIMEOUT = 30
+# Content files kept open between requests
+DEFAULT_MAX_OPEN_FILES = 64
+# Errors of os.sendfile that trigger the socket.sendfile fallback
+SENDFILE_FALLBACK_ERRNOS = (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK,
+                            errno.EOPNOTSUPP, errno.EBADF)
+
+
+class PooledFile(object):
+    def __init__(self, fd, key, size):
+        self.fd = fd
+        # (inode, mtime_ns, size) at time of opening
+        self.key = key
+        self.size = size
+        self.users = 0
+        self.stale = False
+
+
+class FileDescriptorPool(object):
+    def __init__(self, max_open=DEFAULT_MAX_OPEN_FILES):
+        """
+        Shared, LRU-bounded pool of read-only file descriptors, keyed by path
+
+        Descriptors are only read with explicit offsets (sendfile / pread),
+        so they can be used by several requests at once. Idle descriptors are
+        closed once more than max_open files are open, a file that changed
+        on disk is reopened.
+
+        Args:
+            max_open (int): Maximum count of idle descriptors kept open
+        """
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        # path : PooledFile, least recently used first
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _close(entry):
+        os.close(entry.fd)
+        entry.fd = None
+
+    def _evict(self):
+        idle = [path for path, entry in self._entries.items() if not entry.users]
+        for path in idle[:max(0, len(self._entries) - self.max_open)]:
+            self._close(self._entries.pop(path))
+
+    def acquire(self, path):
+        """
+        Returns:
+            PooledFile: Pass to `release` when done
+        """
+        stat_result = os.stat(path)
+        key = (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry.key != key:
+                # File was replaced / modified
+                del self._entries[path]
+                entry.stale = True
+                if not entry.users:
+                    self._close(entry)
+                entry = None
+            if entry:
+                self._entries.move_to_end(path)
+            else:
+                fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                entry = self._entries[path] = PooledFile(fd, key, stat_result.st_size)
+            entry.users += 1
+            self._evict()
+            return entry
+
+    def release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            if entry.users:
+                return
+            if entry.stale:
+                self._close(entry)
+            else:
+                self._evict()
+
+    @contextlib.contextmanager
+    def open(self, path):
+        """
+        Yields:
+            PooledFile: Open descriptor and size of path
+        """
+        entry = self.acquire(path)
+        try:
+            yield entry
+        finally:
+            self.release(entry)
+
+    def close(self):
+        with self._lock:
+            for entry in self._entries.values():
+                entry.stale = True
+                if not entry.users:
+                    self._close(entry)
+            self._entries.clear()
+
+
+class NetworkTransferHTTPServer(ThreadingHTTPServer):
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 keep_alive=True, backlog=DEFAULT_BACKLOG):
+        """
+        HTTP server handling connections in a bounded thread pool
+
+        With keep_alive, connections speak HTTP/1.1 and stay open between range
+        requests. Each one occupies a worker until the client closes it or it is
+        idle for KEEPALIVE_TIMEOUT seconds. Up to backlog further connections wait
+        for a free worker, any more are answered with 503 and closed right away,
+        instead of stalling until some keep-alive connection times out.
+
+        Args:
+            workers (int): Maximum count of connections served concurrently
+            keep_alive (bool): Use HTTP/1.1 persistent connections
+            backlog (int): Maximum count of connections waiting for a worker
+        """
+        self.workers = workers
+        self.backlog = backlog
+        self.protocol_version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+        # Accepted connections, running or waiting
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix='NetworkTransfer')
+        super(NetworkTransferHTTPServer, self).__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        # Instead of a thread per connection
+        if not self._slots.acquire(blocking=False):
+            logger.warning('Rejecting %s:%i, all workers busy' % client_address[:2])
+            self.reject_request(request)
+            return
+        try:
+            self._pool.submit(self._process_request_slot, request, client_address)
+        except RuntimeError:
+            # Pool shut down
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_slot(self, request, client_address):
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+    def reject_request(self, request):
+        try:
+            request.sendall(SERVICE_UNAVAILABLE_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super(NetworkTransferHTTPServer, self).server_close()
+        self._pool.shutdown(wait=False)
+
 
 class NetworkTransferServer(BaseHTTPRequestHandler):
     HTTP_SERVER_PORT = 10248
+    timeout = KEEPALIVE_TIMEOUT
+    # Shared by all handlers, a handler only lives for a single connection
+    file_pool = FileDescriptorPool()
 
-    def __init__(self, *kargs):
-        BaseHTTPRequestHandler.__init__(self, *kargs)
-        self.current_file = None
-        self.current_filepath = None
-        self.current_file_size = 0
+    def setup(self):
+        # Protocol is chosen per server, plain HTTPServer stays on HTTP/1.0
+        self.protocol_version = getattr(self.server, 'protocol_version',
+                                        self.protocol_version)
+        BaseHTTPRequestHandler.setup(self)
 
     def _file_exists(self, path):
         return os.path.isfile(path)
@@ -43,6 +224,9 @@ class NetworkTransferServer(BaseHTTPRequestHandler):
     def send_error_server_exception(self):
         self._send_headers(500)
 
+    def send_error_range_not_satisfiable(self, file_size):
+        self._send_headers(416, range='bytes */%i' % file_size)
+
     def send_metadata(self, filepath):
         with io.open(filepath, 'rb') as f:
             metadata_json = f.read()
@@ -55,25 +239,60 @@ class NetworkTransferServer(BaseHTTPRequestHandler):
             self._send_headers(200, 'application/octet-stream', len(constraint))
             self.wfile.write(constraint)
 
+    def _sendfile(self, fd, offset, count):
+        """
+        Send file range via os.sendfile, without copying it to userspace
+
+        Returns:
+            int: Count of sent bytes, less than count if unsupported
+        """
+        sock = self.connection
+        sent = 0
+        while sent < count:
+            try:
+                size = os.sendfile(sock.fileno(), fd, offset + sent, count - sent)
+            except BlockingIOError:
+                # Socket has a timeout -> non-blocking, wait until writable
+                if not select.select([], [sock], [], sock.gettimeout())[1]:
+                    raise socket.timeout('timed out')
+                continue
+            except OSError as e:
+                if sent or e.errno not in SENDFILE_FALLBACK_ERRNOS:
+                    raise
+                break
+            if not size:
+                # EOF, file shrunk
+                break
+            sent += size
+        return sent
+
     def send_filechunk(self, filepath, start_pos, end_pos):
-        if filepath != self.current_filepath:
-            if self.current_filepath:
-                # Close open handle
-                self.current_filepath.close()
-            self.current_filepath = filepath
-            self.current_file = io.open(self.current_filepath, 'rb')
-            self.current_file.seek(0, os.SEEK_END)
-            self.current_file_size = self.current_file.tell()
-
-        # Assemble Content-Range header
-        content_range = 'bytes %i-%i/%i' % (start_pos, end_pos,
-                                            self.current_file_size)
-        # Set to actual start position
-        self.current_file.seek(start_pos, os.SEEK_SET)
-        data = self.current_file.read(end_pos - start_pos + 1)
-        self._send_headers(206, 'application/octet-stream',
-                           len(data), content_range)
-        self.wfile.write(data)
+        with self.file_pool.open(filepath) as pooled:
+            if start_pos >= pooled.size:
+                logger.error('File requested: Start pos 0x%x beyond filesize 0x%x' % (
+                    start_pos, pooled.size)
+                )
+                return self.send_error_range_not_satisfiable(pooled.size)
+            end_pos = min(end_pos, pooled.size - 1)
+            length = end_pos - start_pos + 1
+
+            # Assemble Content-Range header
+            content_range = 'bytes %i-%i/%i' % (start_pos, end_pos, pooled.size)
+            self._send_headers(206, 'application/octet-stream',
+                               length, content_range)
+            self.wfile.flush()
+
+            sent = 0
+            if hasattr(os, 'sendfile'):
+                sent = self._sendfile(pooled.fd, start_pos, length)
+            if sent < length:
+                # Private handle, socket.sendfile may seek/read
+                with io.open(filepath, 'rb') as f:
+                    sent += self.connection.sendfile(f, start_pos + sent, length - sent)
+            if sent < length:
+                # Content-Length cannot be met anymore
+                logger.error('File requested: Short send 0x%x of 0x%x bytes' % (sent, length))
+                self.close_connection = True
 
     def do_GET(self):
         path = parse.unquote(self.path.rstrip('/'))
@@ -137,21 +356,46 @@ def main():
                         help='LiveID to announce')
     parser.add_argument('--port', '-p', type=int, default=NetworkTransferServer.HTTP_SERVER_PORT,
                         help='Port for HTTP Server')
+    parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS,
+                        help='Connections served concurrently, keep-alive connections hold '
+                             'their worker until closed or idle (default: %(default)s)')
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG,
+                        help='Connections waiting for a free worker, '
+                             'further ones get 503 (default: %(default)s)')
+    parser.add_argument('--no-keepalive', action='store_true',
+                        help='Close connection after every request (HTTP/1.0)')
+    parser.add_argument('--single-threaded', action='store_true',
+                        help='Serve one request at a time')
+    parser.add_argument('--max-open-files', type=int, default=DEFAULT_MAX_OPEN_FILES,
+                        help='Content files kept open between requests (default: %(default)s)')
     parser.add_argument('address',
                         help='IP address to bind to')
 
     args = parser.parse_args()
 
     port = NetworkTransferServer.HTTP_SERVER_PORT
+    NetworkTransferServer.file_pool.max_open = args.max_open_files
     server_endpoint = (args.address, args.port)
-    httpd = HTTPServer(server_endpoint, NetworkTransferServer)
+    if args.single_threaded:
+        httpd = HTTPServer(server_endpoint, NetworkTransferServer)
+    else:
+        httpd = NetworkTransferHTTPServer(server_endpoint, NetworkTransferServer,
+                                          workers=args.workers,
+                                          keep_alive=not args.no_keepalive,
+                                          backlog=args.backlog)
     logger.info('Announcing server via MDNS')
     xbox_mdns = NetworkTransferMDNS()
     xbox_mdns.register_service(args.name, args.id,
                                args.address, args.port)
 
     logger.info('Starting httpd on port %i...' % args.port)
-    httpd.serve_forever()
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        NetworkTransferServer.file_pool.close()
 
     logger.info("Unregistering MDNS...")
     xbox_mdns.unregister_service()
@@ -47,6 +47,8 @@ setup(
             'durango-nwtransfer-server=durango.network_transfer.server:main',
             'durango-nwtransfer-downloader=durango.network_transfer.store_downloader:main',
             'durango-nand=durango.nand.NANDOne:main',
+            'durango-nand-diff=durango.nand.nand_diff:main',
+            'durango-nand-convert=durango.nand.convert:main',
             'durango-hdd-toggle=durango.hdd.toggle_mode:main',
             'durango-savegame-enum=durango.hdd.savegame_enum:main',
             'durango-extstorage-enum=durango.hdd.external_storage_enum:main',
@@ -54,6 +56,10 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={
+        'watch': ['inotify_simple'],
+        'msgpack': ['msgpack']
+    },
     long_description=readme + '\n\n' + history,
     include_package_data=True,
     keywords='durango',
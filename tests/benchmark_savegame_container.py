@@ -0,0 +1,39 @@
+"""
+Benchmark ContainerIndexFast against the construct parser
+
+Not part of the unit tests, run via:
+    python -m tests.benchmark_savegame_container [entry count ...]
+"""
+
+import sys
+import timeit
+
+from durango.fileformat.savegame_container import ContainerIndex, ContainerIndexFast
+
+from tests.test_savegame_container import build_index
+
+DEFAULT_COUNTS = [10, 100, 2000]
+REPEAT = 5
+
+
+def benchmark(count, repeat=REPEAT):
+    """
+    Returns:
+        tuple: Best time in seconds of (construct parser, fast parser)
+    """
+    data = build_index(count)
+    slow = min(timeit.repeat(lambda: ContainerIndex.parse(data), number=1, repeat=repeat))
+    fast = min(timeit.repeat(lambda: ContainerIndexFast.parse(data), number=1, repeat=repeat))
+    return slow, fast
+
+
+def main():
+    counts = [int(c) for c in sys.argv[1:]] or DEFAULT_COUNTS
+    for count in counts:
+        slow, fast = benchmark(count)
+        print('ContainerIndex, %i entries: construct %.2f ms, fast %.2f ms (%.1fx)' % (
+            count, slow * 1000, fast * 1000, slow / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,9 @@ Test fixtures
 """
 
 import os
+import uuid
+import struct
+import hashlib
 import pytest
 from typing import Mapping, Dict
 
@@ -37,3 +40,160 @@ def misc_testdata() -> Mapping[str, bytes]:
         with open(os.path.join(data_path, f), 'rb') as fh:
             data[f] = fh.read()
     return data
+
+
+def build_xvd_header(content_type=1, volume_flags=0x4, xvd_type=0,
+                     drive_size=0x10000, embedded_xvd_length=0,
+                     userdata_length=0, xvc_length=0,
+                     dynamic_header_length=0, mutable_data_page_count=0,
+                     root_hash=b'\x00' * 0x20):
+    """
+    Assemble a minimal XVD header (0x1000 bytes)
+
+    Default volume flags disable data integrity, so no hash tree is laid out.
+    """
+    buf = bytearray(0x1000)
+    buf[0x200:0x208] = b'msft-xvd'
+    struct.pack_into('<II', buf, 0x208, volume_flags, 2)
+    struct.pack_into('<Q', buf, 0x210, 132000000000000000)
+    struct.pack_into('<Q', buf, 0x218, drive_size)
+    buf[0x220:0x230] = uuid.UUID('11111111-2222-3333-4444-555555555555').bytes_le
+    buf[0x240:0x260] = root_hash
+    struct.pack_into('<IIIIIII', buf, 0x280, xvd_type, content_type,
+                     embedded_xvd_length, userdata_length, xvc_length,
+                     dynamic_header_length, 0xAA000)
+    buf[0x38C:0x39C] = b'XBOX\x00'.ljust(16, b'\x00')
+    buf[0x39C:0x3AC] = uuid.UUID('66666666-7777-8888-9999-aaaaaaaaaaaa').bytes_le
+    struct.pack_into('<Q', buf, 0x3BC, 0x1234)
+    buf[0x470] = mutable_data_page_count
+    struct.pack_into('<qQI', buf, 0x48C, 3, 0x0A00000000000001, 1)
+    return bytes(buf)
+
+
+@pytest.fixture
+def xvd_header_builder():
+    """
+    Provides a function to assemble synthetic XVD headers
+    """
+    return build_xvd_header
+
+
+def build_xbfs_header(sequence_version, files, guid=None, valid_hash=True):
+    """
+    Assemble a XBFS header (1024 bytes)
+
+    Args:
+        files (dict): FlashFiles index -> (offset, size) in LOG_BLOCK_SZ units
+    """
+    buf = bytearray(1024)
+    buf[0:4] = b'SFBX'
+    struct.pack_into('<BBH', buf, 4, 1, sequence_version, 1)
+    for index, (offset, size) in files.items():
+        struct.pack_into('<IIQ', buf, 0x20 + index * 16, offset, size, 0)
+    guid = guid or uuid.UUID(int=sequence_version)
+    buf[0x3D0:0x3E0] = guid.bytes_le
+    if valid_hash:
+        buf[0x3E0:] = hashlib.sha256(bytes(buf[:0x3E0])).digest()
+    return bytes(buf)
+
+
+def write_nand_dump(path, headers, blocks, size=0x13BC00000):
+    """
+    Write a sparse nand dump
+
+    Args:
+        headers (dict): offset -> XBFS header bytes
+        blocks (dict): block number -> data
+    """
+    with open(path, 'wb') as f:
+        f.truncate(size)
+        for offset, header in headers.items():
+            f.seek(offset)
+            f.write(header)
+        for block, data in blocks.items():
+            f.seek(block * 0x1000)
+            f.write(data)
+    return str(path)
+
+
+@pytest.fixture
+def nand_dump(tmp_path):
+    """
+    Provides a sparse logical nand dump with two XBFS tables
+
+    Sequence 1 @ 0x10000: header.bin (block 0x100, 1 block), boot.bin (block 0x200, 2 blocks)
+    Sequence 2 @ 0x810000: header.bin (block 0x100), boot.bin (block 0x300, 2 blocks)
+    """
+    headers = {
+        0x10000: build_xbfs_header(1, {1: (0x100, 1), 16: (0x200, 2)}),
+        0x810000: build_xbfs_header(2, {1: (0x100, 1), 16: (0x300, 2)})
+    }
+    blocks = {
+        0x100: b'H' * 0x1000,
+        0x200: b'A' * 0x2000,
+        0x300: b'A' * 0x1000 + b'B' * 0x1000
+    }
+    return write_nand_dump(tmp_path / 'nand.bin', headers, blocks)
+
+
+def guid(n):
+    return uuid.UUID(int=n)
+
+
+def _pascal_utf16(value):
+    return struct.pack('<I', len(value)) + value.encode('utf-16-le')
+
+
+def build_containers_index(name, aum_id, product_id, saves):
+    """
+    Assemble a containers.index
+
+    Args:
+        saves (list): (filename, folder_guid, file_guid, blob_number, filesize) tuples
+    """
+    data = struct.pack('<II', 1, len(saves)) + _pascal_utf16(name) + _pascal_utf16(aum_id)
+    data += struct.pack('<QI', 132000000000000000, 0) + _pascal_utf16(product_id)
+    for filename, folder_guid, _, blob_number, filesize in saves:
+        data += _pascal_utf16(filename) + _pascal_utf16(filename) + _pascal_utf16('text')
+        data += struct.pack('<BI', blob_number, 1) + folder_guid.bytes_le
+        data += struct.pack('<QQII', 132000000000000000, 0, filesize, 0)
+    return data
+
+
+def write_savegame_folder(root, foldername, name, aum_id, product_id, saves):
+    """
+    Write savegame folder with containers.index, container blobs and savegame files
+    """
+    folderpath = os.path.join(str(root), foldername)
+    os.makedirs(folderpath)
+    with open(os.path.join(folderpath, 'containers.index'), 'wb') as f:
+        f.write(build_containers_index(name, aum_id, product_id, saves))
+    for filename, folder_guid, file_guid, blob_number, filesize in saves:
+        guid_dir = os.path.join(folderpath, '{%s}' % str(folder_guid).upper())
+        os.makedirs(guid_dir, exist_ok=True)
+        with open(os.path.join(guid_dir, 'container.%i' % blob_number), 'wb') as f:
+            f.write(struct.pack('<II', 4, 0) + b'B\x00l\x00o\x00b\x00' + b'\x00' * 0x88 +
+                    file_guid.bytes_le + b'\x00' * 0x100)
+        with open(os.path.join(guid_dir, '{%s}' % str(file_guid).upper()), 'wb') as f:
+            f.write(filename.encode('utf-8') * 4)
+    return folderpath
+
+
+@pytest.fixture
+def savegame_dir(tmp_path):
+    """
+    Provides a savegame directory with a user and a machine folder
+
+    u_1234_<guid>: 'save1' (blob 1) and 'empty' (filesize 0, skipped)
+    m_<guid>: 'config' (blob 2)
+    """
+    root = tmp_path / 'savegames'
+    write_savegame_folder(root, 'u_1234_%s' % guid(0x100), 'Game', 'Game_aum!App', 'prod1', [
+        ('save1', guid(1), guid(2), 1, 0x10),
+        ('empty', guid(3), guid(4), 1, 0)
+    ])
+    write_savegame_folder(root, 'm_%s' % guid(0x200), 'Machine', 'Machine_aum!App', 'prod2', [
+        ('config', guid(5), guid(6), 2, 0x20)
+    ])
+    os.makedirs(str(root / 'no_savegames'))
+    return str(root)
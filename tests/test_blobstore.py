@@ -0,0 +1,31 @@
+import os
+
+from durango.common.blobstore import ContentStore, ExtractionManifest, LINK_HARDLINK
+
+
+def test_store_deduplicates(tmp_path):
+    store = ContentStore(str(tmp_path / 'store'))
+    out_a = tmp_path / 'a'
+    out_b = tmp_path / 'b'
+    out_a.mkdir()
+    out_b.mkdir()
+
+    digest_a = store.store_bytes(b'firmware' * 100, str(out_a / 'boot.bin'))
+    digest_b = store.store_bytes(memoryview(b'firmware' * 100), str(out_b / 'boot.bin'))
+    assert digest_a == digest_b == ContentStore.hash(b'firmware' * 100)
+    assert store.has(digest_a)
+    assert len(os.listdir(os.path.dirname(store.object_path(digest_a)))) == 1
+    assert (out_b / 'boot.bin').read_bytes() == b'firmware' * 100
+
+    method = store.link_into(digest_a, str(out_a / 'again.bin'))
+    if method == LINK_HARDLINK:
+        assert os.path.samefile(str(out_a / 'again.bin'), store.object_path(digest_a))
+    assert store.put_file(str(out_a / 'again.bin')) == digest_a
+
+
+def test_manifest_roundtrip(tmp_path):
+    manifest = ExtractionManifest('dump.bin')
+    manifest.add('boot.bin', 'ab' * 32, 10)
+    path = manifest.save(str(tmp_path))
+    loaded = ExtractionManifest.load(path)
+    assert loaded.to_dict() == manifest.to_dict()
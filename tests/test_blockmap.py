@@ -0,0 +1,33 @@
+from durango.nand.blockmap import BlockMap, BlockExtent
+
+
+def test_block_accounting():
+    block_map = BlockMap(0x100)
+    block_map.add(0x10, 0x10, 1, 'a.bin')
+    block_map.add(0x10, 0x10, 2, 'a.bin')
+    block_map.add(0x18, 0x10, 2, 'b.bin')
+    block_map.add(0x40, 0x08, 1, 'c.bin')
+    block_map.add(0x48, 0x00, 1, 'empty.bin')
+
+    assert block_map.used_extents == [(0x10, 0x28), (0x40, 0x48)]
+    assert block_map.used_blockcount == 0x20
+    assert block_map.free_blockcount == 0xE0
+    assert block_map.free_extents == [(0, 0x10), (0x28, 0x40), (0x48, 0x100)]
+    assert block_map.get_table_blockcount(1) == 0x18
+    assert block_map.get_table_extents(2) == [(0x10, 0x28)]
+    assert len(block_map.get_file_extents('a.bin')) == 2
+
+    overlaps = block_map.get_overlaps()
+    assert overlaps == [BlockExtent(0x18, 0x20, ((1, 'a.bin'), (2, 'a.bin'), (2, 'b.bin')))]
+    assert block_map.get_owners(0x10) == ((1, 'a.bin'), (2, 'a.bin'))
+    assert block_map.get_owners(0x27) == ((2, 'b.bin'),)
+    assert block_map.get_owners(0x30) == ()
+
+
+def test_owners_in_range():
+    block_map = BlockMap(0x100)
+    block_map.add(0x10, 0x10, 1, 'a.bin')
+    block_map.add(0x30, 0x10, 1, 'b.bin')
+    assert block_map.get_owners_in_range(0, 0x10) == set()
+    assert block_map.get_owners_in_range(0x1F, 0x31) == {(1, 'a.bin'), (1, 'b.bin')}
+    assert block_map.get_owners_in_range(0x20, 0x30) == set()
@@ -0,0 +1,56 @@
+import os
+import errno
+import pytest
+
+from durango.common import fastcopy
+
+
+def _raise(err):
+    def method(*args):
+        raise OSError(err, os.strerror(err))
+    return method
+
+
+@pytest.fixture
+def fds(tmp_path):
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(0x3000))
+    src_fd = os.open(str(src), os.O_RDONLY)
+    dst_fd = os.open(str(tmp_path / 'dst.bin'), os.O_RDWR | os.O_CREAT)
+    yield src_fd, dst_fd, src.read_bytes()
+    os.close(src_fd)
+    os.close(dst_fd)
+
+
+def test_copy_range(fds):
+    src_fd, dst_fd, data = fds
+    assert fastcopy.copy_range(src_fd, dst_fd, 0x1000, 0x1000, 0x10) == 0x1000
+    assert os.pread(dst_fd, 0x1000, 0x10) == data[0x1000:0x2000]
+    # Source ends early
+    assert fastcopy.copy_range(src_fd, dst_fd, 0x2800, 0x1000) == 0x800
+
+
+def test_unsupported_falls_back(fds, monkeypatch):
+    src_fd, dst_fd, data = fds
+    monkeypatch.setattr(fastcopy, '_copy_file_range', _raise(errno.EXDEV))
+    monkeypatch.setattr(fastcopy, '_sendfile', _raise(errno.EINVAL))
+    assert fastcopy.copy_range(src_fd, dst_fd, 0, 0x3000) == 0x3000
+    assert os.pread(dst_fd, 0x3000, 0) == data
+
+
+@pytest.mark.parametrize('err', [errno.ENOSPC, errno.EIO, errno.EBADF])
+def test_io_error_raises(fds, monkeypatch, err):
+    src_fd, dst_fd, _ = fds
+    monkeypatch.setattr(fastcopy, '_copy_file_range', _raise(err))
+    monkeypatch.setattr(fastcopy, '_sendfile', _raise(err))
+    with pytest.raises(OSError) as excinfo:
+        fastcopy.copy_range(src_fd, dst_fd, 0, 0x3000)
+    assert excinfo.value.errno == err
+
+
+def test_last_fallback_raises(fds, monkeypatch):
+    src_fd, dst_fd, _ = fds
+    for name in ('_copy_file_range', '_sendfile', '_pread_write'):
+        monkeypatch.setattr(fastcopy, name, _raise(errno.EINVAL))
+    with pytest.raises(OSError):
+        fastcopy.copy_range(src_fd, dst_fd, 0, 0x3000)
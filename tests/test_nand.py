@@ -0,0 +1,205 @@
+import io
+import os
+import json
+import struct
+import pytest
+
+from durango.common.blobstore import ContentStore, ExtractionManifest
+from durango.nand import convert
+from durango.nand.NANDOne import DurangoNand, get_dump_filelist, process_batch, process_dump
+from durango.nand.NANDOne import FLASH_SIZE_LOG, FLASH_SIZE_RAW, DUMP_TYPE_LOGICAL, DUMP_TYPE_RAW
+from durango.nand.nand_diff import NandDiff
+from durango.nand.update_config import UPDATE_CFG_MAGIC
+
+from tests.conftest import build_xbfs_header, build_xvd_header, write_nand_dump
+
+
+def test_parse_and_file_views(nand_dump):
+    with DurangoNand(nand_dump) as nand:
+        nand.parse()
+        assert nand.get_xbfs_sequence_list() == [1, 2]
+        table = nand.get_latest_xbfs_table()
+        view = nand.get_file_view('boot.bin', table)
+        assert isinstance(view, memoryview)
+        assert view == b'A' * 0x1000 + b'B' * 0x1000
+        view.release()
+        assert nand.get_file_view('host.xvd', table) is None
+
+
+def test_extract_files(nand_dump, tmp_path):
+    dest = tmp_path / 'out'
+    store_dest = tmp_path / 'out_store'
+    with DurangoNand(nand_dump) as nand:
+        nand.parse()
+        table = nand.get_latest_xbfs_table()
+        nand.extract_files_from_table(table, str(dest))
+        store = ContentStore(str(tmp_path / 'store'))
+        nand.extract_files_from_table(table, str(store_dest), store)
+
+    assert sorted(os.listdir(str(dest))) == ['boot.bin', 'header.bin']
+    assert (dest / 'boot.bin').read_bytes() == b'A' * 0x1000 + b'B' * 0x1000
+    assert (store_dest / 'boot.bin').read_bytes() == (dest / 'boot.bin').read_bytes()
+    manifest = ExtractionManifest.load(str(store_dest / 'manifest.json'))
+    assert [f['name'] for f in manifest.files] == ['header.bin', 'boot.bin']
+    assert manifest.files[1]['sha256'] == ContentStore.hash((dest / 'boot.bin').read_bytes())
+
+
+def test_process_batch(nand_dump, tmp_path):
+    invalid = tmp_path / 'invalid.bin'
+    with open(str(invalid), 'wb') as f:
+        f.truncate(0x13BC00000)
+    filelist = get_dump_filelist(str(tmp_path))
+    assert filelist == [str(invalid), nand_dump]
+
+    output = io.StringIO()
+    assert process_batch(filelist, output, jobs=2) == 1
+    records = dict((r['filename'], r) for r in map(json.loads, output.getvalue().splitlines()))
+    assert 'error' in records[str(invalid)]
+    summary = records[nand_dump]
+    assert summary['sequence_versions'] == [1, 2]
+    assert summary['used_blocks'] == 5
+    assert summary['tables'][1]['files'][1] == {'name': 'boot.bin', 'offset': 0x300000,
+                                                'size': 0x2000}
+
+
+def test_validate(nand_dump):
+    with DurangoNand(nand_dump) as nand:
+        nand.parse()
+        report = nand.validate(jobs=2)
+        text = nand.generate_validation_details(report)
+    assert [h['hash_valid'] for h in report['headers']] == [True, True]
+    assert report['differing_files'] == ['boot.bin']
+    assert report['missing_files'] == {}
+    assert report['files']['header.bin']['1'] == report['files']['header.bin']['2']
+    assert report['files']['boot.bin']['1'] == ContentStore.hash(b'A' * 0x2000)
+    assert 'boot.bin seq 2' in text
+
+
+def test_validate_invalid_header_hash(tmp_path):
+    headers = {0x10000: build_xbfs_header(1, {1: (0x100, 1)}, valid_hash=False)}
+    dump = write_nand_dump(tmp_path / 'bad.bin', headers, {})
+    with DurangoNand(dump) as nand:
+        nand.parse()
+        assert nand.validate()['headers'][0]['hash_valid'] is False
+
+
+def test_nand_diff_and_patch(nand_dump, tmp_path):
+    headers = {0x10000: build_xbfs_header(1, {1: (0x100, 1), 16: (0x200, 2)})}
+    blocks = {0x100: b'H' * 0x1000, 0x201: b'C' * 0x1000, 0x3FF: b'Z' * 0x10}
+    other = write_nand_dump(tmp_path / 'other.bin', headers, blocks)
+
+    nands = [DurangoNand(nand_dump), DurangoNand(other)]
+    for nand in nands:
+        nand.parse()
+    differ = NandDiff(nands, chunk_blocks=0x80, jobs=2, block_count=0x400)
+    extents = differ.compare()
+    assert [(e.start, e.end) for e in extents] == [(0x200, 0x202), (0x300, 0x302),
+                                                   (0x3FF, 0x400)]
+    assert extents[0].files == ['boot.bin']
+    assert extents[0].to_dict()['dumps'] == [1]
+    assert extents[2].files == []
+
+    # Every differing block of dump 1 is part of the patch
+    patch = io.BytesIO()
+    differ.write_patch(extents, patch)
+    for nand in nands:
+        nand.close()
+    patch.seek(0)
+    NandDiff.apply_patch(patch, nand_dump)
+    with io.open(nand_dump, 'rb') as a, io.open(other, 'rb') as b:
+        assert a.read(0x400000) == b.read(0x400000)
+
+
+def test_dump_type_and_logical_view(tmp_path):
+    headers = {0x10000: build_xbfs_header(1, {1: (0x100, 1)})}
+    blocks = {0x100: b'H' * 0x1000}
+    logical = write_nand_dump(tmp_path / 'logical.bin', headers, blocks, FLASH_SIZE_LOG)
+    raw = write_nand_dump(tmp_path / 'raw.bin', headers, blocks, FLASH_SIZE_RAW)
+    assert DurangoNand(logical).dump_type == DUMP_TYPE_LOGICAL
+    assert DurangoNand(raw).dump_type == DUMP_TYPE_RAW
+
+    with DurangoNand(raw, logical_view=True) as nand:
+        nand.parse()
+        assert nand.total_blocks == FLASH_SIZE_LOG // 0x1000
+        assert nand.block_map.free_blockcount == nand.total_blocks - 1
+        view = nand.get_file_view('header.bin', nand.get_latest_xbfs_table())
+        assert bytes(view) == b'H' * 0x1000
+        view.release()
+
+
+def test_convert_dump(tmp_path, monkeypatch):
+    # Scaled down layout: 4 logical blocks, followed by 1 reserved block
+    monkeypatch.setattr(convert, 'LOGICAL_EXTENTS', [(0, 0, 0x4000)])
+    monkeypatch.setattr(convert, 'DUMP_SIZES', {DUMP_TYPE_LOGICAL: 0x4000,
+                                                DUMP_TYPE_RAW: 0x5000})
+    raw = tmp_path / 'raw.bin'
+    raw.write_bytes(os.urandom(0x5000))
+    progress = list()
+
+    logical = str(tmp_path / 'logical.bin')
+    assert convert.convert_dump(str(raw), logical, DUMP_TYPE_LOGICAL,
+                                lambda done, total: progress.append((done, total))) == 0x4000
+    assert io.open(logical, 'rb').read() == raw.read_bytes()[:0x4000]
+    assert progress[-1] == (0x4000, 0x4000)
+
+    back = str(tmp_path / 'back.bin')
+    convert.convert_dump(logical, back, DUMP_TYPE_RAW)
+    assert io.open(back, 'rb').read() == raw.read_bytes()[:0x4000] + b'\0' * 0x1000
+
+    # Source must survive a destination that resolves to itself
+    os.symlink(str(raw), str(tmp_path / 'alias.bin'))
+    for dest in (str(raw), str(tmp_path / 'alias.bin')):
+        with pytest.raises(ValueError):
+            convert.convert_dump(str(raw), dest, DUMP_TYPE_LOGICAL)
+    assert convert.get_dump_type(str(raw)) == DUMP_TYPE_RAW
+
+
+def test_xvd_info(tmp_path):
+    # system.xvd (index 6) holds a XVD header, host.xvd (index 17) garbage
+    headers = {0x10000: build_xbfs_header(1, {6: (0x100, 4), 17: (0x200, 1)})}
+    blocks = {0x100: build_xvd_header(content_type=2), 0x200: b'X' * 0x1000}
+    dump = write_nand_dump(tmp_path / 'nand.bin', headers, blocks)
+    with DurangoNand(dump) as nand:
+        nand.parse()
+        table = nand.get_latest_xbfs_table()
+        xvd = nand.get_xvd_file('system.xvd', table)
+        assert xvd.header.content_type == 2
+        xvd.close()
+        assert nand.get_xvd_file('sostmpl.xvd', table) is None
+
+        summary = nand.generate_xvd_summary(table)
+        assert [e['name'] for e in summary] == ['system.xvd', 'host.xvd']
+        assert summary[0]['content_type'] == 'SystemOS'
+        assert summary[0]['offset'] == 0x100000
+        assert 'error' in summary[1]
+        assert 'system.xvd: SystemOS' in nand.generate_xvd_details(table)
+
+
+def build_update_cfg(before, after, filenames):
+    build = before.ljust(176, b'\x00') + after.ljust(176, b'\x00') + b'build'.ljust(134, b'\x00')
+    files = b''.join(struct.pack('<IQ', 1, 2) + name.ljust(64, b'\x00') for name in filenames)
+    files = files.ljust(19 * 76, b'\x00')
+    header = struct.pack('<HBBI', 7, 1, 0x40, 0) + b'\x11' * 32 + \
+        struct.pack('<IIBB', UPDATE_CFG_MAGIC, 50 + len(build) + len(files), 0, 12)
+    return header + build + files
+
+
+def test_update_history(tmp_path):
+    # Sequence 1 update.cfg (index 22) is valid, sequence 2 holds garbage
+    headers = {
+        0x10000: build_xbfs_header(1, {22: (0x100, 1)}),
+        0x810000: build_xbfs_header(2, {22: (0x200, 1)})
+    }
+    blocks = {
+        0x100: build_update_cfg(b'10.0.1', b'10.0.2', [b'system.xvd', b'host.xvd']),
+        0x200: b'X' * 0x1000
+    }
+    dump = write_nand_dump(tmp_path / 'nand.bin', headers, blocks)
+    summary = process_dump(dump, update_history=True)
+    history = summary['update_history']
+    assert [h['sequence_version'] for h in history] == [1, 2]
+    assert history[0]['build']['build_id_before'] == '10.0.1'
+    assert history[0]['build']['build_id_after'] == '10.0.2'
+    assert [f['filename'] for f in history[0]['files']] == ['system.xvd', 'host.xvd']
+    assert 'error' in history[1]
+    json.dumps(summary)
@@ -0,0 +1,138 @@
+import os
+import threading
+import http.client
+import pytest
+
+from durango.network_transfer.server import NetworkTransferHTTPServer, NetworkTransferServer, \
+    FileDescriptorPool
+
+
+@pytest.fixture
+def transfer_server(tmp_path, monkeypatch, request):
+    content = os.urandom(0x400000)
+    (tmp_path / 'col' / 'content').mkdir(parents=True)
+    (tmp_path / 'col' / 'metadata').write_bytes(b'{"Items": []}')
+    (tmp_path / 'col' / 'content' / 'title').write_bytes(content)
+    monkeypatch.chdir(tmp_path)
+
+    options = getattr(request, 'param', dict(workers=3))
+    httpd = NetworkTransferHTTPServer(('127.0.0.1', 0), NetworkTransferServer, **options)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address, content
+    httpd.shutdown()
+    httpd.server_close()
+    NetworkTransferServer.file_pool.close()
+
+
+def _get_range(conn, start, end):
+    conn.request('GET', '/col/content/title', headers={'Range': 'bytes=%i-%i' % (start, end)})
+    response = conn.getresponse()
+    return response, response.read()
+
+
+def test_keepalive_ranges(transfer_server):
+    (host, port), content = transfer_server
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    _, data = _get_range(conn, 0, 0x7FF)
+    sock = conn.sock
+    response, data2 = _get_range(conn, 0x800, 0xFFF)
+    # Same connection reused
+    assert conn.sock is sock
+    assert response.version == 11 and response.status == 206
+    assert response.getheader('Content-Range') == 'bytes 2048-4095/%i' % len(content)
+    assert data + data2 == content[:0x1000]
+
+    conn.request('GET', '/col/metadata')
+    response = conn.getresponse()
+    assert response.read() == b'{"Items": []}'
+    conn.close()
+
+
+def test_concurrent_connections(transfer_server):
+    (host, port), content = transfer_server
+    # Persistent connections of several consoles, each holds a worker
+    conns = [http.client.HTTPConnection(host, port, timeout=5) for _ in range(3)]
+    for _ in range(2):
+        for i, conn in enumerate(conns):
+            response, data = _get_range(conn, i * 0x100, i * 0x100 + 0xFF)
+            assert response.status == 206
+            assert data == content[i * 0x100:(i + 1) * 0x100]
+    for conn in conns:
+        conn.close()
+
+
+@pytest.mark.parametrize('transfer_server', [dict(workers=1, backlog=1)], indirect=True)
+def test_backlog_limit(transfer_server):
+    (host, port), content = transfer_server
+    # Holds the only worker
+    active = http.client.HTTPConnection(host, port, timeout=5)
+    assert _get_range(active, 0, 0xF)[1] == content[:0x10]
+    # Waits for the worker
+    waiting = http.client.HTTPConnection(host, port, timeout=5)
+    waiting.connect()
+    # Backlog full -> rejected right away instead of stalling
+    rejected = http.client.HTTPConnection(host, port, timeout=5)
+    response, _ = _get_range(rejected, 0, 0xF)
+    assert response.status == 503
+    rejected.close()
+
+    waiting_result = list()
+    thread = threading.Thread(target=lambda: waiting_result.append(_get_range(waiting, 0x10, 0x1F)))
+    thread.start()
+    active.close()
+    thread.join(5)
+    assert waiting_result[0][1] == content[0x10:0x20]
+    waiting.close()
+
+
+@pytest.mark.parametrize('fallback', [False, True])
+def test_large_range(transfer_server, monkeypatch, fallback):
+    (host, port), content = transfer_server
+    if fallback:
+        monkeypatch.setattr(NetworkTransferServer, '_sendfile', lambda *args: 0)
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    # Larger than the socket buffers
+    response, data = _get_range(conn, 1, len(content) - 2)
+    assert response.status == 206 and data == content[1:-1]
+    # End beyond filesize is clamped
+    response, data = _get_range(conn, len(content) - 4, len(content) + 100)
+    assert data == content[-4:]
+    assert response.getheader('Content-Range') == 'bytes %i-%i/%i' % (
+        len(content) - 4, len(content) - 1, len(content))
+    response, data = _get_range(conn, len(content), len(content) + 1)
+    assert response.status == 416 and data == b''
+    conn.close()
+
+
+def test_file_descriptor_pool(tmp_path):
+    paths = list()
+    for i in range(4):
+        path = tmp_path / ('file%i' % i)
+        path.write_bytes(b'x' * (i + 1))
+        paths.append(str(path))
+
+    pool = FileDescriptorPool(max_open=2)
+    with pool.open(paths[0]) as first:
+        assert first.size == 1
+        with pool.open(paths[0]) as again:
+            assert again is first and first.users == 2
+        # In use -> survives eviction
+        for path in paths[1:]:
+            with pool.open(path):
+                pass
+        assert first.fd is not None and paths[0] in pool._entries
+    assert len(pool) == 2
+    assert list(pool._entries) == [paths[0], paths[3]]
+
+    # Modified file is reopened
+    with pool.open(paths[3]) as old:
+        pass
+    os.truncate(paths[3], 0)
+    os.utime(paths[3], ns=(0, 0))
+    with pool.open(paths[3]) as entry:
+        assert entry is not old and entry.size == 0
+    assert old.stale and old.fd is None
+
+    pool.close()
+    assert len(pool) == 0
@@ -0,0 +1,30 @@
+import io
+import json
+import pytest
+
+from durango.common.report import open_report, FORMAT_NDJSON, FORMAT_MSGPACK, FORMAT_JSON
+
+
+def test_ndjson_report(tmp_path):
+    path = str(tmp_path / 'report.ndjson')
+    with open_report(path, FORMAT_NDJSON) as writer:
+        writer.write({'a': 1})
+        writer.write({'b': [1, 2]})
+    assert writer.count == 2
+    with io.open(path, 'r') as f:
+        assert [json.loads(line) for line in f] == [{'a': 1}, {'b': [1, 2]}]
+
+
+def test_msgpack_report(tmp_path):
+    msgpack = pytest.importorskip('msgpack')
+    path = str(tmp_path / 'report.msgpack')
+    with open_report(path, FORMAT_MSGPACK) as writer:
+        writer.write({'a': 1})
+        writer.write({'b': 'c'})
+    with io.open(path, 'rb') as f:
+        assert list(msgpack.Unpacker(f, raw=False)) == [{'a': 1}, {'b': 'c'}]
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        open_report(None, FORMAT_JSON)
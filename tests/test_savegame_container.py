@@ -0,0 +1,33 @@
+import uuid
+import pytest
+
+from durango.fileformat.savegame_container import ContainerIndex, ContainerIndexFast
+
+from tests.conftest import build_containers_index
+
+
+def build_index(count):
+    saves = [('save%i' % i, uuid.UUID(int=i), uuid.UUID(int=i + 0x1000), i % 256, i * 0x10)
+             for i in range(count)]
+    return build_containers_index('Game ™', 'Game_aum!App', 'prod1', saves)
+
+
+@pytest.mark.parametrize('count', [0, 1, 300])
+def test_fast_index_matches_construct(count):
+    data = build_index(count)
+    slow = ContainerIndex.parse(data)
+    fast = ContainerIndexFast.parse(data)
+    assert fast == slow
+    assert list(fast.keys()) == list(slow.keys())
+    for fast_entry, slow_entry in zip(fast.files, slow.files):
+        assert list(fast_entry.keys()) == list(slow_entry.keys())
+        assert fast_entry.folder_guid == slow_entry.folder_guid
+    # Any buffer object
+    assert ContainerIndexFast.parse(bytearray(data)) == slow
+
+
+def test_fast_index_truncated():
+    data = build_index(2)
+    for size in (4, len(data) - 1):
+        with pytest.raises(Exception):
+            ContainerIndexFast.parse(data[:size])
@@ -0,0 +1,233 @@
+import io
+import os
+import time
+import shutil
+import tarfile
+import pytest
+import threading
+
+from durango.fileformat.savegame_container import CONTAINERS_INDEX
+from durango.hdd.savegame_enum import SavegameEnumerator
+from durango.hdd.savegame_snapshot import SavegameSnapshot
+from durango.hdd.savegame_watcher import SavegameWatcher, BACKEND_POLL, BACKEND_INOTIFY
+
+from tests.conftest import guid, write_savegame_folder
+
+
+def test_get_folderlist(savegame_dir):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    assert [os.path.basename(f)[:2] for f in folderlist] == ['m_', 'u_']
+    # Explicit savegame folder
+    assert SavegameEnumerator.get_folderlist(folderlist[1]) == [folderlist[1]]
+
+
+def test_parse_savegamefolders(savegame_dir):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    serial = SavegameEnumerator().parse_savegamefolders(folderlist, jobs=1)
+    parallel = SavegameEnumerator().parse_savegamefolders(folderlist, jobs=4)
+    assert serial == parallel
+
+    user = serial['00000000-0000-0000-0000-000000000100']
+    assert user['name'] == 'Game'
+    assert [s['filename'] for s in user['savegames']] == ['save1']
+    assert user['savegames'][0]['xuid'] == 1234
+    assert os.path.isfile(user['savegames'][0]['filepath'])
+    machine = serial['00000000-0000-0000-0000-000000000200']
+    assert machine['savegames'][0]['blob_number'] == 2
+
+
+def test_scan_incremental(savegame_dir, tmp_path):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    full = SavegameEnumerator().parse_savegamefolders(folderlist)
+
+    with SavegameSnapshot(str(tmp_path / 'snapshot.sqlite')) as snapshot:
+        enumerator = SavegameEnumerator()
+        delta = enumerator.scan_incremental(folderlist, snapshot, savegame_dir)
+        assert enumerator.savegame_content == full
+        assert sorted(s['filename'] for s in delta['added']) == ['config', 'save1']
+        assert delta['removed'] == delta['modified'] == []
+
+        # Unchanged -> served from snapshot, empty delta
+        enumerator = SavegameEnumerator()
+        delta = enumerator.scan_incremental(folderlist, snapshot, savegame_dir)
+        assert enumerator.savegame_content == full
+        assert delta == {'added': [], 'removed': [], 'modified': [], 'errors': []}
+
+        # Grow save1, add save2, drop the machine folder
+        user_folder = folderlist[1]
+        shutil.rmtree(user_folder)
+        shutil.rmtree(folderlist[0])
+        write_savegame_folder(savegame_dir, os.path.basename(user_folder), 'Game',
+                              'Game_aum!App', 'prod1', [
+                                  ('save1', guid(1), guid(2), 1, 0x40),
+                                  ('save2', guid(7), guid(8), 1, 0x10)
+                              ])
+        index_path = os.path.join(user_folder, CONTAINERS_INDEX)
+        stat = os.stat(index_path)
+        os.utime(index_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+        delta = SavegameEnumerator().scan_incremental(folderlist, snapshot, savegame_dir)
+        assert [s['filename'] for s in delta['added']] == ['save2']
+        assert [s['filename'] for s in delta['removed']] == ['config']
+        assert [(s['filename'], s['filesize']) for s in delta['modified']] == [('save1', 0x40)]
+
+
+def test_scan_incremental_errors(savegame_dir, tmp_path):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    machine_folder, user_folder = folderlist
+    with SavegameSnapshot(str(tmp_path / 'snapshot.sqlite')) as snapshot:
+        SavegameEnumerator().scan_incremental(folderlist, snapshot, savegame_dir)
+
+        # Corrupt user index, machine folder vanishes after being listed
+        with open(os.path.join(user_folder, CONTAINERS_INDEX), 'wb') as f:
+            f.write(b'\xff' * 4)
+        _touch_index(user_folder)
+        shutil.rmtree(machine_folder)
+        enumerator = SavegameEnumerator()
+        delta = enumerator.scan_incremental(folderlist, snapshot, savegame_dir)
+        assert delta['errors'] == [user_folder]
+        assert [s['filename'] for s in delta['removed']] == ['config']
+        assert delta['added'] == delta['modified'] == []
+        # Previous state of the broken folder is kept
+        assert [s['filename'] for s in enumerator.get_savegames(product_id='prod1')] == ['save1']
+        assert snapshot.get(user_folder) is not None
+        assert snapshot.get(machine_folder) is None
+
+
+def _touch_index(folderpath):
+    index_path = os.path.join(folderpath, CONTAINERS_INDEX)
+    stat = os.stat(index_path)
+    os.utime(index_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_update_folders(savegame_dir):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    enumerator = SavegameEnumerator()
+    enumerator.parse_savegamefolders(folderlist)
+    shutil.rmtree(folderlist[0])
+    delta = enumerator.update_folders([folderlist[0]])
+    assert [s['filename'] for s in delta['removed']] == ['config']
+    assert list(enumerator.savegame_content) == ['00000000-0000-0000-0000-000000000100']
+
+
+@pytest.mark.parametrize('backend', [BACKEND_POLL, BACKEND_INOTIFY])
+def test_watcher(savegame_dir, backend):
+    if backend == BACKEND_INOTIFY:
+        pytest.importorskip('inotify_simple')
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    changes = list()
+    changed = threading.Event()
+
+    def on_change(folderpaths):
+        changes.append(folderpaths)
+        changed.set()
+
+    with SavegameWatcher(savegame_dir, on_change, interval=0.05, backend=backend):
+        # Give inotify time to set up its watches
+        time.sleep(0.2)
+        _touch_index(folderlist[1])
+        with open(os.path.join(folderlist[1], CONTAINERS_INDEX), 'ab') as f:
+            f.write(b'\x00')
+        assert changed.wait(5)
+    assert changes[0] == [folderlist[1]]
+
+
+def test_title_and_savegame_lookup(savegame_dir):
+    enumerator = SavegameEnumerator()
+    enumerator.parse_savegamefolders(SavegameEnumerator.get_folderlist(savegame_dir))
+
+    node = enumerator.get_title_node(guid='00000000-0000-0000-0000-000000000100')
+    assert enumerator.get_title_node(product_id='PROD1') is node
+    assert enumerator.get_title_node(aum_id='Game_aum!App') is node
+    assert enumerator.get_title_node(product_id='unknown') is None
+    assert enumerator.get_title_node() is None
+
+    assert [s['filename'] for s in enumerator.get_savegames(xuid=1234)] == ['save1']
+    assert [s['filename'] for s in enumerator.get_savegames(xuid='0')] == ['config']
+    assert [s['filename'] for s in enumerator.get_savegames(product_id='prod2')] == ['config']
+    assert enumerator.get_savegames(product_id='prod2', xuid=1234) == []
+    assert enumerator.get_savegames(aum_id='Game_aum!App', xuid=1234) == node['savegames']
+
+    # Indexes follow incremental updates
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    shutil.rmtree(folderlist[0])
+    enumerator.update_folders([folderlist[0]])
+    assert enumerator.get_savegames(xuid=0) == []
+    assert enumerator.get_title_node(product_id='prod2') is None
+
+
+def test_iter_savegame_records(savegame_dir):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir) * 20
+    enumerator = SavegameEnumerator()
+    records = list(enumerator.iter_savegame_records(folderlist, jobs=2))
+    assert enumerator.savegame_content == {}
+    assert [r['filename'] for r in records] == ['config', 'save1'] * 20
+    assert records[1]['id'] == 'prod1' and records[1]['name'] == 'Game'
+
+    delta = {'added': records[:1], 'removed': [], 'modified': records[1:2]}
+    changes = [r['change'] for r in SavegameEnumerator.iter_delta_records(delta)]
+    assert changes == ['added', 'modified']
+
+
+def test_iter_scan_incremental(savegame_dir, tmp_path):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    with SavegameSnapshot(str(tmp_path / 'snapshot.sqlite')) as snapshot:
+        enumerator = SavegameEnumerator()
+        scan = enumerator.iter_scan_incremental(folderlist, snapshot, savegame_dir)
+        # First folder is available before the second one got parsed
+        folderpath, record, delta = next(scan)
+        assert folderpath == folderlist[0] and record['id'] == 'prod2'
+        assert [s['filename'] for s in delta['added']] == ['config']
+        assert snapshot.get(folderlist[1]) is None
+        assert [r for _, r, _ in scan][0]['id'] == 'prod1'
+        assert enumerator.folder_records == {}
+
+        # Reparsed folder, then the vanished one
+        _touch_index(folderlist[1])
+        shutil.rmtree(folderlist[0])
+        results = list(SavegameEnumerator().iter_scan_incremental(
+            folderlist, snapshot, savegame_dir))
+        assert [(f, r is not None) for f, r, _ in results] == \
+            [(folderlist[1], True), (folderlist[0], False)]
+        assert [s['filename'] for s in results[1][2]['removed']] == ['config']
+
+
+def test_export_savegames(savegame_dir, tmp_path):
+    folderlist = SavegameEnumerator.get_folderlist(savegame_dir)
+    enumerator = SavegameEnumerator()
+    enumerator.parse_savegamefolders(folderlist)
+    user_folder = os.path.basename(folderlist[1])
+
+    progress = list()
+    dest_dir = str(tmp_path / 'export')
+    size = enumerator.export_savegames(dest_dir, product_id='prod1', jobs=2,
+                                       progress_callback=lambda *p: progress.append(p))
+    assert progress[-1] == (size, size)
+    exported = sorted(os.path.relpath(os.path.join(d, f), dest_dir)
+                      for d, _, files in os.walk(dest_dir) for f in files)
+    assert os.path.join(user_folder, CONTAINERS_INDEX) in exported
+    assert 'export.json' in exported
+    assert not any(f.startswith('m_') for f in exported)
+    # Exported folder parses like the original one
+    copy = SavegameEnumerator().parse_savegamefolders(
+        SavegameEnumerator.get_folderlist(dest_dir))
+    original = enumerator.get_savegames(product_id='prod1')
+    assert [s['file_guid'] for s in copy['00000000-0000-0000-0000-000000000100']['savegames']] == \
+        [s['file_guid'] for s in original]
+
+    # Tar stream, everything
+    tar_path = str(tmp_path / 'export.tar')
+    enumerator.export_savegames(tar_path, tar=True)
+    with open(tar_path, 'rb') as f, io.BytesIO() as stream:
+        assert enumerator.export_savegames(stream, tar=True) > 0
+        # Kernel-side copy and streamed copy produce identical members
+        with tarfile.open(fileobj=io.BytesIO(stream.getvalue())) as streamed, \
+                tarfile.open(fileobj=f) as copied:
+            names = copied.getnames()
+            assert names == streamed.getnames()
+            assert any(n.startswith('m_') for n in names) and 'export.json' in names
+            for name in names[:-1]:
+                assert copied.extractfile(name).read() == streamed.extractfile(name).read()
+                with open(os.path.join(savegame_dir, name), 'rb') as orig:
+                    assert copied.extractfile(name).read() == orig.read()
@@ -0,0 +1,198 @@
+import struct
+import pytest
+
+from durango.fileformat.xvd import XvdFile, XvdFastHeader, XVD_HEADER_SIZE, \
+    XVD_BLOCK_SIZE, INVALID_SECTOR
+from durango.fileformat.xvc import XvcRegionFlags, XVC_INFO_SIZE, XVC_REGION_HEADER_SIZE
+from durango.hdd.xvd_scanner import XvdScanner, EXECUTOR_TYPES
+from durango.hdd.xvd_index import XvdHeaderIndex
+
+
+@pytest.fixture
+def xvd_path(tmp_path, xvd_header_builder):
+    header = xvd_header_builder(embedded_xvd_length=0x1800, userdata_length=0x200)
+    data = bytearray(header.ljust(0x3000, b'\x00'))
+    data += b'\xEE' * 0x1800 + b'\x00' * 0x800
+    data += b'\xDD' * 0x200
+    path = tmp_path / 'test.xvd'
+    path.write_bytes(bytes(data.ljust(0x8000, b'\x00')))
+    return str(path)
+
+
+def test_region_offsets(xvd_path):
+    xvd = XvdFile(xvd_path)
+    assert xvd.embedded_xvd_offset == 0x3000
+    assert xvd.mdu_offset == 0x5000
+    assert xvd.hash_tree_page_count == 0
+    assert xvd.userdata_offset == 0x5000
+
+
+def test_mmap_views_match_reads(xvd_path):
+    plain = XvdFile(xvd_path)
+    with XvdFile(xvd_path, use_mmap=True) as mapped:
+        assert mapped.is_mapped
+        assert mapped.header == plain.header
+        # Full equivalence with the construct parser
+        assert plain.header.as_dict() == XvdFile.parse_header(
+            open(xvd_path, 'rb').read(XVD_HEADER_SIZE), fast=False)
+
+        embedded = mapped.extract_embedded_xvd()
+        assert isinstance(embedded, memoryview)
+        assert embedded == plain.extract_embedded_xvd() == b'\xEE' * 0x1800
+
+        userdata = mapped.extract_user_data()
+        assert userdata == plain.extract_user_data() == b'\xDD' * 0x200
+
+        header_view = mapped.get_header_view()
+        assert len(header_view) == XVD_HEADER_SIZE
+        assert mapped.header == XvdFile.parse_header(bytes(header_view), fast=False)
+        assert mapped.extract_xvc_data() is None
+        for view in (embedded, userdata, header_view):
+            view.release()
+    assert not mapped.is_mapped
+
+
+def test_buffer_and_window(xvd_path, tmp_path):
+    data = open(xvd_path, 'rb').read()
+    container = tmp_path / 'container.bin'
+    container.write_bytes(b'\x55' * 0x2000 + data + b'\x55' * 0x2000)
+
+    with XvdFile.from_buffer(bytearray(data), name='test.xvd') as buffered:
+        assert buffered.is_mapped and buffered.filepath == 'test.xvd'
+        embedded = buffered.extract_embedded_xvd()
+        assert embedded == b'\xEE' * 0x1800
+        embedded.release()
+
+    with open(str(container), 'rb') as f:
+        windowed = XvdFile.from_window(f.fileno(), 0x2000, len(data))
+        assert windowed.is_window and not windowed.is_mapped
+        assert windowed.extract_user_data() == b'\xDD' * 0x200
+        # Reads are clipped to the window
+        assert windowed.read(len(data) - 0x10, 0x100) == b'\x00' * 0x10
+
+    with pytest.raises(Exception):
+        XvdFile.from_buffer(b'\x00' * 0x100)
+
+
+def test_fast_header_matches_construct(xvd_header_builder):
+    buf = bytearray(xvd_header_builder(volume_flags=0x85, xvd_type=1, content_type=0x21,
+                                       mutable_data_page_count=2))
+    struct.pack_into('<IIQII', buf, 0x29C + 0x18, 1, 2, 0x30000, 4, 5)
+    buf[0x2FC:0x30C] = bytes(range(16))
+    buf[0x3C4:0x464] = b'\xAB' * 0xA0
+    buf = bytes(buf)
+
+    slow = XvdFile.parse_header(buf, fast=False)
+    fast = XvdFile.parse_header(buf, fast=True)
+    assert isinstance(fast, XvdFastHeader)
+    for name in slow.keys():
+        assert getattr(fast, name) == slow[name], name
+    assert fast == slow and list(fast.as_dict().keys()) == list(slow.keys())
+
+
+def test_scanner_parallel_matches_serial(tmp_path, xvd_header_builder):
+    filelist = list()
+    for i in range(8):
+        path = tmp_path / ('%i.xvd' % i)
+        path.write_bytes(xvd_header_builder(content_type=i))
+        filelist.append(str(path))
+    invalid = tmp_path / 'invalid'
+    invalid.write_bytes(b'\x00' * 0x1000)
+    filelist.append(str(invalid))
+
+    serial = dict(XvdScanner().scan(filelist))
+    for executor in EXECUTOR_TYPES:
+        scanned = dict(XvdScanner(jobs=3, executor=executor).scan(filelist))
+        assert sorted(scanned) == sorted(serial) == sorted(filelist[:-1])
+        for filepath, header in scanned.items():
+            assert header.content_type == serial[filepath].content_type
+
+
+def test_scanner_index_cache(tmp_path, xvd_header_builder):
+    path = tmp_path / 'a.xvd'
+    path.write_bytes(xvd_header_builder(content_type=6))
+    filepath = str(path)
+
+    with XvdHeaderIndex(str(tmp_path / 'index' / 'idx.sqlite')) as index:
+        scanner = XvdScanner(index=index)
+        assert index.lookup(filepath) is None
+        parsed = dict(scanner.scan([filepath]))
+        cached = index.lookup(filepath)
+        assert cached is not None
+        for name in ('content_type', 'product_id', 'content_id', 'filetime_created',
+                     'volume_flags', 'sandbox_id', 'package_version', 'ext_entry'):
+            assert getattr(cached, name) == getattr(parsed[filepath], name)
+
+        # Changed file -> stale entry
+        path.write_bytes(xvd_header_builder(content_type=1) + b'\x00')
+        assert index.lookup(filepath) is None
+        assert dict(scanner.scan([filepath]))[filepath].content_type == 1
+
+        assert index.prune([], root=str(tmp_path)) == 1
+        assert index.lookup(filepath) is None
+
+
+def test_dynamic_sparse_extraction(tmp_path, xvd_header_builder):
+    block_count = 4
+    bat = struct.pack('<4I', 2, INVALID_SECTOR, 3, INVALID_SECTOR)
+    header = xvd_header_builder(xvd_type=1, drive_size=block_count * XVD_BLOCK_SIZE,
+                                dynamic_header_length=len(bat))
+    xvd = bytearray(header.ljust(0x3000, b'\x00'))
+    xvd += bat.ljust(0x1000, b'\x00')
+    xvd = xvd.ljust(2 * XVD_BLOCK_SIZE, b'\x00')
+    xvd += b'\x11' * XVD_BLOCK_SIZE + b'\x22' * XVD_BLOCK_SIZE
+    path = tmp_path / 'dynamic.xvd'
+    path.write_bytes(bytes(xvd))
+
+    with XvdFile(str(path), use_mmap=True) as xvd_file:
+        assert xvd_file.dynamic_header_offset == 0x3000
+        bat_obj = xvd_file.get_block_allocation_table()
+        assert bat_obj.allocated_block_count == 2
+        assert bat_obj.get_file_offset(1) is None
+        assert list(bat_obj.iter_extents()) == [
+            (0, 2 * XVD_BLOCK_SIZE, XVD_BLOCK_SIZE),
+            (2 * XVD_BLOCK_SIZE, 3 * XVD_BLOCK_SIZE, XVD_BLOCK_SIZE)
+        ]
+        out = tmp_path / 'drive.img'
+        written = xvd_file.extract_drive_image(str(out))
+
+    assert written == 2 * XVD_BLOCK_SIZE
+    image = out.read_bytes()
+    assert len(image) == block_count * XVD_BLOCK_SIZE
+    assert image == b'\x11' * XVD_BLOCK_SIZE + bytes(XVD_BLOCK_SIZE) + \
+        b'\x22' * XVD_BLOCK_SIZE + bytes(XVD_BLOCK_SIZE)
+
+
+def test_xvc_regions(tmp_path, xvd_header_builder):
+    regions = [('XVC-HD', 0, 0x10, 0x2000), ('FS-MD', XvcRegionFlags.FileSystemMetadata,
+                                             0x20, 0x1800)]
+    xvc_length = XVC_INFO_SIZE + len(regions) * XVC_REGION_HEADER_SIZE
+    header = xvd_header_builder(xvc_length=xvc_length)
+    xvc = bytearray(XVC_INFO_SIZE)
+    struct.pack_into('<I', xvc, 0xD14, len(regions))
+    data_offset = 0x4000
+    for idx, (desc, flags, region_id, length) in enumerate(regions):
+        region_header = bytearray(XVC_REGION_HEADER_SIZE)
+        struct.pack_into('<IHHII', region_header, 0, region_id, 0, 0, flags, 0)
+        region_header[0x10:0x10 + len(desc) * 2] = desc.encode('utf-16-le')
+        struct.pack_into('<QQ', region_header, 0x50, data_offset, length)
+        xvc += region_header
+        data_offset += length
+    data = bytearray(header.ljust(0x3000, b'\x00') + xvc).ljust(0x4000, b'\x00')
+    data += b'\xAA' * 0x2000 + bytes(range(256)) * 0x18
+    path = tmp_path / 'xvc.xvd'
+    path.write_bytes(bytes(data))
+
+    with XvdFile(str(path), use_mmap=True) as xvd:
+        assert xvd.xvc_info.region_count == 2
+        parsed = list(xvd.iter_regions())
+        assert [r.description for r in parsed] == ['XVC-HD', 'FS-MD']
+        fs_md = xvd.get_region(flag=XvcRegionFlags.FileSystemMetadata)
+        assert fs_md.id == 0x20
+        chunk = fs_md.read(0x100, 0x10)
+        assert isinstance(chunk, memoryview)
+        assert chunk == bytes(range(16))
+        assert fs_md.read(0x17F0, 0x100) == bytes(range(0xF0, 0x100))
+        streamed = b''.join(bytes(c) for c in fs_md.stream(chunk_size=0x700))
+        assert streamed == bytes(range(256)) * 0x18
+        del chunk, parsed, fs_md
@@ -0,0 +1,72 @@
+import hashlib
+import pytest
+
+from durango.fileformat.xvd import XvdFile, PAGE_SIZE, HASH_ENTRY_LENGTH, \
+    HASH_ENTRIES_IN_PAGE
+from durango.fileformat.xvd_hashtree import XvdHashTreeVerifier
+
+DATA_PAGES = 200
+
+
+def build_hash_level(pages):
+    level = list()
+    for start in range(0, len(pages), HASH_ENTRIES_IN_PAGE):
+        entries = b''.join(hashlib.sha256(p).digest()[:HASH_ENTRY_LENGTH]
+                           for p in pages[start:start + HASH_ENTRIES_IN_PAGE])
+        level.append(entries.ljust(PAGE_SIZE, b'\x00'))
+    return level
+
+
+@pytest.fixture
+def xvd_data():
+    data_pages = [bytes([i % 256]) * PAGE_SIZE for i in range(DATA_PAGES)]
+    levels = [build_hash_level(data_pages)]
+    while len(levels[-1]) > 1:
+        levels.append(build_hash_level(levels[-1]))
+    return data_pages, levels
+
+
+def write_xvd(path, header_builder, data_pages, levels):
+    root_hash = hashlib.sha256(levels[-1][0]).digest()
+    # EncryptionDisabled, integrity enabled
+    header = header_builder(volume_flags=0x2, drive_size=DATA_PAGES * PAGE_SIZE,
+                            root_hash=root_hash)
+    tree = b''.join(b''.join(level) for level in reversed(levels))
+    path.write_bytes(header.ljust(0x3000, b'\x00') + tree + b''.join(data_pages))
+    return str(path)
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_verify_valid(tmp_path, xvd_header_builder, xvd_data, use_mmap):
+    data_pages, levels = xvd_data
+    assert [len(level) for level in levels] == [2, 1]
+    filepath = write_xvd(tmp_path / 'valid.xvd', xvd_header_builder, data_pages, levels)
+
+    with XvdFile(filepath, use_mmap=use_mmap) as xvd:
+        assert xvd.hash_tree_page_count == 3
+        result = XvdHashTreeVerifier(xvd, jobs=2).verify()
+    assert result.is_valid, str(result)
+
+
+def test_verify_corrupt_data(tmp_path, xvd_header_builder, xvd_data):
+    data_pages, levels = xvd_data
+    data_pages[180] = b'\xFF' * PAGE_SIZE
+    data_pages[190] = b'\xFF' * PAGE_SIZE
+    filepath = write_xvd(tmp_path / 'corrupt.xvd', xvd_header_builder, data_pages, levels)
+
+    result = XvdHashTreeVerifier(XvdFile(filepath)).verify()
+    assert not result.is_valid
+    assert result.first_mismatch == [180, None, None]
+    assert result.root_hash_valid
+
+
+def test_verify_corrupt_hash_level(tmp_path, xvd_header_builder, xvd_data):
+    data_pages, levels = xvd_data
+    top_hash_page = levels[-1][0]
+    levels[0][1] = b'\x01' * PAGE_SIZE
+    levels[-1][0] = top_hash_page
+    filepath = write_xvd(tmp_path / 'corrupt.xvd', xvd_header_builder, data_pages, levels)
+
+    result = XvdHashTreeVerifier(XvdFile(filepath)).verify()
+    assert result.first_mismatch == [170, 1, None]
+    assert result.root_hash_valid